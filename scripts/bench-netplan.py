@@ -0,0 +1,114 @@
+#!/usr/bin/python3
+
+# Compare the speed of looking up the config for network devices in
+# subiquitycore.netplan.Config with the version of netplan.py from another
+# git revision (by default, the one before the most recent change to it),
+# for a generated config with a mix of devices matched by name, by MAC
+# address and by glob.
+#
+# Run from the top of the tree, e.g.:
+#
+#   python3 scripts/bench-netplan.py --interfaces 200
+
+import argparse
+import importlib.util
+import subprocess
+import sys
+import tempfile
+import timeit
+import types
+
+import yaml
+
+from subiquitycore import netplan
+
+NETPLAN_PY = 'subiquitycore/netplan.py'
+
+
+def load_netplan_at(rev):
+    source = subprocess.run(
+        ['git', 'show', '{}:{}'.format(rev, NETPLAN_PY)],
+        check=True, stdout=subprocess.PIPE).stdout
+    with tempfile.NamedTemporaryFile(suffix='.py') as f:
+        f.write(source)
+        f.flush()
+        spec = importlib.util.spec_from_file_location('old_netplan', f.name)
+        mod = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(mod)
+    return mod
+
+
+def default_baseline():
+    rev = subprocess.run(
+        ['git', 'log', '-1', '--format=%H', '--', NETPLAN_PY],
+        check=True, stdout=subprocess.PIPE, text=True).stdout.strip()
+    return rev + '~1'
+
+
+def make_config(count):
+    ethernets = {}
+    links = []
+    for i in range(count):
+        hwaddr = '52:54:00:00:{:02x}:{:02x}'.format(i // 256, i % 256)
+        config = {
+            'dhcp4': True,
+            'addresses': ['10.{}.{}.1/24'.format(i // 256, i % 256)],
+            'nameservers': {'addresses': ['10.0.0.53'], 'search': ['lan']},
+            'routes': [{'to': 'default', 'via': '10.0.0.1'}],
+            }
+        if i % 3 == 0:
+            name = 'eth{}'.format(i)
+        elif i % 3 == 1:
+            name = 'enp{}s0'.format(i)
+            config['match'] = {'macaddress': hwaddr}
+        else:
+            name = 'ens{}f0'.format(i)
+            config['match'] = {'name': 'ens{}f*'.format(i)}
+        ethernets['dev{}'.format(i)] = config
+        links.append(types.SimpleNamespace(
+            name=name, hwaddr=hwaddr, driver='virtio_net', is_virtual=False))
+    text = yaml.dump({'network': {'version': 2, 'ethernets': ethernets}})
+    return text, links
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--interfaces', type=int, default=200)
+    parser.add_argument(
+        '--baseline', help='git revision to compare against')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--number', type=int, default=20)
+    opts = parser.parse_args()
+
+    baseline = opts.baseline or default_baseline()
+    text, links = make_config(opts.interfaces)
+
+    for name, mod in (baseline, load_netplan_at(baseline)), \
+            ('current', netplan):
+        config = mod.Config()
+        config.parse_netplan_config(text)
+        dev_configs = [config.config_for_device(link) for link in links]
+        if hasattr(config, 'device_config_matches'):
+            def matches(link, dev_config):
+                return config.device_config_matches(link, dev_config)
+        else:
+            def matches(link, dev_config):
+                return config.config_for_device(link) == dev_config
+
+        def new_links():
+            for link in links:
+                config.config_for_device(link)
+
+        def apply():
+            for link, dev_config in zip(links, dev_configs):
+                matches(link, dev_config)
+
+        for what, func in ('new_link', new_links), ('apply', apply):
+            t = min(timeit.repeat(
+                func, repeat=opts.repeat, number=opts.number)) / opts.number
+            print("{:>12} {:8}: {} interfaces in {:8.2f}ms".format(
+                name[:12], what, len(links), t * 1e3))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
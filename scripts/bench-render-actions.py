@@ -0,0 +1,55 @@
+#!/usr/bin/python3
+
+# Time FilesystemModel._render_actions on models of increasing size. Each
+# disk in the generated model gets three partitions, each of which is
+# formatted and mounted, so every disk contributes ten actions.
+#
+# Run from the top of the tree with PYTHONPATH set as in the Makefile, e.g.:
+#
+#   PYTHONPATH=.:./probert:./curtin python3 scripts/bench-render-actions.py
+
+import argparse
+import timeit
+
+from subiquity.models.filesystem import (
+    ActionRenderMode,
+    Bootloader,
+    )
+from subiquity.models.tests.test_filesystem import (
+    make_disk,
+    make_model,
+    make_partition,
+    )
+
+
+def make_big_model(n_actions):
+    model = make_model(Bootloader.NONE)
+    for i in range(max(1, n_actions // 10)):
+        disk = make_disk(model)
+        for j in range(3):
+            part = make_partition(model, disk, size=1 << 30)
+            fs = model.add_filesystem(part, 'ext4')
+            model.add_mount(fs, '/srv/disk{}/part{}'.format(i, j))
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        'sizes', nargs='*', type=int, default=[10, 100, 1000],
+        help='approximate number of actions in each model')
+    parser.add_argument('--repeat', type=int, default=5)
+    opts = parser.parse_args()
+
+    for size in opts.sizes:
+        model = make_big_model(size)
+        n = len(model._actions)
+        times = timeit.repeat(
+            lambda: model._render_actions(ActionRenderMode.ALL),
+            number=1, repeat=opts.repeat)
+        print("{:6} actions: best {:8.2f}ms, mean {:8.2f}ms".format(
+            n, min(times) * 1000, sum(times) / len(times) * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/python3
+
+# Compare the speed of subiquity.common.serialize.Serializer with the
+# version of serialize.py from another git revision (by default, the one
+# before the most recent change to it) on storage API responses built from
+# the machine configs in examples/.
+#
+# Run from the top of the tree, e.g.:
+#
+#   python3 scripts/bench-serializer.py examples/*.json
+
+import argparse
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import timeit
+
+from subiquity.common.serialize import Serializer
+from subiquity.common.types import (
+    Disk,
+    Gap,
+    GapUsable,
+    Partition,
+    ProbeStatus,
+    StorageResponse,
+    StorageResponseV2,
+    )
+
+SERIALIZE_PY = 'subiquity/common/serialize.py'
+
+
+def load_serializer_at(rev):
+    source = subprocess.run(
+        ['git', 'show', '{}:{}'.format(rev, SERIALIZE_PY)],
+        check=True, stdout=subprocess.PIPE).stdout
+    with tempfile.NamedTemporaryFile(suffix='.py') as f:
+        f.write(source)
+        f.flush()
+        spec = importlib.util.spec_from_file_location('old_serialize', f.name)
+        mod = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(mod)
+    return mod.Serializer
+
+
+def default_baseline():
+    rev = subprocess.run(
+        ['git', 'log', '-1', '--format=%H', '--', SERIALIZE_PY],
+        check=True, stdout=subprocess.PIPE, text=True).stdout.strip()
+    return rev + '~1'
+
+
+def responses_for(path):
+    with open(path) as fp:
+        storage = json.load(fp)['storage']
+    blockdev = storage.get('blockdev', {})
+    v1 = StorageResponse(
+        status=ProbeStatus.DONE,
+        blockdev=blockdev,
+        dasd=storage.get('dasd', {}),
+        orig_config=[],
+        config=[])
+    disks = []
+    for devname, data in blockdev.items():
+        if data.get('DEVTYPE') != 'disk':
+            continue
+        size = int(data.get('attrs', {}).get('size', 0))
+        partitions = []
+        for i, (pname, pdata) in enumerate(sorted(blockdev.items())):
+            if pdata.get('ID_PART_ENTRY_DISK') is None or \
+               not pname.startswith(devname):
+                continue
+            partitions.append(Partition(
+                size=int(pdata['attrs']['size']), number=i + 1,
+                preserve=True, path=pname, annotations=['existing']))
+        partitions.append(Gap(offset=1 << 20, size=size, usable=GapUsable.YES))
+        disks.append(Disk(
+            id=devname, label=devname, type='local disk', size=size,
+            usage_labels=[], partitions=partitions, ok_for_guided=True,
+            ptable='gpt', preserve=False, path=devname, boot_device=False))
+    v2 = StorageResponseV2(status=ProbeStatus.DONE, disks=disks)
+    return [(StorageResponse, v1), (StorageResponseV2, v2)]
+
+
+def bench(serializer, annotation, value, repeat, number):
+    serialized = serializer.serialize(annotation, value)
+    ser = min(timeit.repeat(
+        lambda: serializer.serialize(annotation, value),
+        repeat=repeat, number=number)) / number
+    de = min(timeit.repeat(
+        lambda: serializer.deserialize(
+            annotation, json.loads(json.dumps(serialized))),
+        repeat=repeat, number=number)) / number
+    return ser, de
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('machine_configs', nargs='+')
+    parser.add_argument(
+        '--baseline', help='git revision to compare against')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--number', type=int, default=200)
+    opts = parser.parse_args()
+
+    baseline = opts.baseline or default_baseline()
+    implementations = [
+        (baseline, load_serializer_at(baseline)()),
+        ('current', Serializer()),
+        ]
+
+    for path in opts.machine_configs:
+        for annotation, value in responses_for(path):
+            for name, serializer in implementations:
+                ser, de = bench(
+                    serializer, annotation, value, opts.repeat, opts.number)
+                print("{:30} {:18} {:>12}: serialize {:8.1f}us "
+                      "deserialize {:8.1f}us".format(
+                          os.path.basename(path), annotation.__name__,
+                          name[:12], ser * 1e6, de * 1e6))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
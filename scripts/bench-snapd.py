@@ -0,0 +1,107 @@
+#!/usr/bin/python3
+
+# Compare making requests to snapd with a new session per request (as
+# SnapdConnection used to) with the keep-alive session it uses now.
+#
+# The "snapd" here is a small aiohttp server on a unix socket that answers
+# from the canned responses FakeSnapdConnection uses in dry-run mode, so
+# this runs anywhere. Run from the top of the tree, e.g.:
+#
+#   PYTHONPATH=. python3 scripts/bench-snapd.py --requests 500
+
+import argparse
+import asyncio
+import os
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+from aiohttp import web
+import requests_unixsocket
+
+from subiquitycore.snapd import (
+    AsyncSnapd,
+    get_fake_connection,
+    SnapdConnection,
+    )
+
+
+PATHS = [
+    ('v2/find', {'section': 'server'}),
+    ('v2/find', {'name': 'docker'}),
+    ('v2/snaps/subiquity', {}),
+    ]
+
+
+class SessionPerRequestConnection(SnapdConnection):
+
+    def get(self, path, **args):
+        if args:
+            path += '?' + urlencode(args)
+        with requests_unixsocket.Session() as session:
+            return session.get(self.url_base + path, timeout=60)
+
+
+def serve_fake_snapd(socket_path, started):
+    fake = get_fake_connection(scale_factor=1e9)
+
+    async def handle(request):
+        response = fake.get(request.match_info['path'], **request.query)
+        return web.json_response(response.json())
+
+    async def run():
+        app = web.Application()
+        app.router.add_get('/{path:.*}', handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.UnixSite(runner, socket_path).start()
+        started.set()
+        await asyncio.Event().wait()
+
+    asyncio.run(run())
+
+
+async def bench(connection, n, concurrency):
+    snapd = AsyncSnapd(connection)
+    queue = list(range(n))
+
+    async def worker():
+        while queue:
+            path, args = PATHS[queue.pop() % len(PATHS)]
+            await snapd.get(path, **args)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=4)
+    opts = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tdir:
+        socket_path = os.path.join(tdir, 'snapd.socket')
+        started = threading.Event()
+        threading.Thread(
+            target=serve_fake_snapd, args=(socket_path, started),
+            daemon=True).start()
+        started.wait()
+
+        for name, cls in [
+                ('session per request', SessionPerRequestConnection),
+                ('kept-alive session', SnapdConnection),
+                ]:
+            connection = cls('/', socket_path)
+            elapsed = asyncio.run(
+                bench(connection, opts.requests, opts.concurrency))
+            connection.close()
+            print("{:20}: {:5} requests in {:6.3f}s, {:7.1f}us each".format(
+                name, opts.requests, elapsed,
+                elapsed / opts.requests * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -35,6 +35,7 @@ from subiquitycore.utils import orig_environ
 from subiquitycore.view import BaseView
 
 from subiquity.client.controller import Confirm
+from subiquity.client.eventstream import event_stream_listen
 from subiquity.client.keycodes import (
     NoOpKeycodesFilter,
     KeyCodesFilter,
@@ -50,7 +51,6 @@ from subiquity.common.types import (
     ErrorReportKind,
     ErrorReportRef,
     )
-from subiquity.journald import journald_listen
 from subiquity.server.server import POSTINSTALL_MODEL_NAMES
 from subiquity.ui.frame import SubiquityUI
 from subiquity.ui.views.error import ErrorReportStretchy
@@ -297,7 +297,8 @@ class SubiquityClient(TuiApplication):
                 p('\x08 \n')
 
         status = await spinning_wait("connecting", self._status_get())
-        journald_listen([status.echo_syslog_id], lambda e: print(e['MESSAGE']))
+        event_stream_listen(
+            self.event_session, ['echo'], lambda e: print(e['MESSAGE']))
         if status.state == ApplicationState.STARTING_UP:
             status = await spinning_wait(
                 "starting up", self._status_get(cur=status.state))
@@ -321,6 +322,8 @@ class SubiquityClient(TuiApplication):
 
         self.client = make_client_for_conn(API, conn, self.resp_hook,
                                            header_func=header_func)
+        self.event_session = aiohttp.ClientSession(
+            connector=conn, connector_owner=False)
         self.error_reporter.client = self.client
 
         status = await self.connect()
@@ -349,15 +352,13 @@ class SubiquityClient(TuiApplication):
                     self.load_controllers(controllers)
 
             await super().start()
-            # Progress uses systemd to collect and display the installation
-            # logs. Although some system don't have systemd, so we disable
-            # the progress page
+            # Some variants do not have the progress page.
             if hasattr(self.controllers, "Progress"):
-                journald_listen(
-                    [status.event_syslog_id],
+                event_stream_listen(
+                    self.event_session, ['event'],
                     self.controllers.Progress.event)
-                journald_listen(
-                    [status.log_syslog_id],
+                event_stream_listen(
+                    self.event_session, ['log'],
                     self.controllers.Progress.log_line)
             if not status.cloud_init_ok:
                 self.add_global_overlay(CloudInitFail(self))
@@ -376,8 +377,8 @@ class SubiquityClient(TuiApplication):
                 # for a non-interactive one we need to clear things up or the
                 # prompting for confirmation will be confusing.
                 os.system('stty sane')
-            journald_listen(
-                [status.event_syslog_id],
+            event_stream_listen(
+                self.event_session, ['event'],
                 self.subiquity_event_noninteractive,
                 seek=True)
             asyncio.create_task(
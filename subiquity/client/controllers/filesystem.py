@@ -17,6 +17,8 @@ import asyncio
 import logging
 from typing import Callable, Optional
 
+import aiohttp
+
 from subiquitycore.lsb_release import lsb_release
 from subiquitycore.view import BaseView
 
@@ -296,6 +298,23 @@ class FilesystemController(SubiquityTuiController, FilesystemManipulator):
     def cancel(self):
         self.app.prev_screen()
 
+    async def _send_model(self):
+        # Send just what changed if we can, the whole config if the model
+        # on the server has changed underneath us.
+        patch = self.model.make_patch()
+        if patch is not None:
+            try:
+                resp = await self.endpoint.patch.POST(patch)
+            except aiohttp.ClientError:
+                log.exception("sending storage patch failed")
+            else:
+                if resp.applied:
+                    await self.app.client.meta.mark_configured.POST(
+                        ['storage'])
+                    return
+            log.debug("storage patch not applied, sending whole config")
+        await self.endpoint.POST(self.model._render_actions())
+
     def finish(self):
         log.debug("FilesystemController.finish next_screen")
-        self.app.next_screen(self.endpoint.POST(self.model._render_actions()))
+        self.app.next_screen(self._send_model())
@@ -36,6 +36,7 @@ from subiquity.common.api.server import make_server_at_path
 from subiquity.common.apidef import LinkAction, NetEventAPI
 from subiquity.common.types import (
     ErrorReportKind,
+    LinkUpdate,
     WLANSupportInstallState,
     )
 
@@ -74,6 +75,10 @@ class NetworkController(SubiquityTuiController, NetworkAnswersMixin):
         if act == LinkAction.DEL:
             self.view.del_link(info)
 
+    async def update_links_POST(self, updates: List[LinkUpdate]) -> None:
+        for update in updates:
+            await self.update_link_POST(update.act, update.info)
+
     async def route_watch_POST(self, routes: List[int]) -> None:
         if self.view is not None:
             self.view.update_default_routes(routes)
@@ -0,0 +1,63 @@
+# Copyright 2023 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import json
+import logging
+
+import aiohttp
+
+log = logging.getLogger('subiquity.client.eventstream')
+
+
+async def _follow_events(session, types, callback, seek):
+    params = {'types': ','.join(types)}
+    if seek:
+        params['after'] = 'latest'
+    while True:
+        try:
+            # As in make_client_for_conn, the host in the URL is ignored.
+            async with session.get(
+                    'http://a/meta/events', params=params,
+                    timeout=aiohttp.ClientTimeout(total=None)) as resp:
+                resp.raise_for_status()
+                params['stream'] = resp.headers['x-event-stream']
+                async for line in resp.content:
+                    if not line.strip():
+                        # Sent by the server to check we are still here.
+                        continue
+                    event = json.loads(line)
+                    if 'seq' in event:
+                        params['after'] = str(event['seq'])
+                    callback(event)
+        except aiohttp.ClientError as exc:
+            log.debug("event stream disconnected: %r", exc)
+        await asyncio.sleep(1)
+
+
+def event_stream_listen(session, types, callback, seek=False):
+    """Call callback with each event of one of the given types that the
+    server sends to /meta/events.
+
+    This is the counterpart of journald_listen: events of type "event",
+    "echo" and "log" have the fields of the journal entries the server
+    writes for the syslog identifiers in ApplicationStatus. If seek is
+    true, only events that happen from now on are passed to callback.
+
+    Returns the task following the stream, which reconnects (resuming from
+    the last event seen) if the connection to the server is lost.
+    """
+    return asyncio.create_task(
+        _follow_events(session, types, callback, seek))
@@ -23,7 +23,12 @@ import sys
 
 import attr
 
-from subiquitycore.log import setup_logger
+from subiquitycore.log import (
+    LOG_BACKUP_COUNT,
+    LOG_MAX_BYTES,
+    rotated_log_files,
+    setup_logger,
+    )
 
 from .common import (
     LOGDIR,
@@ -110,6 +115,10 @@ def make_server_args_parser():
     parser.add_argument(
         '--postinst-hooks-dir', default='/etc/subiquity/postinst.d',
         type=pathlib.Path)
+    parser.add_argument(
+        '--apt-lists-cache', action='store', metavar='DIR',
+        help=("Cache the apt lists for the cdrom in DIR and reuse them "
+              "when installing from the same cdrom again."))
     return parser
 
 
@@ -125,6 +134,9 @@ def main():
     if opts.storage_version is None:
         opts.storage_version = int(opts.kernel_cmdline.get(
             'subiquity-storage-version', 1))
+    if opts.apt_lists_cache is None:
+        opts.apt_lists_cache = opts.kernel_cmdline.get(
+            'subiquity-apt-lists-cache')
     logdir = LOGDIR
     if opts.dry_run:
         if opts.dry_run_config:
@@ -155,7 +167,9 @@ def main():
     logging.getLogger('curtin').addHandler(handler)
     logging.getLogger('block-discover').addHandler(handler)
 
-    logfiles = setup_logger(dir=logdir, base='subiquity-server')
+    logfiles = setup_logger(
+        dir=logdir, base='subiquity-server', queued=True,
+        max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT)
 
     logger = logging.getLogger('subiquity')
     version = os.environ.get("SNAP_REVISION", "unknown")
@@ -171,6 +185,8 @@ def main():
             "InstallerServerLog", logfiles['debug'])
         server.note_file_for_apport(
             "InstallerServerLogInfo", logfiles['info'])
+        for i, path in enumerate(rotated_log_files(logfiles['debug']), 1):
+            server.note_file_for_apport(f"InstallerServerLog{i}", path)
         await server.run()
 
     asyncio.run(run_with_loop())
@@ -15,6 +15,7 @@
 
 import contextlib
 import inspect
+import json
 
 import aiohttp
 
@@ -92,12 +93,32 @@ def make_client(endpoint_cls, make_request, serializer=None, path_args=None):
     return make_client_cls(endpoint_cls, make_request, serializer)(path_args)
 
 
+class _CachedResponse:
+    """A 304 response that returns the content of a previous response."""
+
+    def __init__(self, response, text):
+        self._response = response
+        self._text = text
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    async def text(self):
+        return self._text
+
+    async def json(self):
+        return json.loads(self._text)
+
+
 def make_client_for_conn(
         endpoint_cls, conn, resp_hook=lambda r: r, serializer=None,
         header_func=None):
     session = aiohttp.ClientSession(
         connector=conn, connector_owner=False)
 
+    # For GET requests that returned an ETag: {(path, params): (etag, text)}
+    etag_cache = {}
+
     @contextlib.asynccontextmanager
     async def make_request(method, path, *, params, json):
         # session.request needs a full URL with scheme and host even though
@@ -110,9 +131,25 @@ def make_client_for_conn(
             headers = header_func()
         else:
             headers = None
+        cache_key = cached = None
+        if method == 'GET':
+            cache_key = (path, tuple(sorted(params.items())))
+            cached = etag_cache.get(cache_key)
+            if cached is not None:
+                headers = dict(headers or {})
+                headers['If-None-Match'] = cached[0]
         async with session.request(
                 method, url, json=json, params=params,
                 headers=headers, timeout=0) as response:
-            yield resp_hook(response)
+            response = resp_hook(response)
+            if cache_key is not None:
+                etag = response.headers.get('ETag')
+                if response.status == 304 and cached is not None:
+                    response = _CachedResponse(response, cached[1])
+                elif response.status == 200 and etag is not None:
+                    etag_cache[cache_key] = (etag, await response.text())
+                else:
+                    etag_cache.pop(cache_key, None)
+            yield response
 
     return make_client(endpoint_cls, make_request, serializer)
@@ -94,6 +94,20 @@ def path_parameter(cls):
     return cls
 
 
+def versioned(meth):
+    """Mark a GET method as supporting conditional requests.
+
+    The controller implementing the method must also have a method with
+    "_version" appended to the name that takes no arguments and returns
+    something that changes whenever the response would (or None if the
+    response should not be cached). Its repr() is used to make the ETag
+    for the response and a client that presents that ETag again in
+    If-None-Match gets a 304 response instead of the full result.
+    """
+    meth.__versioned__ = True
+    return meth
+
+
 def simple_endpoint(typ):
     class endpoint:
         def GET() -> typ: ...
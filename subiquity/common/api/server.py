@@ -13,9 +13,11 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import hashlib
 import inspect
 import os
 import traceback
+import uuid
 
 from aiohttp import web
 
@@ -57,8 +59,26 @@ def trim(text):
         return text
 
 
+# ETags include a value that is different every time the server starts so
+# that a client cannot mistake a response from a previous server process
+# for a current one just because the versions happen to be equal.
+_etag_prefix = uuid.uuid4().hex[:8]
+
+
+def make_etag(version):
+    digest = hashlib.sha1(repr(version).encode('utf-8')).hexdigest()
+    return '"{}-{}"'.format(_etag_prefix, digest[:16])
+
+
+def _etag_matches(request, etag):
+    for value in request.headers.getall('If-None-Match', ()):
+        if etag in [v.strip() for v in value.split(',')]:
+            return True
+    return False
+
+
 def _make_handler(controller, definition, implementation, serializer,
-                  serialize_query_args):
+                  serialize_query_args, version_impl=None):
     def_sig = inspect.signature(definition)
     def_ret_ann = def_sig.return_annotation
     def_params = def_sig.parameters
@@ -131,10 +151,25 @@ def _make_handler(controller, definition, implementation, serializer,
                     args['context'] = context
                 if 'request' in impl_params:
                     args['request'] = request
-                result = await implementation(**args)
-                resp = web.json_response(
-                    serializer.serialize(def_ret_ann, result),
-                    headers={'x-status': 'ok'})
+                etag = None
+                if version_impl is not None:
+                    # The version is checked before calling the
+                    # implementation so if it changes while the result is
+                    # computed, the next request will not match.
+                    version = version_impl()
+                    if version is not None:
+                        etag = make_etag(version)
+                if etag is not None and _etag_matches(request, etag):
+                    resp = web.Response(
+                        status=304,
+                        headers={'x-status': 'ok', 'ETag': etag})
+                else:
+                    result = await implementation(**args)
+                    resp = web.json_response(
+                        serializer.serialize(def_ret_ann, result),
+                        headers={'x-status': 'ok'})
+                    if etag is not None:
+                        resp.headers['ETag'] = etag
             except Exception as exc:
                 tb = traceback.TracebackException.from_exception(exc)
                 resp = web.Response(
@@ -173,12 +208,18 @@ def bind(router, endpoint, controller, serializer=None, _depth=None):
             if not hasattr(controller, impl_name):
                 raise MissingImplementationError(controller, impl_name)
             impl = getattr(controller, impl_name)
+            version_impl = None
+            if getattr(v, '__versioned__', False):
+                version_name = impl_name + '_version'
+                if not hasattr(controller, version_name):
+                    raise MissingImplementationError(controller, version_name)
+                version_impl = getattr(controller, version_name)
             router.add_route(
                 method=method,
                 path=endpoint.fullpath,
                 handler=_make_handler(
                     controller, v, impl, serializer,
-                    endpoint.serialize_query_args))
+                    endpoint.serialize_query_args, version_impl))
 
 
 async def make_server_at_path(socket_path, endpoint, controller, **kw):
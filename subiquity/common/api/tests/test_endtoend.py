@@ -16,18 +16,22 @@
 import attr
 import contextlib
 import functools
+import os
+import tempfile
 import unittest
 
 import aiohttp
 from aiohttp import web
 
-from subiquity.common.api.client import make_client
+from subiquity.common.api.client import make_client, make_client_for_conn
 from subiquity.common.api.defs import (
     api,
     MultiplePathParameters,
     path_parameter,
     Payload,
+    versioned,
     )
+from subiquity.common.api.server import make_server_at_path
 
 from .test_server import (
     makeTestClient,
@@ -271,3 +275,50 @@ class TestEndToEnd(unittest.IsolatedAsyncioTestCase):
             self.assertEqual(r, 3)
             with self.assertRaises(Abort):
                 await client.bad.GET(2)
+
+    async def test_conditional_get(self):
+        @attr.s(auto_attribs=True)
+        class Data:
+            arg: int
+            version: int
+
+        @api
+        class API:
+            @versioned
+            def GET(arg: int) -> Data: ...
+
+        class Impl(ControllerBase):
+            version = 1
+            calls = 0
+
+            async def GET(self, arg: int) -> Data:
+                self.calls += 1
+                return Data(arg, self.version)
+
+            def GET_version(self):
+                return self.version
+
+        impl = Impl()
+        statuses = []
+
+        def resp_hook(resp):
+            statuses.append(resp.status)
+            return resp
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            socket_path = os.path.join(tmpdir, 'socket')
+            site = await make_server_at_path(socket_path, API, impl)
+            conn = aiohttp.UnixConnector(socket_path)
+            try:
+                client = make_client_for_conn(API, conn, resp_hook)
+                self.assertEqual(await client.GET(1), Data(1, 1))
+                self.assertEqual(await client.GET(1), Data(1, 1))
+                self.assertEqual(await client.GET(2), Data(2, 1))
+                impl.version = 2
+                self.assertEqual(await client.GET(1), Data(1, 2))
+            finally:
+                await conn.close()
+                await site.stop()
+
+        self.assertEqual(statuses, [200, 304, 200, 200])
+        self.assertEqual(impl.calls, 3)
@@ -21,7 +21,12 @@ from aiohttp import web
 
 from subiquitycore.context import Context
 
-from subiquity.common.api.defs import api, path_parameter, Payload
+from subiquity.common.api.defs import (
+    api,
+    path_parameter,
+    Payload,
+    versioned,
+    )
 from subiquity.common.api.server import (
     bind,
     controller_for_request,
@@ -279,3 +284,70 @@ class TestBind(unittest.IsolatedAsyncioTestCase):
         async with makeTestClient(API, Impl()) as client:
             await self.assertResponse(
                 client.get('/value?arg=2'), 'value2')
+
+    async def test_versioned(self):
+        @api
+        class API:
+            @versioned
+            def GET() -> str: ...
+
+        class Impl(ControllerBase):
+            version = 1
+            calls = 0
+
+            async def GET(self) -> str:
+                self.calls += 1
+                return 'value'
+
+            def GET_version(self):
+                return self.version
+
+        impl = Impl()
+
+        async with makeTestClient(API, impl) as client:
+            resp = await client.get('/')
+            self.assertEqual(resp.status, 200)
+            etag = resp.headers['ETag']
+            resp = await client.get('/', headers={'If-None-Match': etag})
+            self.assertEqual(resp.status, 304)
+            self.assertEqual(resp.headers['ETag'], etag)
+            self.assertEqual(impl.calls, 1)
+            impl.version = 2
+            resp = await client.get('/', headers={'If-None-Match': etag})
+            self.assertEqual(resp.status, 200)
+            self.assertNotEqual(resp.headers['ETag'], etag)
+            self.assertEqual(await resp.json(), 'value')
+            self.assertEqual(impl.calls, 2)
+
+    async def test_versioned_none(self):
+        @api
+        class API:
+            @versioned
+            def GET() -> str: ...
+
+        class Impl(ControllerBase):
+            async def GET(self) -> str:
+                return 'value'
+
+            def GET_version(self):
+                return None
+
+        async with makeTestClient(API, Impl()) as client:
+            resp = await client.get('/')
+            self.assertEqual(resp.status, 200)
+            self.assertNotIn('ETag', resp.headers)
+
+    def test_missing_version_method(self):
+        @api
+        class API:
+            @versioned
+            def GET() -> str: ...
+
+        class Impl(ControllerBase):
+            async def GET(self) -> str:
+                return 'value'
+
+        app = web.Application()
+        with self.assertRaises(MissingImplementationError) as cm:
+            bind(app.router, API, Impl())
+        self.assertEqual(cm.exception.methname, "GET_version")
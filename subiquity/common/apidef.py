@@ -13,7 +13,6 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import enum
 from typing import List, Optional
 
 from subiquitycore.models.network import (
@@ -23,7 +22,12 @@ from subiquitycore.models.network import (
     WLANConfig,
     )
 
-from subiquity.common.api.defs import api, Payload, simple_endpoint
+from subiquity.common.api.defs import (
+    api,
+    Payload,
+    simple_endpoint,
+    versioned,
+    )
 from subiquity.common.types import (
     AddPartitionV2,
     AnyStep,
@@ -40,6 +44,11 @@ from subiquity.common.types import (
     KeyboardSetting,
     KeyboardSetup,
     IdentityData,
+    InstallTimings,
+    JournalSenderStats,
+    LinkAction,
+    LinkUpdate,
+    NetEventSubscriberStats,
     NetworkStatus,
     ModifyPartitionV2,
     ReformatDisk,
@@ -55,6 +64,8 @@ from subiquity.common.types import (
     SSHData,
     SSHFetchIdResponse,
     LiveSessionSSHInfo,
+    StoragePatch,
+    StoragePatchResponse,
     StorageResponse,
     StorageResponseV2,
     TimeZoneInfo,
@@ -88,6 +99,11 @@ class API:
               -> ApplicationStatus:
                 """Get the installer state."""
 
+        # GET /meta/events streams state changes, context events and
+        # command output as JSON lines. It is not described here because
+        # the response is not a single value: see
+        # subiquity/server/eventstream.py and subiquity/client/eventstream.py.
+
         class mark_configured:
             def POST(endpoint_names: List[str]) -> None:
                 """Mark the controllers for endpoint_names as configured."""
@@ -111,6 +127,15 @@ class API:
         class ssh_info:
             def GET() -> Optional[LiveSessionSSHInfo]: ...
 
+        class journal:
+            def GET() -> JournalSenderStats:
+                """Get how sending events to the journal is going."""
+
+        class timings:
+            def GET() -> Optional[InstallTimings]:
+                """Get how long each part of the install has taken so far,
+                or None if the install has not started."""
+
         class free_only:
             def GET() -> bool: ...
 
@@ -144,6 +169,7 @@ class API:
             def GET(change_id: str) -> Change: ...
 
     class keyboard:
+        @versioned
         def GET() -> KeyboardSetup: ...
         def POST(data: Payload[KeyboardSetting]): ...
 
@@ -180,6 +206,7 @@ class API:
 
             The socket must serve the NetEventAPI below.
             """
+            def GET() -> List[NetEventSubscriberStats]: ...
             def PUT(socket_path: str) -> None: ...
             def DELETE(socket_path: str) -> None: ...
 
@@ -253,11 +280,21 @@ class API:
                     -> StorageResponse:
                 pass
 
+        @versioned
         def GET(wait: bool = False, use_cached_result: bool = False) \
             -> StorageResponse: ...
 
         def POST(config: Payload[list]): ...
 
+        class patch:
+            def POST(data: Payload[StoragePatch]) -> StoragePatchResponse:
+                """Apply changes to the config from GET.
+
+                Unlike POST this does not mark storage as configured.
+                If the model has changed since the revision the patch was
+                made against, nothing is changed and applied is false.
+                """
+
         class reset:
             def POST() -> StorageResponse: ...
 
@@ -269,6 +306,7 @@ class API:
             def GET() -> List[Disk]: ...
 
         class v2:
+            @versioned
             def GET(wait: bool = False) -> StorageResponseV2: ...
             def POST() -> StorageResponseV2: ...
 
@@ -327,6 +365,7 @@ class API:
         def POST(data: Payload[DriversPayload]) -> None: ...
 
     class snaplist:
+        @versioned
         def GET(wait: bool = False) -> SnapListResponse: ...
         def POST(data: Payload[List[SnapSelection]]): ...
 
@@ -387,12 +426,6 @@ class API:
         def GET() -> CasperMd5Results: ...
 
 
-class LinkAction(enum.Enum):
-    NEW = enum.auto()
-    CHANGE = enum.auto()
-    DEL = enum.auto()
-
-
 @api
 class NetEventAPI:
     class wlan_support_install_finished:
@@ -401,6 +434,12 @@ class NetEventAPI:
     class update_link:
         def POST(act: LinkAction, info: Payload[NetDevInfo]) -> None: ...
 
+    class update_links:
+        def POST(updates: Payload[List[LinkUpdate]]) -> None:
+            """Apply several updates, in order.
+
+            At most one update is sent for each device in a request."""
+
     class route_watch:
         def POST(routes: List[int]) -> None: ...
 
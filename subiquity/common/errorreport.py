@@ -14,6 +14,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import asyncio
+import collections
 import fcntl
 import json
 import logging
@@ -48,6 +49,99 @@ from subiquity.common.types import (
 
 log = logging.getLogger('subiquity.common.errorreport')
 
+# Files noted for apport that are larger than this only have their end
+# attached, and the files attached to one report are limited to
+# MAX_ATTACHED_BYTES in total, so that a huge log cannot exhaust the memory
+# of the live session when a report is generated.
+MAX_ATTACHED_FILE_BYTES = 10 << 20
+MAX_ATTACHED_BYTES = 50 << 20
+
+
+def read_tail(path, max_bytes):
+    """Return the last max_bytes or less of the file at path and its size.
+
+    If the file is longer than that, what is returned starts after the
+    first newline in the last max_bytes (if there is one), so it does not
+    start in the middle of a line.
+    """
+    with open(path, 'rb') as fp:
+        size = os.fstat(fp.fileno()).st_size
+        start = max(size - max_bytes, 0)
+        fp.seek(start)
+        data = fp.read(max_bytes)
+    if start > 0:
+        nl = data.find(b'\n')
+        if nl != -1:
+            data = data[nl + 1:]
+    return data, size
+
+
+def attach_file_tail(pr, path, key, max_bytes):
+    """Attach the file at path to pr as key, or its end if it is large.
+
+    Returns the number of bytes of the file that were attached."""
+    if not os.path.exists(path):
+        return 0
+    try:
+        data, size = read_tail(path, max_bytes)
+    except OSError as e:
+        pr[key] = 'Error: ' + str(e)
+        return 0
+    attached = len(data)
+    if attached < size:
+        log.debug(
+            "attaching last %s bytes of %s (%s bytes)", attached, path, size)
+        if b'\0' in data:
+            # The end of a binary file (a tar file, say) is no use.
+            pr[key] = f'[{size} bytes, too large to attach]'
+            return 0
+        data = f'[first {size - attached} bytes skipped]\n'.encode() + data
+    pr[key] = data.strip()
+    return attached
+
+
+def attach_files(pr, files, budget=MAX_ATTACHED_BYTES):
+    """Attach the (key, path) pairs in files to pr with attach_file_tail,
+    until budget bytes have been attached.
+
+    The files left over are listed under SkippedAttachments. Returns the
+    number of bytes attached."""
+    attached = 0
+    skipped = []
+    for key, path in files:
+        if attached >= budget:
+            if os.path.exists(path):
+                skipped.append(f'{key}: {path}')
+            continue
+        attached += attach_file_tail(
+            pr, path, key,
+            min(MAX_ATTACHED_FILE_BYTES, budget - attached))
+    if skipped:
+        log.debug("not attaching %s, over the size limit", skipped)
+        pr['SkippedAttachments'] = '\n'.join(skipped)
+    return attached
+
+
+def log_tail(text, max_len):
+    """Return the last lines of text, each stripped, that together are no
+    longer than max_len characters."""
+    if isinstance(text, bytes):
+        text = text.decode('utf-8', 'replace')
+    lines = collections.deque()
+    total = 0
+    end = len(text)
+    while end > 0 and text[end - 1] == '\n':
+        end -= 1
+    while end > 0:
+        start = text.rfind('\n', 0, end) + 1
+        line = text[start:end].strip()
+        if total + len(line) > max_len:
+            break
+        lines.appendleft(line)
+        total += len(line)
+        end = start - 1
+    return "\n".join(lines)
+
 
 @attr.s(eq=False)
 class Upload(metaclass=urwid.MetaSignals):
@@ -221,12 +315,8 @@ class ErrorReport(metaclass=urwid.MetaSignals):
                 else:
                     log.debug("dropping %s of length %s", k, len(v))
             if "CurtinLog" in self.pr:
-                logtail = []
-                for line in self.pr["CurtinLog"].splitlines():
-                    logtail.append(line.strip())
-                    while sum(map(len, logtail)) > 2048:
-                        logtail.pop(0)
-                for_upload["CurtinLogTail"] = "\n".join(logtail)
+                for_upload["CurtinLogTail"] = log_tail(
+                    self.pr["CurtinLog"], 2048)
             data = bson.BSON().encode(for_upload)
             self.uploader._bg_update(0, len(data))
             headers = {
@@ -412,8 +502,9 @@ class ErrorReporter(object):
         def _bg_attach_hook():
             # Attach any stuff other parts of the code think we should know
             # about.
-            for key, path in apport_files:
-                apport.hookutils.attach_file_if_exists(report.pr, path, key)
+            attached = attach_files(report.pr, apport_files)
+            log.debug(
+                "attached %s bytes of files to %s", attached, report.base)
             for key, value in apport_data:
                 report.pr[key] = value
             for key, value in kw.items():
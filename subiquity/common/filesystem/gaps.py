@@ -83,8 +83,25 @@ class Gap:
         return None
 
 
-@functools.singledispatch
 def parts_and_gaps(device):
+    """Return the partitions and gaps on device, in order.
+
+    Computing this is a bit involved and it gets called a lot, so results
+    are cached on the model the device belongs to until it changes.
+    """
+    m = device._m
+    key = (m.generation, m.storage_version)
+    cached = m._gaps_cache
+    if cached is None or cached[0] != key:
+        cached = m._gaps_cache = (key, {})
+    by_device = cached[1]
+    if device not in by_device:
+        by_device[device] = _parts_and_gaps(device)
+    return list(by_device[device])
+
+
+@functools.singledispatch
+def _parts_and_gaps(device):
     raise NotImplementedError(device)
 
 
@@ -179,8 +196,8 @@ def find_disk_gaps_v2(device, info=None):
     return result
 
 
-@parts_and_gaps.register(Disk)
-@parts_and_gaps.register(Raid)
+@_parts_and_gaps.register(Disk)
+@_parts_and_gaps.register(Raid)
 def parts_and_gaps_disk(device):
     if device._fs is not None:
         return []
@@ -190,7 +207,7 @@ def parts_and_gaps_disk(device):
         return find_disk_gaps_v2(device)
 
 
-@parts_and_gaps.register(LVM_VolGroup)
+@_parts_and_gaps.register(LVM_VolGroup)
 def _parts_and_gaps_vg(device):
     used = 0
     r = []
@@ -0,0 +1,181 @@
+# Copyright 2023 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import attr
+
+from subiquity.common.filesystem import boot, gaps, labels, sizes
+from subiquity.common.types import (
+    GuidedStorageTargetReformat,
+    GuidedStorageTargetResize,
+    GuidedStorageTargetUseGap,
+    )
+from subiquity.models.filesystem import (
+    Disk,
+    Raid,
+    )
+
+
+def guided_devices(model):
+    """Return the devices that guided storage could target."""
+    return model._all(type='raid') + model._all(type='disk')
+
+
+def can_be_guided_target(device, *, with_reformatting=False):
+    """Can guided storage install to `device`?
+
+    A disk that is part of a RAID that can be booted from is left out, the
+    RAID should be used instead.
+    """
+    if not boot.can_be_boot_device(
+            device, with_reformatting=with_reformatting):
+        return False
+    if isinstance(device, Disk):
+        cd = device.constructed_device()
+        if isinstance(cd, Raid):
+            for v in cd._subvolumes:
+                if boot.can_be_boot_device(
+                        v, with_reformatting=with_reformatting):
+                    return False
+    return True
+
+
+def _device_scenarios(device, install_min):
+    # Returns (reformat, use_gap, resizes), where each scenario is a
+    # (size, target) pair.
+    reformat = use_gap = None
+    resizes = []
+
+    if can_be_guided_target(device, with_reformatting=True) \
+       and device.size >= install_min:
+        reformat = (
+            device.size, GuidedStorageTargetReformat(disk_id=device.id))
+
+    partitions = device.partitions()
+    # On an empty disk, don't bother to offer it with UseGap, as it's
+    # basically the same as the Reformat case.
+    if partitions and can_be_guided_target(device, with_reformatting=False):
+        gap = gaps.largest_gap(device)
+        if gap is not None and gap.size >= install_min:
+            use_gap = (
+                gap.size,
+                GuidedStorageTargetUseGap(
+                    disk_id=device.id, gap=labels.for_client(gap)))
+
+    part_align = device.alignment_data().part_align
+    for partition in partitions:
+        vals = sizes.calculate_guided_resize(
+                partition.estimated_min_size, partition.size,
+                install_min, part_align=part_align)
+        if vals is None:
+            continue
+        if not boot.can_be_boot_device(
+                device, resize_partition=partition, with_reformatting=False):
+            continue
+        resizes.append((
+            vals.install_max,
+            GuidedStorageTargetResize.from_recommendations(partition, vals)))
+
+    return reformat, use_gap, resizes
+
+
+def _obj_state(obj):
+    state = []
+    for field in attr.fields(type(obj)):
+        if field.name == '_m':
+            continue
+        v = getattr(obj, field.name)
+        if isinstance(v, list):
+            v = tuple(v)
+        elif isinstance(v, set):
+            v = frozenset(v)
+        state.append(v)
+    return state
+
+
+def _boot_state(device):
+    # Everything about device that boot.can_be_boot_device looks at.
+    state = [_obj_state(device)]
+    for p in device.partitions():
+        state.append(_obj_state(p))
+        state.append(p.estimated_min_size)
+    container = getattr(device, 'container', None)
+    if container is not None:
+        state.append(_obj_state(container))
+    return state
+
+
+def _device_state(device):
+    # Everything about the model that the scenarios for device depend on,
+    # apart from the things that are the same for every device (see
+    # guided_scenarios).
+    state = _boot_state(device)
+    cd = device._constructed_device
+    while cd is not None:
+        state.append(_obj_state(cd))
+        if isinstance(cd, Raid):
+            for v in cd._subvolumes:
+                state.append(_boot_state(v))
+            break
+        cd = getattr(cd, '_constructed_device', None)
+    return state
+
+
+class _Scenarios:
+
+    def __init__(self, key):
+        self.key = key
+        self.generation = None
+        # Maps a device to (state, scenarios) where state is the
+        # _device_state the scenarios were computed from.
+        self.by_device = {}
+        self.possible = []
+
+    def update(self, model, install_min):
+        generation = model.generation
+        by_device = {}
+        for device in guided_devices(model):
+            state = _device_state(device)
+            cached = self.by_device.get(device)
+            if cached is None or cached[0] != state:
+                cached = (state, _device_scenarios(device, install_min))
+            by_device[device] = cached
+        self.by_device = by_device
+
+        results = [scenarios for state, scenarios in by_device.values()]
+        possible = [r[0] for r in results if r[0] is not None]
+        possible.extend(r[1] for r in results if r[1] is not None)
+        for r in results:
+            possible.extend(r[2])
+        possible.sort(reverse=True, key=lambda x: x[0])
+        self.possible = [target for size, target in possible]
+        self.generation = generation
+
+
+def guided_scenarios(model, install_min):
+    """Return the possible guided storage targets for model.
+
+    The targets are sorted by the size of the space potentially available
+    to the install. Working them out means making boot plans and resize
+    recommendations for each device, so the targets are cached until the
+    model changes, and then only recomputed for the devices that have
+    changed.
+    """
+    key = (model.bootloader, model.storage_version, install_min)
+    cached = model._scenarios_cache
+    if cached is None or cached.key != key:
+        cached = model._scenarios_cache = _Scenarios(key)
+    if cached.generation != model.generation:
+        cached.update(model, install_min)
+    return list(cached.possible)
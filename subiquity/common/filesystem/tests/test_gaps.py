@@ -14,8 +14,10 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from functools import partial
+import gc
 import unittest
 from unittest import mock
+import weakref
 
 from parameterized import parameterized
 
@@ -63,6 +65,55 @@ class TestGaps(unittest.TestCase):
         self.assertEqual(MiB, gap.offset)
 
 
+class TestPartsAndGapsCache(unittest.TestCase):
+    def test_cached(self):
+        m, d = make_model_and_disk()
+        with mock.patch.object(
+                gaps, '_parts_and_gaps',
+                wraps=gaps._parts_and_gaps) as p:
+            first = gaps.parts_and_gaps(d)
+            second = gaps.parts_and_gaps(d)
+        self.assertEqual(first, second)
+        p.assert_called_once_with(d)
+
+    def test_invalidated_by_new_partition(self):
+        m, d = make_model_and_disk()
+        [orig_gap] = gaps.parts_and_gaps(d)
+        p = make_partition(m, d, size=orig_gap.size//2)
+        [p1, gap] = gaps.parts_and_gaps(d)
+        self.assertIs(p1, p)
+        self.assertEqual(gap.size, orig_gap.size - p.size)
+
+    def test_invalidated_by_resize(self):
+        m, d = make_model_and_disk()
+        p = make_partition(m, d, size=MiB*100)
+        [_, orig_gap] = gaps.parts_and_gaps(d)
+        p.size += MiB*100
+        [_, gap] = gaps.parts_and_gaps(d)
+        self.assertEqual(gap.size, orig_gap.size - MiB*100)
+
+    def test_invalidated_by_storage_version(self):
+        m, d = make_model_and_disk(size=100 << 20)
+        make_partition(m, d, offset=0, size=20 << 20)
+        make_partition(m, d, offset=40 << 20, size=20 << 20)
+        self.assertEqual(3, len(gaps.parts_and_gaps(d)))
+        m.storage_version = 2
+        self.assertEqual(4, len(gaps.parts_and_gaps(d)))
+
+    def test_result_is_a_copy(self):
+        d = make_disk()
+        gaps.parts_and_gaps(d).clear()
+        self.assertEqual(1, len(gaps.parts_and_gaps(d)))
+
+    def test_model_can_be_collected(self):
+        m, d = make_model_and_disk()
+        gaps.parts_and_gaps(d)
+        ref = weakref.ref(m)
+        del m, d
+        gc.collect()
+        self.assertIsNone(ref())
+
+
 class TestSplitGap(GapTestCase):
     def test_equal(self):
         [gap] = gaps.parts_and_gaps(make_disk())
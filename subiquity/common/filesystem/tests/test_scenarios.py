@@ -0,0 +1,121 @@
+# Copyright 2023 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import gc
+import unittest
+from unittest import mock
+import weakref
+
+from subiquity.common.filesystem import scenarios
+from subiquity.common.types import (
+    Bootloader,
+    GuidedStorageTargetReformat,
+    GuidedStorageTargetResize,
+    GuidedStorageTargetUseGap,
+    )
+from subiquity.models.tests.test_filesystem import (
+    make_disk,
+    make_model,
+    make_partition,
+    )
+
+
+class TestGuidedScenarios(unittest.TestCase):
+
+    def setUp(self):
+        self.model = make_model(Bootloader.UEFI, storage_version=2)
+        self.model._probe_data = {'blockdev': {}, 'filesystem': {}}
+        self.install_min = 10 << 30
+
+    def make_used_disk(self, size):
+        disk = make_disk(self.model, size=size)
+        p = make_partition(
+            self.model, disk, preserve=True, size=size // 2)
+        self.model._probe_data['filesystem'][p._path()] = {
+            'ESTIMATED_MIN_SIZE': 1 << 20,
+            }
+        return disk
+
+    def get(self):
+        return scenarios.guided_scenarios(self.model, self.install_min)
+
+    def computed(self, m):
+        return [c.args[0] for c in m.call_args_list]
+
+    def test_sorted_by_size(self):
+        small = make_disk(self.model, size=20 << 30)
+        big = self.make_used_disk(100 << 30)
+        possible = self.get()
+        self.assertEqual(
+            [type(t) for t in possible], [
+                GuidedStorageTargetReformat,
+                GuidedStorageTargetUseGap,
+                GuidedStorageTargetResize,
+                GuidedStorageTargetReformat,
+            ])
+        self.assertEqual(
+            [t.disk_id for t in possible],
+            [big.id, big.id, big.id, small.id])
+
+    def test_cached_until_model_changes(self):
+        self.make_used_disk(100 << 30)
+        with mock.patch.object(
+                scenarios, '_device_scenarios',
+                wraps=scenarios._device_scenarios) as m:
+            first = self.get()
+            self.assertEqual(len(m.call_args_list), 1)
+            self.assertEqual(first, self.get())
+            self.assertEqual(len(m.call_args_list), 1)
+
+    def test_only_changed_device_recomputed(self):
+        disk1 = self.make_used_disk(100 << 30)
+        disk2 = self.make_used_disk(100 << 30)
+        self.get()
+        with mock.patch.object(
+                scenarios, '_device_scenarios',
+                wraps=scenarios._device_scenarios) as m:
+            [p] = disk2.partitions()
+            p.preserve = False
+            possible = self.get()
+            self.assertEqual(self.computed(m), [disk2])
+        self.assertIn(
+            GuidedStorageTargetReformat(disk_id=disk1.id), possible)
+
+    def test_removed_device_dropped(self):
+        disk1 = make_disk(self.model)
+        disk2 = make_disk(self.model)
+        self.assertEqual(
+            [t.disk_id for t in self.get()], [disk1.id, disk2.id])
+        self.model._remove(disk2)
+        self.assertEqual([t.disk_id for t in self.get()], [disk1.id])
+
+    def test_install_min_change_recomputes_all(self):
+        disk1 = make_disk(self.model)
+        disk2 = make_disk(self.model)
+        self.get()
+        with mock.patch.object(
+                scenarios, '_device_scenarios',
+                wraps=scenarios._device_scenarios) as m:
+            self.install_min = 200 << 30
+            self.assertEqual(self.get(), [])
+            self.assertEqual(self.computed(m), [disk1, disk2])
+
+    def test_model_can_be_collected(self):
+        make_disk(self.model)
+        self.get()
+        ref = weakref.ref(self.model)
+        del self.model
+        gc.collect()
+        self.assertIsNone(ref())
@@ -13,6 +13,7 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import contextlib
 import datetime
 import enum
 import json
@@ -43,34 +44,44 @@ class SerializationError(Exception):
         return f"processing {self.obj}: at {p}, {self.message}"
 
 
-@attr.s(auto_attribs=True)
-class SerializationContext:
-    obj: typing.Any
-    cur: typing.Any
-    path: str
-    metadata: typing.Optional[typing.Dict]
-    serializing: bool
+class _Error(Exception):
+    # Raised by the functions built by Serializer when a value cannot be
+    # handled. The path to the value is only worked out if this happens:
+    # each level appends its part of the path as the exception propagates
+    # and Serializer.serialize/deserialize turn it into a
+    # SerializationError.
+
+    def __init__(self, message):
+        self.message = message
+        self.path = []
+
+    def at(self, part):
+        self.path.append(part)
+        return self
+
+    def to_serialization_error(self, obj):
+        return SerializationError(
+            obj, ''.join(reversed(self.path)), self.message)
 
-    @classmethod
-    def new(cls, obj, *, serializing):
-        return SerializationContext(obj, obj, '', {}, serializing)
 
-    def child(self, path, cur, metadata=None):
-        if metadata is None:
-            metadata = self.metadata
-        return attr.evolve(
-            self, path=self.path + path, cur=cur, metadata=metadata)
+def _check_type(value, typ):
+    if type(value) is not typ:
+        raise _Error("{!r} is not a {}".format(value, typ))
 
-    def error(self, message):
-        raise SerializationError(self.obj, self.path, message)
 
-    def assert_type(self, typ):
-        if type(self.cur) is not typ:
-            self.error("{!r} is not a {}".format(self.cur, typ))
+def _identity(value, metadata):
+    return value
 
 
 # This is basically a half-assed version of # https://pypi.org/project/cattrs/
 # but that's not packaged and this is enough for our needs.
+#
+# Working out how to handle a value from its annotation involves a fair
+# bit of introspection, so the first time a Serializer sees an annotation
+# it builds a function that does just what is needed for that annotation
+# (and those of any nested values) and caches it. All of these functions
+# take the value and the metadata of the attr field that contains it
+# (used e.g. for formatting datetimes).
 
 
 class Serializer:
@@ -95,185 +106,323 @@ class Serializer:
             self.type_deserializers[typ] = self._scalar
         self.type_serializers[dict] = self._serialize_dict
         self.type_deserializers[dict] = self._scalar
+        self.type_serializers[float] = self._scalar
+        self.type_deserializers[float] = self._deserialize_float
         self.type_serializers[datetime.datetime] = self._serialize_datetime
         self.type_deserializers[datetime.datetime] = self._deserialize_datetime
-
-    def _scalar(self, annotation, context):
-        context.assert_type(annotation)
-        return context.cur
-
-    def _walk_Union(self, meth, args, context):
+        self._serializers = {}
+        self._deserializers = {}
+
+    @contextlib.contextmanager
+    def _caching(self, cache, annotation, meth):
+        # The function for an attr class is put into the cache before
+        # working out how to handle its fields so that classes that
+        # (indirectly) contain themselves work.
+        cache[annotation] = meth
+        try:
+            yield
+        except Exception:
+            del cache[annotation]
+            raise
+
+    def _scalar(self, annotation):
+        def scalar(value, metadata):
+            _check_type(value, annotation)
+            return value
+        return scalar
+
+    def _walk_Union(self, get, args, serializing):
         NoneType = type(None)
         if NoneType in args:
             args = [a for a in args if a is not NoneType]
             if len(args) == 1:
                 # I.e. Optional[thing]
-                if context.cur is None:
-                    return context.cur
-                return meth(args[0], context)
+                meth = get(args[0])
+
+                def optional(value, metadata):
+                    if value is None:
+                        return value
+                    return meth(value, metadata)
+                return optional
         if all(attr.has(a) for a in args):
-            if context.serializing:
-                for a in args:
-                    if isinstance(context.cur, a):
-                        r = meth(a, context)
-                        if self.compact:
-                            r.insert(0, a.__name__)
-                        else:
-                            r['$type'] = a.__name__
-                        return r
-                context.error(f"type of {context.cur} not found in {args}")
+            if serializing:
+                return self._serialize_attr_union(get, args)
             else:
-                if self.compact:
-                    n = context.cur.pop(0)
-                else:
-                    n = context.cur.pop('$type')
-                for a in args:
-                    if a.__name__ == n:
-                        return meth(a, context)
-                context.error(f"type {n} not found in {args}")
-        raise context.error(f"cannot serialize Union[{args}]")
-
-    def _walk_List(self, meth, args, context):
-        return [
-            meth(args[0], context.child(f'[{i}]', v))
-            for i, v in enumerate(context.cur)
-            ]
-
-    def _walk_Dict(self, meth, args, context):
+                return self._deserialize_attr_union(get, args)
+
+        def error(value, metadata):
+            raise _Error(f"cannot serialize Union[{args}]")
+        return error
+
+    def _serialize_attr_union(self, get, args):
+        meths = [(a, a.__name__, get(a)) for a in args]
+
+        def union(value, metadata):
+            for a, name, meth in meths:
+                if isinstance(value, a):
+                    r = meth(value, metadata)
+                    if self.compact:
+                        r.insert(0, name)
+                    else:
+                        r['$type'] = name
+                    return r
+            raise _Error(f"type of {value} not found in {args}")
+        return union
+
+    def _deserialize_attr_union(self, get, args):
+        meths = {a.__name__: get(a) for a in args}
+
+        def union(value, metadata):
+            if self.compact:
+                n = value.pop(0)
+            else:
+                n = value.pop('$type')
+            meth = meths.get(n)
+            if meth is None:
+                raise _Error(f"type {n} not found in {args}")
+            return meth(value, metadata)
+        return union
+
+    def _walk_List(self, get, args, serializing):
+        meth = get(args[0])
+
+        def walk_list(value, metadata):
+            r = []
+            for v in value:
+                try:
+                    r.append(meth(v, metadata))
+                except _Error as e:
+                    raise e.at(f'[{len(r)}]')
+            return r
+        return walk_list
+
+    def _walk_Dict(self, get, args, serializing):
         k_ann, v_ann = args
-        if not context.serializing and k_ann is not str:
-            input_items = context.cur
-        else:
-            input_items = context.cur.items()
-        output_items = [[
-            meth(k_ann, context.child(f'/{k}', k)),
-            meth(v_ann, context.child(f'[{k}]', v))
-            ] for k, v in input_items]
-        if context.serializing and k_ann is not str:
-            return output_items
-        return dict(output_items)
-
-    def _serialize_dict(self, annotation, context):
-        context.assert_type(annotation)
-        for k in context.cur:
-            context.child(f'/{k}', k).assert_type(str)
-        return context.cur
-
-    def _serialize_datetime(self, annotation, context):
-        context.assert_type(annotation)
-        fmt = context.metadata.get('time_fmt')
-        if fmt is not None:
-            return context.cur.strftime(fmt)
-        else:
-            return str(context.cur)
-
-    def _serialize_attr(self, annotation, context):
-        serialized = []
-        for field in attr.fields(annotation):
-            serialized.append((
-                _field_name(field),
-                self._serialize(
-                    field.type,
-                    context.child(
-                        f'.{field.name}',
-                        getattr(context.cur, field.name),
-                        field.metadata)),
-                ))
-        if self.compact:
-            return [s[1] for s in serialized]
-        else:
-            return dict(serialized)
+        k_meth = get(k_ann)
+        v_meth = get(v_ann)
+        pairs = not serializing and k_ann is not str
+        to_pairs = serializing and k_ann is not str
+
+        def walk_dict(value, metadata):
+            if pairs:
+                input_items = value
+            else:
+                input_items = value.items()
+            output_items = []
+            for k, v in input_items:
+                try:
+                    k_out = k_meth(k, metadata)
+                except _Error as e:
+                    raise e.at(f'/{k}')
+                try:
+                    v_out = v_meth(v, metadata)
+                except _Error as e:
+                    raise e.at(f'[{k}]')
+                output_items.append([k_out, v_out])
+            if to_pairs:
+                return output_items
+            return dict(output_items)
+        return walk_dict
+
+    def _serialize_dict(self, annotation):
+        def serialize_dict(value, metadata):
+            _check_type(value, annotation)
+            for k in value:
+                if type(k) is not str:
+                    raise _Error(
+                        "{!r} is not a {}".format(k, str)).at(f'/{k}')
+            return value
+        return serialize_dict
+
+    def _serialize_datetime(self, annotation):
+        def serialize_datetime(value, metadata):
+            _check_type(value, annotation)
+            fmt = metadata.get('time_fmt')
+            if fmt is not None:
+                return value.strftime(fmt)
+            else:
+                return str(value)
+        return serialize_datetime
 
-    def _serialize_enum(self, annotation, context):
-        context.assert_type(annotation)
-        return getattr(context.cur, self.serialize_enums_by)
+    def _serialize_attr(self, annotation):
+        compact = self.compact
+        plan = []
 
-    def _serialize(self, annotation, context):
+        def serialize_attr(value, metadata):
+            if compact:
+                r = []
+            else:
+                r = {}
+            for name, key, field_metadata, meth in plan:
+                try:
+                    v = meth(getattr(value, name), field_metadata)
+                except _Error as e:
+                    raise e.at(f'.{name}')
+                if compact:
+                    r.append(v)
+                else:
+                    r[key] = v
+            return r
+
+        with self._caching(self._serializers, annotation, serialize_attr):
+            for field in attr.fields(annotation):
+                plan.append((
+                    field.name,
+                    _field_name(field),
+                    field.metadata,
+                    self._get_serializer(field.type),
+                    ))
+        return serialize_attr
+
+    def _serialize_enum(self, annotation):
+        by = self.serialize_enums_by
+
+        def serialize_enum(value, metadata):
+            _check_type(value, annotation)
+            return getattr(value, by)
+        return serialize_enum
+
+    def _get_serializer(self, annotation):
+        try:
+            return self._serializers[annotation]
+        except KeyError:
+            pass
         if annotation is None:
-            context.assert_type(type(None))
-            return None
+            return self._scalar(type(None))
         if annotation is inspect.Signature.empty or annotation is typing.Any:
-            return context.cur
+            return _identity
         if attr.has(annotation):
-            return self._serialize_attr(annotation, context)
+            return self._serialize_attr(annotation)
         origin = getattr(annotation, '__origin__', None)
         if origin is not None:
-            args = annotation.__args__
-            return self.typing_walkers[origin](self._serialize, args, context)
-        if isinstance(annotation, type) and issubclass(annotation, enum.Enum):
-            return self._serialize_enum(annotation, context)
-        try:
-            serializer = self.type_serializers[annotation]
-        except KeyError:
-            context.error(f"do not know how to handle {annotation}")
+            meth = self.typing_walkers[origin](
+                self._get_serializer, annotation.__args__, True)
+        elif isinstance(annotation, type) and \
+                issubclass(annotation, enum.Enum):
+            meth = self._serialize_enum(annotation)
+        elif annotation in self.type_serializers:
+            meth = self.type_serializers[annotation](annotation)
         else:
-            return serializer(annotation, context)
+            def meth(value, metadata):
+                raise _Error(f"do not know how to handle {annotation}")
+        self._serializers[annotation] = meth
+        return meth
 
     def serialize(self, annotation, value):
-        context = SerializationContext.new(value, serializing=True)
-        return self._serialize(annotation, context)
-
-    def _deserialize_datetime(self, annotation, context):
-        fmt = context.metadata.get('time_fmt')
-        if fmt is None:
-            context.error("cannot serialize datetime without format")
-        return datetime.datetime.strptime(context.cur, fmt)
-
-    def _deserialize_attr(self, annotation, context):
+        try:
+            return self._get_serializer(annotation)(value, {})
+        except _Error as e:
+            raise e.to_serialization_error(value) from None
+
+    def _deserialize_float(self, annotation):
+        def deserialize_float(value, metadata):
+            # JSON does not distinguish 1 from 1.0.
+            if type(value) is int:
+                value = float(value)
+            _check_type(value, float)
+            return value
+        return deserialize_float
+
+    def _deserialize_datetime(self, annotation):
+        def deserialize_datetime(value, metadata):
+            fmt = metadata.get('time_fmt')
+            if fmt is None:
+                raise _Error("cannot serialize datetime without format")
+            return datetime.datetime.strptime(value, fmt)
+        return deserialize_datetime
+
+    def _deserialize_attr(self, annotation):
         if self.compact:
-            context.assert_type(list)
-            args = []
-            for field, value in zip(attr.fields(annotation), context.cur):
-                args.append(self._deserialize(
-                    field.type,
-                    context.child(f'[{field.name!r}]', value, field.metadata)))
-            return annotation(*args)
+            plan = []
+
+            def deserialize_attr(value, metadata):
+                _check_type(value, list)
+                args = []
+                for (path, field_metadata, meth), v in zip(plan, value):
+                    try:
+                        args.append(meth(v, field_metadata))
+                    except _Error as e:
+                        raise e.at(path)
+                return annotation(*args)
+
+            with self._caching(
+                    self._deserializers, annotation, deserialize_attr):
+                for field in attr.fields(annotation):
+                    plan.append((
+                        f'[{field.name!r}]',
+                        field.metadata,
+                        self._get_deserializer(field.type),
+                        ))
         else:
-            context.assert_type(dict)
-            args = {}
-            fields = {
-                _field_name(field): field for field in attr.fields(annotation)
-                }
-            for key, value in context.cur.items():
-                if key not in fields and (
-                        key == '$type' or self.ignore_unknown_fields):
-                    # Union types can contain a '$type' field that is not
-                    # actually one of the keys.  This happens if a object is
-                    # serialized as part of a Union, sent to an API caller,
-                    # then received back on a different endpoint that isn't a
-                    # Union.
-                    continue
-                field = fields[key]
-                args[field.name] = self._deserialize(
-                    field.type,
-                    context.child(f'[{key!r}]', value, field.metadata))
-            return annotation(**args)
-
-    def _deserialize_enum(self, annotation, context):
+            ignore_unknown_fields = self.ignore_unknown_fields
+            fields = {}
+
+            def deserialize_attr(value, metadata):
+                _check_type(value, dict)
+                args = {}
+                for key, v in value.items():
+                    if key not in fields and (
+                            key == '$type' or ignore_unknown_fields):
+                        # Union types can contain a '$type' field that is
+                        # not actually one of the keys.  This happens if a
+                        # object is serialized as part of a Union, sent to
+                        # an API caller, then received back on a different
+                        # endpoint that isn't a Union.
+                        continue
+                    name, field_metadata, meth = fields[key]
+                    try:
+                        args[name] = meth(v, field_metadata)
+                    except _Error as e:
+                        raise e.at(f'[{key!r}]')
+                return annotation(**args)
+
+            with self._caching(
+                    self._deserializers, annotation, deserialize_attr):
+                for field in attr.fields(annotation):
+                    fields[_field_name(field)] = (
+                        field.name,
+                        field.metadata,
+                        self._get_deserializer(field.type),
+                        )
+        return deserialize_attr
+
+    def _deserialize_enum(self, annotation):
         if self.serialize_enums_by == "name":
-            return getattr(annotation, context.cur)
+            def deserialize_enum(value, metadata):
+                return getattr(annotation, value)
         else:
-            return annotation(context.cur)
+            def deserialize_enum(value, metadata):
+                return annotation(value)
+        return deserialize_enum
 
-    def _deserialize(self, annotation, context):
+    def _get_deserializer(self, annotation):
+        try:
+            return self._deserializers[annotation]
+        except KeyError:
+            pass
         if annotation is None:
-            context.assert_type(type(None))
-            return None
+            return self._scalar(type(None))
         if annotation is inspect.Signature.empty or annotation is typing.Any:
-            return context.cur
+            return _identity
         if attr.has(annotation):
-            return self._deserialize_attr(annotation, context)
+            return self._deserialize_attr(annotation)
         origin = getattr(annotation, '__origin__', None)
         if origin is not None:
-            return self.typing_walkers[origin](
-                self._deserialize, annotation.__args__, context)
-        if isinstance(annotation, type) and issubclass(annotation, enum.Enum):
-            return self._deserialize_enum(annotation, context)
-        return self.type_deserializers[annotation](annotation, context)
+            meth = self.typing_walkers[origin](
+                self._get_deserializer, annotation.__args__, False)
+        elif isinstance(annotation, type) and \
+                issubclass(annotation, enum.Enum):
+            meth = self._deserialize_enum(annotation)
+        else:
+            meth = self.type_deserializers[annotation](annotation)
+        self._deserializers[annotation] = meth
+        return meth
 
     def deserialize(self, annotation, value):
-        context = SerializationContext.new(value, serializing=False)
-        return self._deserialize(annotation, context)
+        try:
+            return self._get_deserializer(annotation)(value, {})
+        except _Error as e:
+            raise e.to_serialization_error(value) from None
 
     def to_json(self, annotation, value):
         return json.dumps(self.serialize(annotation, value))
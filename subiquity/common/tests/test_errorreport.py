@@ -0,0 +1,112 @@
+# Copyright 2023 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+
+from subiquitycore.tests import SubiTestCase
+
+from subiquity.common.errorreport import (
+    attach_file_tail,
+    attach_files,
+    log_tail,
+    read_tail,
+    )
+
+
+class TestLogTail(SubiTestCase):
+
+    def test_log_tail(self):
+        text = "one\n  two  \nthree\n"
+        self.assertEqual(log_tail(text, 100), "one\ntwo\nthree")
+        self.assertEqual(log_tail(text, 8), "two\nthree")
+        self.assertEqual(log_tail(text, 4), "")
+        self.assertEqual(log_tail(text.encode(), 5), "three")
+        self.assertEqual(log_tail("", 5), "")
+
+    def test_matches_old_behaviour(self):
+        lines = ["line {}".format(i) * (i % 7) for i in range(2000)]
+        text = "\n".join(lines)
+        logtail = []
+        for line in text.splitlines():
+            logtail.append(line.strip())
+            while sum(map(len, logtail)) > 2048:
+                logtail.pop(0)
+        self.assertEqual(log_tail(text, 2048), "\n".join(logtail))
+
+
+class TestAttachFileTail(SubiTestCase):
+
+    def write(self, content):
+        path = os.path.join(self.tmp_dir(), 'log')
+        with open(path, 'wb') as fp:
+            fp.write(content)
+        return path
+
+    def test_read_tail(self):
+        path = self.write(b"aaaa\nbbbb\ncccc\n")
+        self.assertEqual(read_tail(path, 100), (b"aaaa\nbbbb\ncccc\n", 15))
+        self.assertEqual(read_tail(path, 7), (b"cccc\n", 15))
+
+    def test_small_file(self):
+        pr = {}
+        path = self.write(b"log\n")
+        self.assertEqual(attach_file_tail(pr, path, 'Log', 100), 4)
+        self.assertEqual(pr, {'Log': b"log"})
+
+    def test_missing_file(self):
+        pr = {}
+        self.assertEqual(attach_file_tail(pr, '/nonexistent', 'Log', 100), 0)
+        self.assertEqual(pr, {})
+
+    def test_large_file(self):
+        pr = {}
+        path = self.write(b"x" * 100 + b"\nend\n")
+        # Only the bytes of the file count, not the note.
+        self.assertEqual(attach_file_tail(pr, path, 'Log', 10), 4)
+        self.assertEqual(pr['Log'], b"[first 101 bytes skipped]\nend")
+
+    def test_large_binary_file(self):
+        pr = {}
+        path = self.write(b"\0" * 100)
+        self.assertEqual(attach_file_tail(pr, path, 'Tar', 10), 0)
+        self.assertEqual(pr['Tar'], '[100 bytes, too large to attach]')
+
+
+class TestAttachFiles(SubiTestCase):
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp_dir(), name)
+        with open(path, 'wb') as fp:
+            fp.write(content)
+        return path
+
+    def test_budget(self):
+        a = self.write('a', b"a" * 9 + b"\n")
+        b = self.write('b', b"b" * 9 + b"\n")
+        c = self.write('c', b"c\n")
+        pr = {}
+        files = [('A', a), ('B', b), ('Missing', '/nonexistent'), ('C', c)]
+        self.assertEqual(attach_files(pr, files, budget=20), 20)
+        self.assertEqual(pr['A'], b"a" * 9)
+        self.assertEqual(pr['B'], b"b" * 9)
+        self.assertNotIn('C', pr)
+        self.assertNotIn('Missing', pr)
+        self.assertEqual(pr['SkippedAttachments'], f'C: {c}')
+
+    def test_all_attached(self):
+        a = self.write('a', b"a\n")
+        pr = {}
+        self.assertEqual(attach_files(pr, [('A', a)]), 2)
+        self.assertEqual(pr, {'A': b"a"})
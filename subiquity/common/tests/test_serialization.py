@@ -144,6 +144,15 @@ class CommonSerializerTests:
             compact=self.serializer.compact, serialize_enums_by="value")
         self.assertSerialization(MyEnum, MyEnum.name, "value")
 
+    def test_float(self):
+        self.assertSerialization(float, 1.5, 1.5)
+        self.assertDeserializesTo(float, 2, 2.0)
+        self.assertIs(type(self.serializer.deserialize(float, 2)), float)
+        self.assertRaises(
+            SerializationError, self.serializer.serialize, float, 2)
+        self.assertRaises(
+            SerializationError, self.serializer.deserialize, float, True)
+
     def test_serialize_any(self):
         o = object()
         self.assertSerialization(typing.Any, o, o)
@@ -268,6 +277,38 @@ class TestSerializer(CommonSerializerTests, unittest.TestCase):
             self.serializer.deserialize(Type, {'field-1': 1, 'field2': 2})
         self.assertEqual(catcher.exception.path, "['field-1']")
 
+    def test_nested_error_paths(self):
+        container = Container(Data('a', 1), [Data('b', 2), Data(3, 4)])
+        with self.assertRaises(SerializationError) as catcher:
+            self.serializer.serialize(Container, container)
+        self.assertEqual(catcher.exception.path, '.data_list[1].field1')
+        with self.assertRaises(SerializationError) as catcher:
+            self.serializer.serialize(typing.Dict[str, int], {'a': 'b'})
+        self.assertEqual(catcher.exception.path, '[a]')
+
+    def test_recursive_type(self):
+
+        @attr.s(auto_attribs=True)
+        class Node:
+            name: str
+            children: typing.List['Node']
+
+        for field in attr.fields(Node):
+            if field.name == 'children':
+                object.__setattr__(field, 'type', typing.List[Node])
+
+        self.assertSerialization(
+            Node, Node('a', [Node('b', [])]),
+            {'name': 'a', 'children': [{'name': 'b', 'children': []}]})
+
+    def test_handlers_are_cached(self):
+        serializer = Serializer()
+        serializer.serialize(Container, Container.make_random())
+        meth = serializer._serializers[Container]
+        serializer.serialize(Container, Container.make_random())
+        self.assertIs(meth, serializer._serializers[Container])
+        self.assertIn(Data, serializer._serializers)
+
 
 class TestCompactSerializer(CommonSerializerTests, unittest.TestCase):
 
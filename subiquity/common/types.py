@@ -96,6 +96,47 @@ class ApplicationStatus:
     event_syslog_id: str
 
 
+@attr.s(auto_attribs=True)
+class ContextTiming:
+    """How long a context of the install took. Times are in seconds and
+    start is relative to the start of the install."""
+    id: int
+    parent_id: Optional[int]
+    name: str
+    description: str
+    start: float
+    wall: float
+    self_time: float
+    finished: bool
+    result: Optional[str]
+
+
+@attr.s(auto_attribs=True)
+class JournalSenderStats:
+    """How the server is keeping up with sending events to the journal.
+
+    queued is the number of entries waiting to be sent, failed the number
+    that could not be sent and per_second the rate they have been sent at
+    over the last few seconds.
+    """
+    queued: int
+    sent: int
+    failed: int
+    batches: int
+    per_second: float
+
+
+@attr.s(auto_attribs=True)
+class InstallTimings:
+    total: float
+    contexts: List[ContextTiming]
+    # The ids of the contexts, starting with the install itself, that held
+    # up the install: the child of a context that finished last, the
+    # sibling that finished just before that one started and so on, each
+    # followed by its own critical path.
+    critical_path: List[int]
+
+
 class PasswordKind(enum.Enum):
     NONE = enum.auto()
     KNOWN = enum.auto()
@@ -243,6 +284,37 @@ class NetworkStatus:
     wlan_support_install_state: WLANSupportInstallState
 
 
+class LinkAction(enum.Enum):
+    NEW = enum.auto()
+    CHANGE = enum.auto()
+    DEL = enum.auto()
+
+
+@attr.s(auto_attribs=True)
+class LinkUpdate:
+    act: LinkAction
+    info: NetDevInfo
+
+
+@attr.s(auto_attribs=True)
+class NetEventSubscriberStats:
+    """The state of the queue of events for a network subscriber.
+
+    The counts are of events, except requests which counts the requests
+    made to the subscriber. depth is the number of events waiting to be
+    sent, coalesced the link updates that replaced one already waiting for
+    the same device and dropped the events that were not delivered,
+    because the request failed or the subscription went away first.
+    """
+    socket_path: str
+    depth: int
+    queued: int
+    coalesced: int
+    sent: int
+    requests: int
+    dropped: int
+
+
 class ProbeStatus(enum.Enum):
     PROBING = enum.auto()
     FAILED = enum.auto()
@@ -372,6 +444,32 @@ class StorageResponse:
     blockdev: Optional[dict] = None
     dasd: Optional[dict] = None
     storage_version: int = 1
+    # The revision of the model config describes, to send a StoragePatch
+    # against.
+    revision: Optional[str] = None
+
+
+@attr.s(auto_attribs=True)
+class StoragePatch:
+    """Changes to the storage config in a StorageResponse.
+
+    The objects with the ids in delete are deleted, then the actions in
+    add are added and then the objects with the ids of the actions in edit
+    have the fields they contain set, a field set to None is cleared. The
+    actions are in the same form as in StorageResponse.config.
+    """
+    revision: str
+    delete: List[str] = attr.Factory(list)
+    add: List[dict] = attr.Factory(list)
+    edit: List[dict] = attr.Factory(list)
+
+
+@attr.s(auto_attribs=True)
+class StoragePatchResponse:
+    # False if the patch was not applied because the model is not at the
+    # revision it was made against any more.
+    applied: bool
+    revision: str
 
 
 @attr.s(auto_attribs=True)
@@ -14,10 +14,17 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import asyncio
+import collections
 import contextlib
+import logging
+import queue
+import threading
+import time
 
 from systemd import journal
 
+from subiquity.common.types import JournalSenderStats
+
 
 def journald_listen(identifiers, callback, seek=False):
     reader = journal.Reader()
@@ -55,6 +62,125 @@ def journald_subscriptions(ids_callbacks, seek=False):
             loop.remove_reader(fd)
 
 
+class _Subscription:
+
+    __slots__ = ('identifier', 'fields', 'callback')
+
+    def __init__(self, identifier, fields, callback):
+        self.identifier = identifier
+        self.fields = fields
+        self.callback = callback
+
+
+class JournalMultiplexer:
+    """Follow the journal for several syslog identifiers with one reader.
+
+    Where journald_listen passes callbacks every field of each entry,
+    converted to Python objects, subscribers here name the fields they
+    want and get a dict of just those (as str, and only those present).
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self._reader = None
+        self._cursor = None
+        self._subscriptions = {}
+
+    def subscribe(self, identifier, fields, callback):
+        """Call callback for new entries with SYSLOG_IDENTIFIER=identifier.
+
+        Returns a handle to pass to unsubscribe()."""
+        sub = _Subscription(identifier, tuple(fields), callback)
+        self._subscriptions.setdefault(identifier, []).append(sub)
+        self._update_matches()
+        return sub
+
+    def unsubscribe(self, sub):
+        subs = self._subscriptions.get(sub.identifier, [])
+        if sub in subs:
+            # Deliver what has been logged up to now first.
+            self._read()
+            subs.remove(sub)
+            if not subs:
+                del self._subscriptions[sub.identifier]
+            self._update_matches()
+
+    def _update_matches(self):
+        if self._reader is None:
+            self._reader = journal.Reader()
+            self.loop.add_reader(self._reader.fileno(), self._process)
+        else:
+            # Deliver what the current matches have found so far.
+            self._read()
+        reader = self._reader
+        reader.flush_matches()
+        if not self._subscriptions:
+            self.loop.remove_reader(reader.fileno())
+            reader.close()
+            self._reader = None
+            return
+        for identifier in self._subscriptions:
+            reader.add_match(SYSLOG_IDENTIFIER=identifier)
+        if self._cursor is not None:
+            # Carry on from the last entry read. Seeking there and moving
+            # forward lands on that entry if it matches the new matches, or
+            # else the one after it, which has not been read yet.
+            reader.seek_cursor(self._cursor)
+            if reader._next() and not reader.test_cursor(self._cursor):
+                reader._previous()
+
+    def _process(self):
+        if self._reader.process() != journal.NOP:
+            self._read()
+
+    def _read(self):
+        reader = self._reader
+        while reader._next():
+            self._cursor = reader._get_cursor()
+            identifier = self._get(reader, 'SYSLOG_IDENTIFIER')
+            subs = self._subscriptions.get(identifier)
+            if not subs:
+                continue
+            values = {}
+            for sub in list(subs):
+                event = {}
+                for field in sub.fields:
+                    if field not in values:
+                        values[field] = self._get(reader, field)
+                    if values[field] is not None:
+                        event[field] = values[field]
+                sub.callback(event)
+
+    def _get(self, reader, field):
+        try:
+            value = reader._get(field)
+        except KeyError:
+            return None
+        if isinstance(value, bytes):
+            value = value.decode('utf-8', 'replace')
+        return value
+
+
+log = logging.getLogger('subiquity.journald')
+
+
+_multiplexer = None
+
+
+def journald_subscribe(identifier, fields, callback):
+    """Subscribe to identifier with the multiplexer for the running loop."""
+    global _multiplexer
+    loop = asyncio.get_running_loop()
+    if _multiplexer is None or _multiplexer.loop is not loop:
+        _multiplexer = JournalMultiplexer(loop)
+    return _multiplexer.subscribe(identifier, fields, callback)
+
+
+def journald_unsubscribe(sub):
+    if _multiplexer is not None:
+        _multiplexer.unsubscribe(sub)
+
+
 async def journald_get_first_match(*identifiers, seek=False):
     def cb(_event):
         nonlocal event
@@ -66,3 +192,103 @@ async def journald_get_first_match(*identifiers, seek=False):
     with journald_subscriptions(((identifiers, cb),), seek=seek):
         await found.wait()
     return event
+
+
+class JournalSender:
+    """Send entries to the journal from a background thread.
+
+    send() takes the same arguments as systemd.journal.send but only puts
+    the entry on a queue. A thread takes all the entries that have queued
+    up each time it wakes and sends them, in order. An entry that cannot
+    be sent is counted as failed and dropped.
+    """
+
+    # The number of seconds stats() works out the rate of sending over.
+    rate_window = 10.0
+
+    def __init__(self):
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0
+        self.batches = 0
+        # (time, sent) after each batch sent in the last rate_window
+        # seconds, and the last one from before that.
+        self._samples = collections.deque([(time.monotonic(), 0)])
+        self._samples_lock = threading.Lock()
+
+    def send(self, message, **fields):
+        self._queue.put((message, fields))
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name='journal-sender', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = False
+            for entry in batch:
+                if entry is None:
+                    stop = True
+                    continue
+                message, fields = entry
+                try:
+                    journal.send(message, **fields)
+                except Exception:
+                    # Only log the first failure, if journald has gone
+                    # away every entry will fail.
+                    if self.failed == 0:
+                        log.exception("sending %r to the journal failed",
+                                      message)
+                    self.failed += 1
+                    continue
+                self.sent += 1
+            self.batches += 1
+            self._add_sample(time.monotonic(), self.sent)
+            if stop:
+                return
+
+    def close(self):
+        """Send the entries queued so far and stop the thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+    def _add_sample(self, now, sent):
+        with self._samples_lock:
+            self._samples.append((now, sent))
+            while len(self._samples) > 1 and \
+                    self._samples[1][0] < now - self.rate_window:
+                self._samples.popleft()
+
+    def stats(self, now=None):
+        """Return how many entries are waiting to be sent, sent so far,
+        failed to send and sent per second over about the last rate_window
+        seconds."""
+        if now is None:
+            now = time.monotonic()
+        sent = self.sent
+        with self._samples_lock:
+            samples = list(self._samples)
+        then, sent_then = samples[0]
+        for t, s in samples[1:]:
+            if t > now - self.rate_window:
+                break
+            then, sent_then = t, s
+        return JournalSenderStats(
+            queued=self._queue.qsize(),
+            sent=sent,
+            failed=self.failed,
+            batches=self.batches,
+            per_second=(sent - sent_then) / max(now - then, 1e-6))
@@ -19,6 +19,7 @@ import collections
 import copy
 import enum
 import fnmatch
+import heapq
 import itertools
 import logging
 import math
@@ -26,6 +27,7 @@ import os
 import pathlib
 import platform
 import tempfile
+import uuid
 
 import more_itertools
 
@@ -35,7 +37,9 @@ from curtin.util import human2bytes
 
 from probert.storage import StorageInfo
 
-from subiquity.common.types import Bootloader, OsProber
+from subiquitycore.log import deferred
+
+from subiquity.common.types import Bootloader, OsProber, StoragePatch
 
 log = logging.getLogger('subiquity.models.filesystem')
 
@@ -50,14 +54,7 @@ class NotFinalPartitionError(Exception):
 
 def _set_backlinks(obj):
     if obj.id is None:
-        base = obj.type
-        i = 0
-        while True:
-            val = "%s-%s" % (base, i)
-            if val not in obj._m._all_ids:
-                break
-            i += 1
-        obj.id = val
+        obj.id = obj._m._allocate_id(obj.type)
     obj._m._all_ids.add(obj.id)
     for field in attr.fields(type(obj)):
         backlink = field.metadata.get('backlink')
@@ -76,6 +73,7 @@ def _set_backlinks(obj):
                 b.add(obj)
             else:
                 setattr(vv, backlink, obj)
+    obj._m.generation += 1
 
 
 def _remove_backlinks(obj):
@@ -96,6 +94,7 @@ def _remove_backlinks(obj):
                 b.remove(obj)
             else:
                 setattr(vv, backlink, None)
+    obj._m.generation += 1
 
 
 _type_to_cls = {}
@@ -125,6 +124,15 @@ def fsobj__repr(obj):
     return "{}({})".format(type(obj).__name__, ", ".join(args))
 
 
+def fsobj__setattr(obj, name, value):
+    # Code that caches things computed from the model (e.g. the gaps on a
+    # device) uses the model's generation to know when it has changed.
+    object.__setattr__(obj, name, value)
+    m = obj.__dict__.get('_m')
+    if m is not None:
+        m.generation += 1
+
+
 def _do_post_inits(obj):
     for fn in obj._post_inits:
         fn(obj)
@@ -142,6 +150,7 @@ def fsobj(typ):
         c._m = attr.ib(repr=None, default=None)
         c = attr.s(eq=False, repr=False)(c)
         c.__repr__ = fsobj__repr
+        c.__setattr__ = fsobj__setattr
         _type_to_cls[typ] = c
         return c
     return wrapper
@@ -1058,6 +1067,97 @@ class ActionRenderMode(enum.Enum):
     FORMAT_MOUNT = enum.auto()
 
 
+class ActionList(list):
+    """A list of model objects that keeps lookup indexes up to date.
+
+    FilesystemModel._one and _all are called a lot and, on systems
+    with many disks and existing partitions, scanning every action for
+    every lookup gets expensive. This maintains a mapping from id to
+    object and, for each type, the objects of that type in list order
+    so those lookups only have to look at relevant objects.
+
+    Only id and type are indexed as they are fixed once an object has
+    been created. Other attributes (e.g. path) can be changed after the
+    fact so lookups on them are filtered within the type's objects.
+    """
+
+    def __init__(self, actions=()):
+        super().__init__(actions)
+        self._reindex()
+
+    def _reindex(self):
+        self._by_id = {}
+        self._by_type = collections.defaultdict(dict)
+        for obj in self:
+            self._index(obj)
+
+    def _index(self, obj):
+        self._by_id.setdefault(obj.id, obj)
+        self._by_type[obj.type][obj] = None
+
+    def _unindex(self, obj):
+        if self._by_id.get(obj.id) is obj:
+            del self._by_id[obj.id]
+        self._by_type[obj.type].pop(obj, None)
+
+    def by_id(self, id):
+        return self._by_id.get(id)
+
+    def of_type(self, type):
+        return self._by_type.get(type, {}).keys()
+
+    def append(self, obj):
+        super().append(obj)
+        self._index(obj)
+
+    def extend(self, objs):
+        objs = list(objs)
+        super().extend(objs)
+        for obj in objs:
+            self._index(obj)
+
+    def __iadd__(self, objs):
+        self.extend(objs)
+        return self
+
+    def remove(self, obj):
+        super().remove(obj)
+        self._unindex(obj)
+
+    def pop(self, index=-1):
+        obj = super().pop(index)
+        self._unindex(obj)
+        return obj
+
+    def clear(self):
+        super().clear()
+        self._reindex()
+
+    # Operations that can change the relative order of objects or
+    # replace several at once just rebuild the indexes; nothing in
+    # subiquity uses them on a hot path.
+
+    def insert(self, index, obj):
+        super().insert(index, obj)
+        self._reindex()
+
+    def __setitem__(self, index, value):
+        super().__setitem__(index, value)
+        self._reindex()
+
+    def __delitem__(self, index):
+        super().__delitem__(index)
+        self._reindex()
+
+    def sort(self, *args, **kw):
+        super().sort(*args, **kw)
+        self._reindex()
+
+    def reverse(self):
+        super().reverse()
+        self._reindex()
+
+
 class FilesystemModel(object):
 
     target = None
@@ -1111,10 +1211,41 @@ class FilesystemModel(object):
         self.bootloader = bootloader
         self.storage_version = 1
         self._probe_data = None
+        # Incremented whenever an object in the model is created, removed
+        # or has an attribute set.
+        self.generation = 0
+        self._uuid = uuid.uuid4().hex
+        # The config and revision passed to load_server_data, see
+        # make_patch.
+        self._server_config = None
+        self._server_revision = None
+        # (generation, storage_version, {device: parts_and_gaps}), see
+        # gaps.parts_and_gaps.
+        self._gaps_cache = None
+        # A _Scenarios, see scenarios.guided_scenarios.
+        self._scenarios_cache = None
         self.reset()
 
-    def reset(self):
+    def _reset_ids(self):
         self._all_ids = set()
+        # Next suffix to try for each type when allocating an id. Ids are
+        # never reused, so this only has to move forward past ids that
+        # have been taken by objects loaded with an explicit id.
+        self._next_id_suffix = collections.Counter()
+
+    def _allocate_id(self, base):
+        i = self._next_id_suffix[base]
+        while True:
+            val = "%s-%s" % (base, i)
+            i += 1
+            if val not in self._all_ids:
+                break
+        self._next_id_suffix[base] = i
+        return val
+
+    def reset(self):
+        self.generation += 1
+        self._reset_ids()
         if self._probe_data is not None:
             self._orig_config = storage_config.extract_storage_config(
                 self._probe_data)["storage"]["config"]
@@ -1140,8 +1271,9 @@ class FilesystemModel(object):
         return orig_model
 
     def load_server_data(self, status):
-        log.debug('load_server_data %s', status)
-        self._all_ids = set()
+        log.debug('load_server_data %s', deferred(status))
+        self.generation += 1
+        self._reset_ids()
         self.storage_version = status.storage_version
         self._orig_config = status.orig_config
         self._probe_data = {
@@ -1151,6 +1283,174 @@ class FilesystemModel(object):
         self._actions = self._actions_from_config(
             status.config,
             status.blockdev)
+        self._server_config = copy.deepcopy(status.config)
+        self._server_revision = status.revision
+
+    def make_patch(self):
+        """Return the changes made since load_server_data, as a patch to
+        send to the server, or None if the server did not send a revision
+        to make one against."""
+        if self._server_revision is None:
+            return None
+        old = {action['id']: action for action in self._server_config}
+        new = self._render_actions(mode=ActionRenderMode.ALL)
+        new_ids = {action['id'] for action in new}
+        edit = []
+        for action in new:
+            if action['id'] not in old or action == old[action['id']]:
+                continue
+            # A field missing from an edit is left alone, so send the
+            # fields that have been cleared as None.
+            action = action.copy()
+            for k in old[action['id']]:
+                action.setdefault(k, None)
+            edit.append(action)
+        return StoragePatch(
+            revision=self._server_revision,
+            delete=[
+                action['id'] for action in reversed(self._server_config)
+                if action['id'] not in new_ids
+                ],
+            add=[action for action in new if action['id'] not in old],
+            edit=edit)
+
+    @property
+    def revision(self):
+        """A string that changes whenever the model does (see
+        apply_patch)."""
+        return '{}-{}'.format(self._uuid, self.generation)
+
+    def _patch_refs(self, cls, action):
+        for f in attr.fields(cls):
+            v = action.get(f.name)
+            if v is None:
+                continue
+            if f.metadata.get('ref', False):
+                yield v
+            elif f.metadata.get('reflist', False):
+                yield from v
+
+    def _patch_kw(self, cls, action):
+        # Return the values of the fields in action, with references
+        # resolved.
+        kw = {}
+        for f in attr.fields(cls):
+            n = f.name
+            if n.startswith('_') or n == 'id' or n not in action:
+                continue
+            v = action[n]
+            if v is None:
+                pass
+            elif f.metadata.get('ref', False):
+                v = self._actions.by_id(v)
+            elif f.metadata.get('reflist', False):
+                v = [self._actions.by_id(id) for id in v]
+            kw[n] = v
+        return kw
+
+    def _check_patch(self, delete, add, edit):
+        deleted = set(delete)
+        for id in deleted:
+            if self._actions.by_id(id) is None:
+                raise ValueError("cannot delete {}: no such object".format(id))
+        live = {a.id for a in self._actions} - deleted
+        refs = {}
+        for action in add:
+            cls = _type_to_cls.get(action['type'])
+            if cls is None:
+                raise ValueError(
+                    "cannot add {}: unknown type {}".format(
+                        action['id'], action['type']))
+            if action['id'] in live:
+                raise ValueError(
+                    "cannot add {}: already exists".format(action['id']))
+            if action['type'] == 'disk' and \
+               action.get('path') not in self._probe_data['blockdev']:
+                raise ValueError(
+                    "cannot add {}: no such block device {}".format(
+                        action['id'], action.get('path')))
+            refs[action['id']] = set(self._patch_refs(cls, action))
+            missing = refs[action['id']] - live
+            if missing:
+                raise ValueError(
+                    "cannot add {}: no such objects {}".format(
+                        action['id'], sorted(missing)))
+            live.add(action['id'])
+        for action in edit:
+            obj = self._actions.by_id(action['id'])
+            if obj is None or obj.id in deleted:
+                raise ValueError(
+                    "cannot edit {}: no such object".format(action['id']))
+            if action['type'] != obj.type:
+                raise ValueError(
+                    "cannot change type of {}".format(action['id']))
+            refs[obj.id] = set(self._patch_refs(type(obj), action))
+            missing = refs[obj.id] - live
+            if missing:
+                raise ValueError(
+                    "cannot edit {}: no such objects {}".format(
+                        obj.id, sorted(missing)))
+        for obj in self._actions:
+            if obj.id in deleted or obj.id in refs:
+                continue
+            for dep in dependencies(obj):
+                if dep.id in deleted:
+                    raise ValueError(
+                        "cannot delete {}: {} uses it".format(dep.id, obj.id))
+
+    def apply_patch(self, delete, add, edit):
+        """Change the model by deleting, adding and editing objects.
+
+        This is a cheaper way for the client to send its changes than
+        having the model rebuilt from the whole config. delete is a list of
+        ids of objects to delete, add a list of actions to create, in an
+        order where each comes after the objects it refers to, and edit a
+        list of actions with the new values of fields of existing objects.
+        A field missing from an edit action is left as it is and one that
+        is None is cleared. The actions are otherwise in the form
+        _render_actions() produces. The patch is checked before anything
+        is changed and ValueError raised if it does not make sense, e.g. if
+        it deletes an object something else still uses.
+        """
+        self._check_patch(delete, add, edit)
+        for id in delete:
+            self._remove(self._actions.by_id(id))
+        blockdevs = self._probe_data['blockdev']
+        touched = []
+        for action in add:
+            cls = _type_to_cls[action['type']]
+            kw = self._patch_kw(cls, action)
+            if action['type'] == 'disk':
+                kw['info'] = StorageInfo(
+                    {kw['path']: blockdevs[kw['path']]})
+            obj = cls(m=self, id=action['id'], **kw)
+            self._actions.append(obj)
+            touched.append(obj)
+        for action in edit:
+            obj = self._actions.by_id(action['id'])
+            touched.append(obj)
+            kw = self._patch_kw(type(obj), action)
+            fields = attr.fields_dict(type(obj))
+            changed = {}
+            for n, v in kw.items():
+                converter = fields[n].converter
+                if converter is not None and v is not None:
+                    v = converter(v)
+                old = getattr(obj, n)
+                if isinstance(old, set) and v is not None:
+                    v = set(v)
+                if v != old:
+                    changed[n] = v
+            if not changed:
+                continue
+            _remove_backlinks(obj)
+            for n, v in changed.items():
+                setattr(obj, n, v)
+            _set_backlinks(obj)
+        # Leave the partitions of each device in the order loading the
+        # whole config would have, i.e. by number.
+        for dev in {obj.device for obj in touched if obj.type == 'partition'}:
+            dev._partitions.sort(key=lambda p: (p.number is None, p.number))
 
     def _make_matchers(self, match):
         matchers = []
@@ -1408,13 +1708,16 @@ class FilesystemModel(object):
                         mode: ActionRenderMode = ActionRenderMode.DEFAULT):
         # The curtin storage config has the constraint that an action must be
         # preceded by all the things that it depends on.  We handle this by
-        # repeatedly iterating over all actions and checking if we can emit
-        # each action by checking if all of the actions it depends on have been
-        # emitted.  Eventually this will either emit all actions or stop making
-        # progress -- which means there is a cycle in the definitions,
-        # something the UI should have prevented <wink>.
+        # building a graph with an edge from each action to the actions that
+        # have to come after it and emitting the actions in topological
+        # order.  If that does not emit all the actions there is a cycle in
+        # the definitions, something the UI should have prevented <wink>.
+        #
+        # As well as the references between actions, there are two other
+        # ordering constraints: partitions have to be emitted in order of
+        # their number and mount actions for a parent of a path have to be
+        # emitted before the mount for that path.
         r = []
-        emitted_ids = set()
 
         def emit(obj):
             if isinstance(obj, Raid):
@@ -1422,42 +1725,9 @@ class FilesystemModel(object):
                     "FilesystemModel: estimated size of %s %s is %s",
                     obj.raidlevel, obj.name, obj.size)
             r.append(asdict(obj))
-            emitted_ids.add(obj.id)
 
-        def ensure_partitions(dev):
-            for part in dev.partitions():
-                if part.id not in emitted_ids:
-                    if part not in work and part not in next_work:
-                        next_work.append(part)
-
-        def can_emit(obj):
-            if obj.type == "partition":
-                ensure_partitions(obj.device)
-                for p in obj.device.partitions():
-                    if p.number < obj.number and p.id not in emitted_ids:
-                        return False
-            for dep in dependencies(obj):
-                if dep.id not in emitted_ids:
-                    if dep not in work and dep not in next_work:
-                        next_work.append(dep)
-                        if dep.type in ['disk', 'raid']:
-                            ensure_partitions(dep)
-                    return False
-            if isinstance(obj, Mount):
-                # Any mount actions for a parent of this one have to be emitted
-                # first.
-                for parent in pathlib.Path(obj.path).parents:
-                    parent = str(parent)
-                    if parent in mountpoints:
-                        if mountpoints[parent] not in emitted_ids:
-                            log.debug(
-                                "cannot emit action to mount %s until that "
-                                "for %s is emitted", obj.path, parent)
-                            return False
-            return True
-
-        mountpoints = {m.path: m.id for m in self.all_mounts()}
-        log.debug('mountpoints %s', mountpoints)
+        mountpoints = {m.path: m for m in self.all_mounts()}
+        log.debug('mountpoints %s', {p: m.id for p, m in mountpoints.items()})
 
         if mode == ActionRenderMode.ALL:
             work = list(self._actions)
@@ -1466,19 +1736,79 @@ class FilesystemModel(object):
                 a for a in self._actions if not getattr(a, 'preserve', False)
             ]
 
-        while work:
-            next_work = []
-            for obj in work:
-                if can_emit(obj):
-                    emit(obj)
-                else:
-                    next_work.append(obj)
-            if {a.id for a in next_work} == {a.id for a in work}:
-                msg = ["rendering block devices made no progress processing:"]
-                for w in work:
-                    msg.append(" - " + str(w))
-                raise Exception("\n".join(msg))
-            work = next_work
+        # Maps each action to its position in the order it was added to the
+        # graph. This is used to break ties between actions that could be
+        # emitted at the same time so that the output is stable.
+        position = {}
+        successors = collections.defaultdict(list)
+        indegree = collections.Counter()
+        partitioned = set()
+
+        def add_node(obj):
+            if obj not in position:
+                position[obj] = len(position)
+                queue.append(obj)
+
+        def add_edge(before, after):
+            add_node(before)
+            successors[before].append(after)
+            indegree[after] += 1
+
+        def add_partition_edges(dev):
+            # All the partitions of a device are emitted together, in order
+            # of their number.
+            if dev in partitioned:
+                return
+            partitioned.add(dev)
+            by_number = collections.defaultdict(list)
+            for part in dev.partitions():
+                add_node(part)
+                by_number[part.number].append(part)
+            prev = []
+            for number in sorted(by_number, key=lambda n: (n is None, n)):
+                for part in by_number[number]:
+                    for before in prev:
+                        add_edge(before, part)
+                prev = by_number[number]
+
+        queue = []
+        for obj in work:
+            add_node(obj)
+        i = 0
+        while i < len(queue):
+            obj = queue[i]
+            i += 1
+            if obj.type == "partition":
+                add_partition_edges(obj.device)
+            for dep in dependencies(obj):
+                add_edge(dep, obj)
+                if dep.type in ['disk', 'raid']:
+                    add_partition_edges(dep)
+            if isinstance(obj, Mount):
+                for parent in pathlib.Path(obj.path).parents:
+                    parent_mount = mountpoints.get(str(parent))
+                    if parent_mount is not None:
+                        add_edge(parent_mount, obj)
+
+        ready = [(position[obj], obj) for obj in position
+                 if indegree[obj] == 0]
+        heapq.heapify(ready)
+        while ready:
+            _, obj = heapq.heappop(ready)
+            emit(obj)
+            for succ in successors[obj]:
+                indegree[succ] -= 1
+                if indegree[succ] == 0:
+                    heapq.heappush(ready, (position[succ], succ))
+
+        if len(r) != len(position):
+            remaining = [obj for obj in position if indegree[obj] > 0]
+            msg = ["rendering block devices made no progress processing:"]
+            for w in remaining:
+                msg.append(" - " + str(w))
+            cycle = self._find_cycle(remaining, successors)
+            msg.append("cycle: " + " -> ".join(o.id for o in cycle))
+            raise Exception("\n".join(msg))
 
         if mode == ActionRenderMode.DEVICES:
             r = [act for act in r if act['type'] not in ('format', 'mount')]
@@ -1498,6 +1828,28 @@ class FilesystemModel(object):
 
         return r
 
+    @staticmethod
+    def _find_cycle(nodes, successors):
+        # Every node left over after a topological sort still has a
+        # predecessor that was not emitted either, so walking backwards
+        # from any of them must eventually revisit a node.
+        remaining = set(nodes)
+        predecessors = {}
+        for obj in nodes:
+            for succ in successors[obj]:
+                if succ in remaining:
+                    predecessors.setdefault(succ, obj)
+        path = []
+        on_path = {}
+        obj = nodes[0]
+        while obj not in on_path:
+            on_path[obj] = len(path)
+            path.append(obj)
+            obj = predecessors[obj]
+        cycle = path[on_path[obj]:]
+        cycle.reverse()
+        return cycle + [cycle[0]]
+
     def render(self, mode: ActionRenderMode = ActionRenderMode.DEFAULT):
         config = {
             'storage': {
@@ -1535,8 +1887,23 @@ class FilesystemModel(object):
         self._probe_data = probe_data
         self.reset()
 
+    @property
+    def _actions(self):
+        return self._action_list
+
+    @_actions.setter
+    def _actions(self, actions):
+        self._action_list = ActionList(actions)
+
     def _matcher(self, kw):
-        for a in self._actions:
+        if 'id' in kw:
+            a = self._actions.by_id(kw['id'])
+            candidates = [a] if a is not None else []
+        elif 'type' in kw:
+            candidates = self._actions.of_type(kw['type'])
+        else:
+            candidates = self._actions
+        for a in candidates:
             for k, v in kw.items():
                 if getattr(a, k) != v:
                     break
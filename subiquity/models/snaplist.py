@@ -35,12 +35,15 @@ class SnapListModel:
         self._snaps_by_name = {}
         self.selections = []  # [SnapSelection]
         self.complete_snaps = set()
+        # Incremented whenever the snap list or selections change.
+        self.generation = 0
 
     def _snap_for_name(self, name):
         s = self._snaps_by_name.get(name)
         if s is None:
             s = self._snaps_by_name[name] = SnapInfo(name=name)
             self._snap_info.append(s)
+            self.generation += 1
         return s
 
     def load_find_data(self, data):
@@ -59,6 +62,7 @@ class SnapListModel:
         snap.confinement = data['confinement']
         snap.license = data['license']
         self.complete_snaps.add(snap)
+        self.generation += 1
 
     def load_info_data(self, data):
         info = data['result'][0]
@@ -85,6 +89,7 @@ class SnapListModel:
                             channel_data['released-at'],
                             '%Y-%m-%dT%H:%M:%S.%fZ'),
                     ))
+        self.generation += 1
         return snap
 
     def get_snap_list(self):
@@ -94,6 +99,7 @@ class SnapListModel:
         for selection in selections:
             self._snap_for_name(selection.name)
         self.selections = selections
+        self.generation += 1
 
     def make_cloudconfig(self):
         if not self.selections:
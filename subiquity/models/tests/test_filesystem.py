@@ -34,6 +34,7 @@ from subiquity.models.filesystem import (
     LVM_CHUNK_SIZE,
     )
 from subiquity.common.filesystem import gaps
+from subiquity.common.types import ProbeStatus, StorageResponse
 
 
 class TestHumanizeSize(unittest.TestCase):
@@ -310,6 +311,77 @@ class TestFilesystemModel(unittest.TestCase):
         self.assertFalse(lv.ok_for_lvm_vg)
 
 
+class TestLookups(unittest.TestCase):
+
+    def test_one_by_id(self):
+        model, part = make_model_and_partition()
+        self.assertIs(model._one(id=part.id), part)
+        self.assertIs(model._one(id=part.device.id), part.device)
+        self.assertIsNone(model._one(id='partition-1000'))
+
+    def test_all_by_type_in_order(self):
+        model = make_model()
+        disk1 = make_disk(model)
+        raid = make_raid(model)
+        disk2 = make_disk(model)
+        self.assertEqual(model.all_raids(), [raid])
+        disks = model._all(type='disk')
+        self.assertEqual(disks[0], disk1)
+        self.assertEqual(disks[-1], disk2)
+        self.assertEqual(len(disks), 4)
+
+    def test_lookup_on_mutable_attribute(self):
+        model, part = make_model_and_partition()
+        fs = model.add_filesystem(part, 'ext4')
+        mount = model.add_mount(fs, '/')
+        self.assertIs(model._mount_for_path('/'), mount)
+        mount.path = '/srv'
+        self.assertIsNone(model._mount_for_path('/'))
+        self.assertIs(model._mount_for_path('/srv'), mount)
+
+    def test_remove_updates_index(self):
+        model, part = make_model_and_partition()
+        model.remove_partition(part)
+        self.assertIsNone(model._one(id=part.id))
+        self.assertEqual(model._all(type='partition'), [])
+
+    def test_ids_allocated_in_order(self):
+        model, disk = make_model_and_disk()
+        p1 = make_partition(model, disk, size=1 << 30)
+        p2 = make_partition(model, disk, size=1 << 30)
+        self.assertEqual(
+            [p1.id, p2.id], ['partition-0', 'partition-1'])
+
+    def test_id_allocation_skips_taken_ids(self):
+        model, disk = make_model_and_disk()
+        make_partition(model, disk, size=1 << 30, id='partition-1')
+        p1 = make_partition(model, disk, size=1 << 30)
+        p2 = make_partition(model, disk, size=1 << 30)
+        self.assertEqual(
+            [p1.id, p2.id], ['partition-0', 'partition-2'])
+
+    def test_ids_not_reused(self):
+        model, disk = make_model_and_disk()
+        p1 = make_partition(model, disk, size=1 << 30)
+        model.remove_partition(p1)
+        p2 = make_partition(model, disk, size=1 << 30)
+        self.assertEqual(p2.id, 'partition-1')
+
+    def test_reset_resets_ids(self):
+        model, disk = make_model_and_disk()
+        model._probe_data = None
+        model.reset()
+        disk = make_disk(model)
+        self.assertEqual(disk.id, 'disk-0')
+
+    def test_assign_actions(self):
+        model, disk = make_model_and_disk()
+        model._actions = []
+        self.assertIsNone(model._one(id=disk.id))
+        model._actions = [disk]
+        self.assertIs(model._one(type='disk', serial=disk.serial), disk)
+
+
 def fake_up_blockdata_disk(disk, **kw):
     model = disk._m
     if model._probe_data is None:
@@ -1022,6 +1094,41 @@ class TestAutoInstallConfig(unittest.TestCase):
         self.assertTrue(disk2.id in rendered_ids)
         self.assertTrue(disk2p1.id in rendered_ids)
 
+    def test_render_parent_mount_first(self):
+        model = make_model(Bootloader.NONE)
+        disk1 = make_disk(model)
+        disk1p1 = make_partition(model, disk1)
+        disk1p2 = make_partition(model, disk1)
+        fs1 = model.add_filesystem(disk1p1, 'ext4')
+        fs2 = model.add_filesystem(disk1p2, 'ext4')
+        srv = model.add_mount(fs1, '/srv')
+        root = model.add_mount(fs2, '/')
+        ids = [action['id'] for action in model._render_actions()]
+        self.assertLess(ids.index(root.id), ids.index(srv.id))
+        self.assertLess(ids.index(disk1.id), ids.index(disk1p1.id))
+        self.assertLess(ids.index(disk1p1.id), ids.index(disk1p2.id))
+        self.assertLess(ids.index(disk1p1.id), ids.index(fs1.id))
+
+    def test_render_partitions_in_number_order(self):
+        model = make_model(Bootloader.NONE)
+        disk1 = make_disk(model)
+        disk1p1 = make_partition(model, disk1)
+        disk1p2 = make_partition(model, disk1)
+        model._actions.remove(disk1p1)
+        model._actions.append(disk1p1)
+        ids = [action['id'] for action in model._render_actions()]
+        self.assertLess(ids.index(disk1p1.id), ids.index(disk1p2.id))
+
+    def test_render_reports_cycle(self):
+        model, raid = make_model_and_raid()
+        part = make_partition(model, raid)
+        raid.devices.add(part)
+        with self.assertRaises(Exception) as cm:
+            model._render_actions()
+        self.assertIn(
+            "cycle: {0} -> {1} -> {0}".format(part.id, raid.id),
+            str(cm.exception))
+
 
 class TestPartitionNumbering(unittest.TestCase):
     def setUp(self):
@@ -1166,3 +1273,147 @@ class TestSwap(unittest.TestCase):
         with mock.patch.object(m, '_should_add_swapfile', return_value=False):
             cfg = m.render()
             self.assertEqual({'size': 0}, cfg['swap'])
+
+
+class TestPatch(unittest.TestCase):
+
+    def setUp(self):
+        # The server's model and a client's model loaded from it.
+        self.server = make_model(Bootloader.NONE)
+        self.disk = make_disk(self.server, preserve=True)
+        self.disk2 = make_disk(self.server, preserve=True)
+        self.part = make_partition(
+            self.server, self.disk, preserve=True, number=1)
+        self.client = make_model(Bootloader.NONE)
+        status = StorageResponse(
+            status=ProbeStatus.DONE,
+            bootloader=Bootloader.NONE,
+            orig_config=[],
+            config=self.server._render_actions(mode=ActionRenderMode.ALL),
+            blockdev={
+                d.path: {'size': d.size} for d in (self.disk, self.disk2)},
+            dasd={},
+            revision=self.server.revision)
+
+        def storage_info(data):
+            [info] = data.values()
+            return FakeStorageInfo(size=info['size'])
+
+        p = mock.patch(
+            'subiquity.models.filesystem.StorageInfo', storage_info)
+        p.start()
+        self.addCleanup(p.stop)
+        self.server._probe_data = {'blockdev': status.blockdev}
+        self.client.load_server_data(status)
+
+    def apply(self, patch):
+        self.assertEqual(patch.revision, self.server.revision)
+        self.server.apply_patch(patch.delete, patch.add, patch.edit)
+        # What the client would have got back from the server.
+        self.client._server_config = self.client._render_actions(
+            mode=ActionRenderMode.ALL)
+        self.client._server_revision = self.server.revision
+
+    def assertSameConfig(self):
+        # The server's model should be the same as if the client had sent
+        # its whole config.
+        expected = make_model(Bootloader.NONE)
+        expected._actions = expected._actions_from_config(
+            self.client._render_actions(mode=ActionRenderMode.ALL),
+            self.server._probe_data['blockdev'])
+        self.assertEqual(
+            self.server._render_actions(mode=ActionRenderMode.ALL),
+            expected._render_actions(mode=ActionRenderMode.ALL))
+
+    def test_no_changes(self):
+        patch = self.client.make_patch()
+        self.assertEqual(
+            (patch.delete, patch.add, patch.edit), ([], [], []))
+        generation = self.server.generation
+        self.apply(patch)
+        self.assertEqual(self.server.generation, generation)
+
+    def test_no_revision(self):
+        self.client._server_revision = None
+        self.assertIsNone(self.client.make_patch())
+
+    def test_add_delete_edit(self):
+        disk = self.client._one(id=self.disk.id)
+        part = self.client._one(id=self.part.id)
+        self.client.remove_partition(part)
+        gap = gaps.largest_gap(disk)
+        new = self.client.add_partition(
+            disk, size=gap.size // 2, offset=gap.offset)
+        fs = self.client.add_filesystem(new, 'ext4')
+        self.client.add_mount(fs, '/')
+        disk.wipe = 'superblock'
+        patch = self.client.make_patch()
+        self.assertEqual(patch.delete, [self.part.id])
+        self.assertEqual(
+            [a['type'] for a in patch.add], ['partition', 'format', 'mount'])
+        self.assertEqual([a['id'] for a in patch.edit], [self.disk.id])
+        self.apply(patch)
+        self.assertSameConfig()
+        self.assertIsNone(self.server._one(id=self.part.id))
+        self.assertEqual(self.disk.wipe, 'superblock')
+        [server_part] = self.disk.partitions()
+        self.assertEqual(server_part.fs().mount().path, '/')
+
+    def test_edit_refs(self):
+        disk2 = self.client._one(id=self.disk2.id)
+        raid = self.client.add_raid(
+            'md0', 'raid1', {self.client._one(id=self.disk.id)}, set())
+        self.apply(self.client.make_patch())
+        self.assertSameConfig()
+        raid.devices = {disk2}
+        patch = self.client.make_patch()
+        self.assertEqual([a['id'] for a in patch.edit], [raid.id])
+        self.apply(patch)
+        self.assertSameConfig()
+        server_raid = self.server._one(id=raid.id)
+        self.assertIsNone(self.disk._constructed_device)
+        self.assertIs(self.disk2._constructed_device, server_raid)
+
+    def test_edit_clears_field(self):
+        disk = self.client._one(id=self.disk.id)
+        disk.wipe = 'superblock'
+        self.apply(self.client.make_patch())
+        self.assertEqual(self.disk.wipe, 'superblock')
+        disk.wipe = None
+        self.apply(self.client.make_patch())
+        self.assertIsNone(self.disk.wipe)
+        self.assertSameConfig()
+
+    def test_edit_leaves_missing_fields(self):
+        self.server.apply_patch(
+            [], [], [{'id': self.disk.id, 'type': 'disk', 'wipe': 'zero'}])
+        self.assertEqual(self.disk.wipe, 'zero')
+        self.assertTrue(self.disk.preserve)
+        self.assertEqual(self.disk.ptable, 'gpt')
+        self.assertIsNotNone(self.disk.serial)
+        self.assertIsNotNone(self.disk.path)
+
+    def test_revision_changes(self):
+        revision = self.server.revision
+        self.disk.wipe = 'superblock'
+        self.assertNotEqual(self.server.revision, revision)
+        self.assertNotEqual(self.client.revision, revision)
+
+    def test_bad_patches(self):
+        self.server._actions.append(make_filesystem(
+            self.server, partition=self.part, fstype='ext4'))
+        revision = self.server.revision
+        bad = [
+            ([self.part.id], [], []),
+            (['nope'], [], []),
+            ([], [{'id': self.part.id, 'type': 'partition'}], []),
+            ([], [{'id': 'x', 'type': 'format', 'volume': 'nope'}], []),
+            ([], [{'id': 'x', 'type': 'bcache'}], []),
+            ([], [{'id': 'x', 'type': 'disk', 'path': '/dev/nope'}], []),
+            ([], [], [{'id': 'nope', 'type': 'disk'}]),
+            ([], [], [{'id': self.disk.id, 'type': 'raid'}]),
+            ]
+        for delete, add, edit in bad:
+            with self.assertRaises(ValueError):
+                self.server.apply_patch(delete, add, edit)
+        self.assertEqual(self.server.revision, revision)
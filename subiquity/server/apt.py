@@ -14,14 +14,19 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import contextlib
+import glob
+import hashlib
+import json
 import logging
 import os
 import shutil
+import stat
 import subprocess
 from typing import Optional
 
 from curtin.config import merge_config
 
+from subiquitycore.async_helpers import run_in_thread
 from subiquitycore.file_util import write_file, generate_config_yaml
 from subiquitycore.lsb_release import lsb_release
 
@@ -37,6 +42,123 @@ from subiquity.server.mounter import (
 log = logging.getLogger('subiquity.server.apt')
 
 
+def _is_opaque(path):
+    try:
+        return os.getxattr(
+            path, 'trusted.overlay.opaque', follow_symlinks=False) == b'y'
+    except OSError:
+        return False
+
+
+def overlay_changes(upperdir: str, lowerdir: str, path: str):
+    """Yield the paths under path that an overlay has changed.
+
+    upperdir is the upper directory of the overlay and lowerdir is a view
+    of what is below it. A directory that is in both and is not opaque is
+    not changed itself, so the paths changed within it are yielded instead.
+    Anything else in upperdir is a changed path: a new or modified file, a
+    whiteout for a removed file, or a directory that replaces whatever was
+    there.
+    """
+    upper = os.path.join(upperdir, path)
+    try:
+        st = os.lstat(upper)
+    except FileNotFoundError:
+        return
+    if stat.S_ISDIR(st.st_mode) and not _is_opaque(upper) and \
+       os.path.isdir(os.path.join(lowerdir, path)) and \
+       not os.path.islink(os.path.join(lowerdir, path)):
+        for name in sorted(os.listdir(upper)):
+            yield from overlay_changes(
+                upperdir, lowerdir, os.path.join(path, name))
+    else:
+        yield path
+
+
+def _sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class AptListsCache:
+    """A cache of the lists apt-get update generates for the cdrom pool.
+
+    Entries are keyed by the sources.list line for the pool and the
+    contents of the cdrom's .disk/info and dists/*/Release files. Each
+    entry holds the lists files for the pool and a manifest of their
+    sha256s, which are checked before the entry is used.
+    """
+
+    # apt names the lists for file:///cdrom/... sources like this.
+    lists_prefix = '_cdrom_'
+
+    def __init__(self, cache_dir: str, cdrom: str = '/cdrom'):
+        self.cache_dir = cache_dir
+        self.cdrom = cdrom
+
+    def key(self, sources_line: str) -> Optional[str]:
+        """Return the key for the cdrom, or None if it has no .disk/info."""
+        info = os.path.join(self.cdrom, '.disk/info')
+        if not os.path.exists(info):
+            return None
+        h = hashlib.sha256(sources_line.encode('utf-8'))
+        releases = glob.glob(os.path.join(self.cdrom, 'dists/*/Release'))
+        for path in [info] + sorted(releases):
+            h.update(os.path.relpath(path, self.cdrom).encode('utf-8'))
+            h.update(_sha256_file(path).encode('ascii'))
+        return h.hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def restore(self, key: str, lists_dir: str) -> bool:
+        """Copy the lists for key into lists_dir, if they are cached."""
+        entry = self._entry(key)
+        manifest_path = os.path.join(entry, 'manifest.json')
+        if not os.path.exists(manifest_path):
+            return False
+        try:
+            with open(manifest_path) as fp:
+                manifest = json.load(fp)
+            for name, digest in manifest.items():
+                if _sha256_file(os.path.join(entry, name)) != digest:
+                    raise ValueError(f"{name} does not match its sha256")
+        except (OSError, ValueError) as exc:
+            log.warning("discarding apt lists cache entry %s: %s", key, exc)
+            shutil.rmtree(entry, ignore_errors=True)
+            return False
+        for name in manifest:
+            shutil.copy2(
+                os.path.join(entry, name), os.path.join(lists_dir, name))
+        log.debug("restored %d apt lists from cache", len(manifest))
+        return True
+
+    def store(self, key: str, lists_dir: str) -> None:
+        """Cache the lists for the cdrom pool in lists_dir under key."""
+        names = [
+            name for name in sorted(os.listdir(lists_dir))
+            if name.startswith(self.lists_prefix)
+            and os.path.isfile(os.path.join(lists_dir, name))
+            ]
+        if not names:
+            return
+        entry = self._entry(key)
+        tmp = entry + '.new'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        manifest = {}
+        for name in names:
+            shutil.copy2(os.path.join(lists_dir, name), tmp)
+            manifest[name] = _sha256_file(os.path.join(tmp, name))
+        with open(os.path.join(tmp, 'manifest.json'), 'w') as fp:
+            json.dump(manifest, fp)
+        shutil.rmtree(entry, ignore_errors=True)
+        os.rename(tmp, entry)
+
+
 class AptConfigurer:
     # We configure apt during installation so that installs from the pool on
     # the cdrom are preferred during installation but remove this again in the
@@ -58,7 +180,11 @@ class AptConfigurer:
     # 3. writing "deb file:///cdrom $(lsb_release -sc) main restricted"
     #    to /etc/apt/sources.list.
     #
-    # 4. running "apt-get update" in the new overlay.
+    # 4. running "apt-get update" in the new overlay. If a cache directory
+    #    for apt lists is configured (--apt-lists-cache or
+    #    subiquity-apt-lists-cache= on the kernel command line), the lists
+    #    for the cdrom are copied from there if they were cached for the
+    #    same cdrom, and only the other sources are updated.
     #
     # When the install is done the deconfigure method makes the installed
     # system's apt state look as if the pool had never been configured. So
@@ -72,6 +198,11 @@ class AptConfigurer:
     # 3. If the network is working, run apt-get update in the installed
     #    system, or if it is not, just copy /var/lib/apt/lists from the
     #    'configured_tree' overlay.
+    #
+    # The installed system is a copy of 'install_tree', so rather than
+    # copying all of a directory in steps 2 and 3, only the paths that
+    # 'install_tree' changed (that is, what is in its upperdir) are copied
+    # from 'configured_tree' or, if they are not there, removed.
 
     def __init__(self, app, mounter: Mounter, source: str):
         self.app = app
@@ -80,6 +211,10 @@ class AptConfigurer:
         self.configured_tree: Optional[OverlayMountpoint] = None
         self.install_tree: Optional[OverlayMountpoint] = None
         self.install_mount = None
+        self.lists_cache: Optional[AptListsCache] = None
+        cache_dir = getattr(app.opts, 'apt_lists_cache', None)
+        if cache_dir:
+            self.lists_cache = AptListsCache(cache_dir)
 
     def apt_config(self):
         cfg = {}
@@ -121,15 +256,42 @@ class AptConfigurer:
 
         codename = lsb_release(dry_run=self.app.opts.dry_run)['codename']
 
-        write_file(
-            self.install_tree.p('etc/apt/sources.list'),
+        sources_line = (
             f'deb [check-date=no] file:///cdrom {codename} main restricted\n')
+        write_file(self.install_tree.p('etc/apt/sources.list'), sources_line)
+
+        await self._update_install_tree(context, sources_line)
+
+        return self.install_tree.p()
+
+    async def _update_install_tree(self, context, sources_line):
+        cache = self.lists_cache
+        key = None
+        if cache is not None:
+            key = await run_in_thread(cache.key, sources_line)
+        lists_dir = self.install_tree.p('var/lib/apt/lists')
+        apt_args = []
+        if key is not None and \
+           await run_in_thread(cache.restore, key, lists_dir):
+            if not self.app.base_model.network.has_network:
+                return
+            # Only update the sources other than the cdrom, and keep the
+            # lists for the cdrom that are not referenced then.
+            apt_args = [
+                '-o', 'Dir::Etc::SourceList=/dev/null',
+                '-o', 'APT::Get::List-Cleanup=false',
+                ]
+            key = None
 
         await run_curtin_command(
             self.app, context, "in-target", "-t", self.install_tree.p(),
-            "--", "apt-get", "update", private_mounts=True)
+            "--", "apt-get", "update", *apt_args, private_mounts=True)
 
-        return self.install_tree.p()
+        if key is not None:
+            try:
+                await run_in_thread(cache.store, key, lists_dir)
+            except OSError:
+                log.exception("caching apt lists failed")
 
     @contextlib.asynccontextmanager
     async def overlay(self):
@@ -156,23 +318,40 @@ class AptConfigurer:
     async def cleanup(self):
         await self.mounter.cleanup()
 
+    async def _restore_dir(self, target_mnt: Mountpoint, dir: str) -> None:
+        changes = overlay_changes(
+            self.install_tree.upperdir, self.configured_tree.p(), dir)
+        for path in changes:
+            src = self.configured_tree.p(path)
+            dst = target_mnt.p(path)
+            log.debug("restoring %s", path)
+            if os.path.isdir(dst) and not os.path.islink(dst):
+                shutil.rmtree(dst)
+            elif os.path.lexists(dst):
+                os.unlink(dst)
+            if not os.path.lexists(src):
+                continue
+            st = os.lstat(src)
+            if stat.S_ISDIR(st.st_mode):
+                await self.app.command_runner.run(['cp', '-aT', src, dst])
+                continue
+            if stat.S_ISLNK(st.st_mode):
+                os.symlink(os.readlink(src), dst)
+            else:
+                shutil.copy2(src, dst)
+            os.lchown(dst, st.st_uid, st.st_gid)
+
     async def deconfigure(self, context, target: str) -> None:
         target_mnt = Mountpoint(mountpoint=target)
 
-        async def _restore_dir(dir):
-            shutil.rmtree(target_mnt.p(dir))
-            await self.app.command_runner.run([
-                'cp', '-aT', self.configured_tree.p(dir), target_mnt.p(dir),
-                ])
-
-        await _restore_dir('etc/apt')
+        await self._restore_dir(target_mnt, 'etc/apt')
 
         if self.app.base_model.network.has_network:
             await run_curtin_command(
                 self.app, context, "in-target", "-t", target_mnt.p(),
                 "--", "apt-get", "update", private_mounts=True)
         else:
-            await _restore_dir('var/lib/apt/lists')
+            await self._restore_dir(target_mnt, 'var/lib/apt/lists')
 
         await self.cleanup()
         try:
@@ -14,6 +14,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import asyncio
+import copy
 import functools
 import glob
 import json
@@ -35,8 +36,9 @@ from subiquitycore.async_helpers import (
     TaskAlreadyRunningError,
     )
 from subiquitycore.context import with_context
+from subiquitycore.log import deferred
 from subiquitycore.utils import (
-    run_command,
+    arun_command,
     )
 from subiquitycore.lsb_release import lsb_release
 
@@ -49,6 +51,7 @@ from subiquity.common.filesystem import (
     boot,
     gaps,
     labels,
+    scenarios,
     sizes,
 )
 from subiquity.common.filesystem.manipulator import (
@@ -70,6 +73,8 @@ from subiquity.common.types import (
     ProbeStatus,
     ReformatDisk,
     StorageEncryptionSupport,
+    StoragePatch,
+    StoragePatchResponse,
     StorageResponse,
     StorageResponseV2,
     StorageSafety,
@@ -82,7 +87,6 @@ from subiquity.models.filesystem import (
     _Device,
     Disk as ModelDisk,
     LVM_CHUNK_SIZE,
-    Raid,
     )
 from subiquity.server.controller import (
     SubiquityController,
@@ -112,6 +116,81 @@ than GPT, which is not currently supported.
 """)
 
 
+# How long to wait for udev events to stop arriving before acting on them.
+UDEV_EVENT_WINDOW = 0.1
+
+
+def probe_timeout():
+    if platform.machine() == 'riscv64':
+        # block probing is taking much longer on RISC-V - but why?
+        return 60.0
+    else:
+        return 15.0
+
+
+# Probe types that describe how block devices are stacked or used. A device
+# mentioned in any of these cannot be re-probed on its own.
+_STACKING_PROBE_TYPES = (
+    'bcache', 'dmcrypt', 'lvm', 'mount', 'multipath', 'raid', 'zfs')
+
+# Values of ID_FS_TYPE for devices that are part of a stacked device.
+_MEMBER_FS_TYPES = {
+    'bcache', 'crypto_LUKS', 'linux_raid_member', 'LVM2_member',
+    'zfs_member'}
+
+
+def _strings_in(data):
+    if isinstance(data, str):
+        yield data
+    elif isinstance(data, dict):
+        for k, v in data.items():
+            yield from _strings_in(k)
+            yield from _strings_in(v)
+    elif isinstance(data, (list, tuple)):
+        for v in data:
+            yield from _strings_in(v)
+
+
+def can_merge_probe_data(probe_data, update, devnames):
+    """Whether update, from probing only the devices named in devnames, can
+    be merged into probe_data rather than probing everything again."""
+    names = set(devnames) | {os.path.basename(d) for d in devnames}
+    for ptype in _STACKING_PROBE_TYPES:
+        for s in _strings_in(probe_data.get(ptype)):
+            if s in names:
+                return False
+    for blockdev in probe_data['blockdev'], update.get('blockdev', {}):
+        for devname in devnames:
+            data = blockdev.get(devname)
+            if data is None:
+                continue
+            if data.get('ID_FS_TYPE') in _MEMBER_FS_TYPES:
+                return False
+            if 'DM_NAME' in data or data.get('DEVTYPE') not in (
+                    'disk', 'partition'):
+                return False
+            if devname.startswith('/dev/md'):
+                return False
+    return True
+
+
+def merge_probe_data(probe_data, update, devnames):
+    """Return a copy of probe_data with the data for the devices named in
+    devnames replaced by the data in update.
+
+    Devices that update has no data for have gone away and are dropped."""
+    merged = dict(probe_data)
+    for ptype, new in update.items():
+        section = {
+            devname: data
+            for devname, data in probe_data.get(ptype, {}).items()
+            if devname not in devnames
+            }
+        section.update(new)
+        merged[ptype] = section
+    return merged
+
+
 class NoSnapdSystemsOnSource(Exception):
     pass
 
@@ -135,6 +214,16 @@ class FilesystemController(SubiquityController, FilesystemManipulator):
             self.model.bootloader = getattr(Bootloader, name)
         self.model.storage_version = self.opts.storage_version
         self._monitor = None
+        self._udev_changes = set()
+        self._last_udev_event = None
+        self._udev_task = None
+        self._revalidate_task = None
+        # The model's generation just after it was loaded from the probe
+        # cache, and whether the cached data turned out to be out of date
+        # after the model had been changed. Storage cannot be configured
+        # until it has been probed again.
+        self._probe_cache_generation = None
+        self.probe_cache_stale = False
         self._errors = {}
         self._probe_once_task = SingleInstanceTask(
             self._probe_once, propagate_errors=False)
@@ -162,6 +251,12 @@ class FilesystemController(SubiquityController, FilesystemManipulator):
         self.ai_data = data
 
     async def configured(self):
+        if self._revalidate_task is not None:
+            await self._revalidate_task
+        if self.probe_cache_stale:
+            raise Exception(
+                "block devices changed after they were probed, storage "
+                "needs to be configured again")
         self._configured = True
         await super().configured()
         self.stop_listening_udev()
@@ -227,6 +322,9 @@ class FilesystemController(SubiquityController, FilesystemManipulator):
     async def apply_autoinstall_config(self, context=None):
         await self._start_task
         await self._probe_task.wait()
+        # Do not apply the layout to cached probe data that may be stale.
+        if self._revalidate_task is not None:
+            await self._revalidate_task
         await self._get_system_task.wait()
         if False in self._errors:
             raise self._errors[False][0]
@@ -415,7 +513,8 @@ class FilesystemController(SubiquityController, FilesystemManipulator):
             config=self.model._render_actions(mode=ActionRenderMode.ALL),
             blockdev=self.model._probe_data['blockdev'],
             dasd=self.model._probe_data.get('dasd', {}),
-            storage_version=self.model.storage_version)
+            storage_version=self.model.storage_version,
+            revision=self.model.revision)
 
     async def GET(self, wait: bool = False, use_cached_result: bool = False) \
             -> StorageResponse:
@@ -425,34 +524,51 @@ class FilesystemController(SubiquityController, FilesystemManipulator):
                 return probe_resp
         return self._done_response()
 
+    def GET_version(self):
+        # The responses to GET and v2_GET only change once probing is done
+        # if the model or the errors from probing change.
+        if self._probe_task.task is None or \
+           not self._probe_task.task.done():
+            return None
+        if self._get_system_task.task is None or \
+           not self._get_system_task.task.done():
+            return None
+        return (
+            self.model.generation,
+            self.model.storage_version,
+            [(restricted, report.ref())
+             for restricted, (exc, report) in sorted(self._errors.items())],
+            )
+
     async def POST(self, config: list):
-        log.debug(config)
+        log.debug("%s", deferred(config))
         self.model._actions = self.model._actions_from_config(
             config, self.model._probe_data['blockdev'], is_probe_data=False)
         await self.configured()
 
+    async def patch_POST(self, data: StoragePatch) -> StoragePatchResponse:
+        log.debug("%s", deferred(data))
+        if data.revision != self.model.revision:
+            log.debug(
+                "not applying patch against %s to %s", data.revision,
+                self.model.revision)
+            return StoragePatchResponse(
+                applied=False, revision=self.model.revision)
+        try:
+            self.model.apply_patch(data.delete, data.add, data.edit)
+        except ValueError as exc:
+            log.debug("not applying patch: %s", exc)
+            return StoragePatchResponse(
+                applied=False, revision=self.model.revision)
+        return StoragePatchResponse(
+            applied=True, revision=self.model.revision)
+
     def get_guided_disks(self, check_boot=True, with_reformatting=False):
-        disks = []
-        for raid in self.model._all(type='raid'):
-            if check_boot and not boot.can_be_boot_device(
-                    raid, with_reformatting=with_reformatting):
-                continue
-            disks.append(raid)
-        for disk in self.model._all(type='disk'):
-            if check_boot and not boot.can_be_boot_device(
-                    disk, with_reformatting=with_reformatting):
-                continue
-            cd = disk.constructed_device()
-            if isinstance(cd, Raid):
-                can_be_boot = False
-                for v in cd._subvolumes:
-                    if check_boot and boot.can_be_boot_device(
-                            v, with_reformatting=with_reformatting):
-                        can_be_boot = True
-                if can_be_boot:
-                    continue
-            disks.append(disk)
-        return disks
+        return [
+            d for d in scenarios.guided_devices(self.model)
+            if not check_boot or scenarios.can_be_guided_target(
+                d, with_reformatting=with_reformatting)
+            ]
 
     async def guided_GET(self, wait: bool = False) -> GuidedStorageResponse:
         probe_resp = await self._probe_response(wait, GuidedStorageResponse)
@@ -546,6 +662,7 @@ class FilesystemController(SubiquityController, FilesystemManipulator):
             self._device_to_structure[part] = structure
 
         disk._partitions.sort(key=lambda p: p.number)
+        self.model.generation += 1
 
     def _on_volumes(self) -> Dict[str, snapdapi.OnVolume]:
         # Return a value suitable for use as the 'on-volumes' part of a
@@ -653,6 +770,12 @@ class FilesystemController(SubiquityController, FilesystemManipulator):
     async def v2_GET(self, wait: bool = False) -> StorageResponseV2:
         return await self.get_v2_storage_response(self.model, wait)
 
+    def v2_GET_version(self):
+        version = self.GET_version()
+        if version is None:
+            return None
+        return version + (self.calculate_suggested_install_min(),)
+
     async def v2_POST(self) -> StorageResponseV2:
         await self.configured()
         return await self.v2_GET()
@@ -675,48 +798,11 @@ class FilesystemController(SubiquityController, FilesystemManipulator):
         if probe_resp is not None:
             return probe_resp
 
-        scenarios = []
-        install_min = self.calculate_suggested_install_min()
-
-        for disk in self.get_guided_disks(with_reformatting=True):
-            if disk.size >= install_min:
-                reformat = GuidedStorageTargetReformat(disk_id=disk.id)
-                scenarios.append((disk.size, reformat))
-
-        for disk in self.get_guided_disks(with_reformatting=False):
-            if len(disk.partitions()) < 1:
-                # On an empty disk, don't bother to offer it with UseGap, as
-                # it's basically the same as the Reformat case.
-                continue
-            gap = gaps.largest_gap(disk)
-            if gap is not None and gap.size >= install_min:
-                api_gap = labels.for_client(gap)
-                use_gap = GuidedStorageTargetUseGap(
-                        disk_id=disk.id,
-                        gap=api_gap)
-                scenarios.append((gap.size, use_gap))
-
-        for disk in self.get_guided_disks(check_boot=False):
-            part_align = disk.alignment_data().part_align
-            for partition in disk.partitions():
-                vals = sizes.calculate_guided_resize(
-                        partition.estimated_min_size, partition.size,
-                        install_min, part_align=part_align)
-                if vals is None:
-                    continue
-                if not boot.can_be_boot_device(
-                        disk, resize_partition=partition,
-                        with_reformatting=False):
-                    continue
-                resize = GuidedStorageTargetResize.from_recommendations(
-                        partition, vals)
-                scenarios.append((vals.install_max, resize))
-
-        scenarios.sort(reverse=True, key=lambda x: x[0])
         return GuidedStorageResponseV2(
                 status=ProbeStatus.DONE,
                 configured=self.model.guided_configuration,
-                possible=[s[1] for s in scenarios])
+                possible=scenarios.guided_scenarios(
+                    self.model, self.calculate_suggested_install_min()))
 
     async def v2_guided_POST(self, data: GuidedChoiceV2) \
             -> GuidedStorageResponseV2:
@@ -794,6 +880,12 @@ class FilesystemController(SubiquityController, FilesystemManipulator):
         self.partition_disk_handler(disk, spec, partition=partition)
         return await self.v2_GET()
 
+    def _full_probe_types(self):
+        probe_types = {'defaults', 'filesystem_sizing'}
+        if self.app.opts.use_os_prober:
+            probe_types |= {'os'}
+        return probe_types
+
     @with_context(name='probe_once', description='restricted={restricted}')
     async def _probe_once(self, *, context, restricted):
         if restricted:
@@ -801,28 +893,159 @@ class FilesystemController(SubiquityController, FilesystemManipulator):
             fname = 'probe-data-restricted.json'
             key = "ProbeDataRestricted"
         else:
-            probe_types = {'defaults', 'filesystem_sizing'}
-            if self.app.opts.use_os_prober:
-                probe_types |= {'os'}
+            probe_types = self._full_probe_types()
             fname = 'probe-data.json'
             key = "ProbeData"
+            # Take the fingerprint before probing so that a change while
+            # probing makes the cached data look stale, not vice versa.
+            fingerprint = await run_in_thread(
+                self.app.prober.storage_fingerprint)
         storage = await run_in_thread(
             self.app.prober.get_storage, probe_types)
+        if not restricted and not self._configured:
+            await run_in_thread(self._write_probe_cache, fingerprint, storage)
+        self._load_probe_data(storage, fname, key)
+
+    def _probe_cache_key(self, fingerprint):
+        return {
+            'fingerprint': fingerprint,
+            'probe_types': sorted(self._full_probe_types()),
+            }
+
+    def _read_probe_cache(self, fingerprint):
+        try:
+            with open(self.app.state_path('probe-cache.json')) as fp:
+                cache = json.load(fp)
+        except (OSError, ValueError):
+            return None
+        if cache.get('key') != self._probe_cache_key(fingerprint):
+            return None
+        return cache['storage']
+
+    def _write_probe_cache(self, fingerprint, storage):
+        cache = {
+            'key': self._probe_cache_key(fingerprint),
+            'storage': storage,
+            }
+        path = self.app.state_path('probe-cache.json')
+        with open(path + '.new', 'w') as fp:
+            json.dump(cache, fp)
+        os.rename(path + '.new', path)
+
+    def _remove_probe_cache(self):
+        try:
+            os.unlink(self.app.state_path('probe-cache.json'))
+        except FileNotFoundError:
+            pass
+
+    async def _probe_from_cache(self):
+        """Load probe data cached by an earlier run of the server, if the
+        block devices look the same as they did then.
+
+        A full probe is started in the background to check the cached data
+        and replace it if it turns out to be stale."""
+        fingerprint = await run_in_thread(self.app.prober.storage_fingerprint)
+        storage = self._read_probe_cache(fingerprint)
+        if storage is None:
+            return False
+        block_discover_log.debug("using cached probe data")
+        self._load_probe_data(
+            copy.deepcopy(storage), 'probe-data.json', "ProbeData")
+        self._probe_cache_generation = self.model.generation
+        self._revalidate_task = schedule_task(
+            self._revalidate_probe_cache(fingerprint, storage))
+        return True
+
+    async def _revalidate_probe_cache(self, fingerprint, cached):
+        try:
+            storage = await asyncio.wait_for(
+                run_in_thread(
+                    self.app.prober.get_storage, self._full_probe_types()),
+                probe_timeout())
+        except Exception:
+            block_discover_log.exception(
+                "block probing to revalidate cached probe data failed")
+            self._remove_probe_cache()
+            return
+        await run_in_thread(self._write_probe_cache, fingerprint, storage)
+        if storage == cached:
+            block_discover_log.debug("cached probe data is up to date")
+            return
+        if self.model.generation != self._probe_cache_generation:
+            # Reloading would throw away the changes made to the model
+            # since it was loaded from the cache.
+            block_discover_log.warning(
+                "cached probe data was stale but the model has been changed "
+                "since it was loaded, probing again")
+            self.probe_cache_stale = True
+            try:
+                self._probe_task.start_sync()
+            except TaskAlreadyRunningError:
+                pass
+            return
+        block_discover_log.debug("cached probe data was stale, reloading")
+        self._load_probe_data(storage, 'probe-data.json', "ProbeData")
+
+    def _load_probe_data(self, storage, fname, key):
         # It is possible for the user to submit filesystem config
         # while a probert probe is running. We don't want to overwrite
         # the users config with a blank one if this happens! (See
         # https://bugs.launchpad.net/bugs/1954848).
         if self._configured:
             return
+        self.probe_cache_stale = False
         fpath = os.path.join(self.app.block_log_dir, fname)
         with open(fpath, 'w') as fp:
             json.dump(storage, fp, indent=4)
         self.app.note_file_for_apport(key, fpath)
         self.model.load_probe_data(storage)
 
+    async def _probe_devices(self, devnames):
+        """Probe just the block devices named in devnames and merge the
+        results into the existing probe data.
+
+        Returns False if that is not possible and everything needs to be
+        probed again instead."""
+        probe_data = self.model._probe_data
+        if probe_data is None or None in devnames or self._errors:
+            return False
+        if self._probe_task.task is None or \
+           not self._probe_task.task.done():
+            return False
+        full_probe_types = self._full_probe_types()
+        # os-prober cannot be pointed at single devices, so if it is used
+        # it is run again over everything.
+        probe_types = full_probe_types - {'defaults', 'os'}
+        if 'defaults' in full_probe_types:
+            probe_types |= {'blockdev', 'filesystem'}
+        block_discover_log.debug("probing %s", sorted(devnames))
+        try:
+            update = await asyncio.wait_for(
+                run_in_thread(
+                    self.app.prober.get_storage_for_devices,
+                    devnames, probe_types),
+                probe_timeout())
+        except ValueError:
+            block_discover_log.exception("cannot probe %s", sorted(devnames))
+            return False
+        if not can_merge_probe_data(probe_data, update, devnames):
+            return False
+        merged = merge_probe_data(probe_data, update, devnames)
+        if 'os' in full_probe_types:
+            os_data = await asyncio.wait_for(
+                run_in_thread(self.app.prober.get_storage, {'os'}),
+                probe_timeout())
+            merged['os'] = os_data.get('os', {})
+        self._load_probe_data(merged, 'probe-data.json', "ProbeData")
+        return True
+
     @with_context()
     async def _probe(self, *, context=None):
         self._errors = {}
+        # Only the first probe by this server can come from the cache, later
+        # ones are run because something changed.
+        if self.model._probe_data is None and await self._probe_from_cache():
+            return
         for (restricted, kind) in [
                 (False, ErrorReportKind.BLOCK_PROBE_FAIL),
                 (True,  ErrorReportKind.DISK_PROBE_FAIL),
@@ -833,12 +1056,8 @@ class FilesystemController(SubiquityController, FilesystemManipulator):
                 # We wait on the task directly here, not
                 # self._probe_once_task.wait as if _probe_once_task
                 # gets cancelled, we should be cancelled too.
-                if platform.machine() == 'riscv64':
-                    # block probing is taking much longer on RISC-V - but why?
-                    timeout = 60.0
-                else:
-                    timeout = 15.0
-                await asyncio.wait_for(self._probe_once_task.task, timeout)
+                await asyncio.wait_for(
+                    self._probe_once_task.task, probe_timeout())
             except asyncio.CancelledError:
                 # asyncio.CancelledError is a subclass of Exception in
                 # Python 3.6 (sadface)
@@ -960,21 +1179,46 @@ class FilesystemController(SubiquityController, FilesystemManipulator):
         loop.remove_reader(self._monitor.fileno())
 
     def _udev_event(self):
-        cp = run_command(['udevadm', 'settle', '-t', '0'])
-        if cp.returncode != 0:
-            log.debug("waiting 0.1 to let udev event queue settle")
-            self.stop_listening_udev()
-            loop = asyncio.get_running_loop()
-            loop.call_later(0.1, self.start_listening_udev)
-            return
-        # Drain the udev events in the queue -- if we stopped listening to
-        # allow udev to settle, it's good bet there is more than one event to
-        # process and we don't want to kick off a full block probe for each
-        # one.  It's a touch unfortunate that pyudev doesn't have a
+        # Drain the udev events in the queue and leave acting on them to
+        # _process_udev_events, which waits for the events to stop arriving
+        # so that plugging in a device results in one probe, not one per
+        # event. It's a touch unfortunate that pyudev doesn't have a
         # non-blocking read so we resort to select().
         while select.select([self._monitor.fileno()], [], [], 0)[0]:
             action, dev = self._monitor.receive_device()
             log.debug("_udev_event %s %s", action, dev)
+            self._udev_changes.add(dev.get('DEVNAME'))
+        self._last_udev_event = asyncio.get_running_loop().time()
+        if self._udev_task is None or self._udev_task.done():
+            self._udev_task = schedule_task(self._process_udev_events())
+
+    async def _process_udev_events(self):
+        loop = asyncio.get_running_loop()
+        # Devices can change while we are probing the ones that changed
+        # before, so carry on until there is nothing left to look at.
+        while self._udev_changes:
+            delay = self._last_udev_event + UDEV_EVENT_WINDOW - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            cp = await arun_command(['udevadm', 'settle', '-t', '0'])
+            if cp.returncode != 0:
+                log.debug(
+                    "waiting %s to let udev event queue settle",
+                    UDEV_EVENT_WINDOW)
+                self._last_udev_event = loop.time()
+                continue
+            devnames, self._udev_changes = self._udev_changes, set()
+            await self._probe_udev_changes(devnames)
+
+    async def _probe_udev_changes(self, devnames):
+        try:
+            if await self._probe_devices(devnames):
+                log.debug('Probed %s on udev event', sorted(devnames))
+                return
+        except Exception:
+            block_discover_log.exception(
+                "probing %s failed, probing everything", devnames)
         try:
             self._probe_task.start_sync()
         except TaskAlreadyRunningError:
@@ -21,8 +21,9 @@ import os
 from pathlib import Path
 import re
 import shutil
+import subprocess
 import tempfile
-from typing import Any, Callable, Dict, List
+from typing import Any, Awaitable, Callable, Dict, List
 
 import attr
 import yaml
@@ -30,7 +31,7 @@ import yaml
 from subiquitycore.async_helpers import (
     run_in_thread,
     )
-from subiquitycore.context import with_context
+from subiquitycore.context import Status, with_context
 from subiquitycore.file_util import write_file, generate_config_yaml
 
 from subiquity.common.errorreport import ErrorReportKind
@@ -38,7 +39,7 @@ from subiquity.common.types import (
     ApplicationState,
     )
 from subiquity.journald import (
-    journald_listen,
+    journald_subscribe,
     )
 from subiquity.models.filesystem import ActionRenderMode
 from subiquity.server.controller import (
@@ -75,6 +76,73 @@ class TracebackExtractor:
             self.traceback.append(line)
 
 
+@attr.s(auto_attribs=True)
+class GraphStep:
+    """A step of the install, and what it needs and produces.
+
+    needs and produces are lists of names for things the steps share (the
+    apt configuration of the target, say). A step waits for all the steps
+    before it in the list passed to run_step_graph that produce something
+    it needs. A step can both need and produce something, which makes it
+    wait for the steps before it that produce the same thing.
+    """
+    name: str
+    run: Callable[..., Awaitable[Any]]
+    needs: List[str] = attr.Factory(list)
+    produces: List[str] = attr.Factory(list)
+
+
+async def run_step_graph(steps: List[GraphStep], *, context) -> None:
+    """Run steps, each as soon as the steps it depends on have finished.
+
+    Each step runs in a child of context named after it. Independent
+    steps run concurrently. If a step fails, no more steps are started,
+    the ones already running are left to finish (cancelling a step does
+    not stop a command it is running) and then the exception is raised.
+    """
+    producers: Dict[str, List[asyncio.Task]] = {}
+    tasks = []
+    failures = []
+
+    async def run(step, deps):
+        if deps:
+            await asyncio.gather(*deps)
+        if failures:
+            log.debug("not running step %s after a failure", step.name)
+            return
+        # Each step gets a context of its own so that how long it takes
+        # is recorded along with the rest of the install's timings.
+        try:
+            with context.child(step.name, "running " + step.name) as child:
+                await step.run(context=child)
+        except Exception as exc:
+            failures.append(exc)
+            raise
+        log.debug("step %s took %.3fs", step.name, child.duration)
+
+    try:
+        for step in steps:
+            deps = set()
+            for need in step.needs:
+                if need not in producers:
+                    raise ValueError(
+                        f"step {step.name} needs {need} but no step before "
+                        f"it produces it")
+                deps.update(producers[need])
+            task = asyncio.create_task(run(step, deps))
+            tasks.append(task)
+            for product in step.produces:
+                producers.setdefault(product, []).append(task)
+        await asyncio.gather(*tasks, return_exceptions=True)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    if failures:
+        raise failures[0]
+
+
 @attr.s(auto_attribs=True)
 class CurtinInstallStep:
     """Represents the parameters of a single invocation of curtin install."""
@@ -145,7 +213,8 @@ class InstallController(SubiquityController):
             asyncio.create_task(self.stop_unattended_upgrades())
 
     def start(self):
-        journald_listen([self.app.log_syslog_id], self.log_event)
+        journald_subscribe(
+            self.app.log_syslog_id, ['MESSAGE'], self.log_event)
         self.install_task = asyncio.create_task(self.install())
 
     def tpath(self, *path):
@@ -383,28 +452,50 @@ class InstallController(SubiquityController):
         description="final system configuration", level="INFO",
         childlevel="DEBUG")
     async def postinstall(self, *, context):
+        # Everything that runs apt in the target needs and produces "apt",
+        # so those steps run one after the other.
+        steps = [
+            GraphStep("autoinstall-user-data", self.write_autoinstall_config),
+            GraphStep("cloud-init", self.configure_cloud_init),
+            GraphStep(
+                "packages", self.install_target_packages,
+                produces=["apt"]),
+            ]
+        if self.model.drivers.do_install:
+            steps.append(GraphStep(
+                "drivers", self.install_drivers,
+                needs=["apt"], produces=["apt"]))
+        if self.model.network.has_network:
+            steps.append(GraphStep(
+                "updates", self.run_updates,
+                needs=["apt"], produces=["apt"]))
+        steps.append(GraphStep(
+            "restore-apt-config", self.restore_apt_config, needs=["apt"]))
+        await run_step_graph(steps, context=context)
+
+    async def write_autoinstall_config(self, *, context):
         autoinstall_path = os.path.join(
             self.app.root, 'var/log/installer/autoinstall-user-data')
         autoinstall_config = "#cloud-config\n" + yaml.dump(
             {"autoinstall": self.app.make_autoinstall()})
         write_file(autoinstall_path, autoinstall_config)
-        await self.configure_cloud_init(context=context)
+
+    async def install_target_packages(self, *, context):
         packages = await self.get_target_packages(context=context)
-        for package in packages:
-            await self.install_package(context=context, package=package)
-        if self.model.drivers.do_install:
-            with context.child(
-                    "ubuntu-drivers-install",
-                    "installing third-party drivers") as child:
-                ubuntu_drivers = self.app.controllers.Drivers.ubuntu_drivers
-                await ubuntu_drivers.install_drivers(root_dir=self.tpath(),
-                                                     context=child)
+        await self.install_packages(context=context, packages=packages)
 
-        if self.model.network.has_network:
-            self.app.update_state(ApplicationState.UU_RUNNING)
-            policy = self.model.updates.updates
-            await self.run_unattended_upgrades(context=context, policy=policy)
-        await self.restore_apt_config(context=context)
+    async def install_drivers(self, *, context):
+        with context.child(
+                "ubuntu-drivers-install",
+                "installing third-party drivers") as child:
+            ubuntu_drivers = self.app.controllers.Drivers.ubuntu_drivers
+            await ubuntu_drivers.install_drivers(root_dir=self.tpath(),
+                                                 context=child)
+
+    async def run_updates(self, *, context):
+        self.app.update_state(ApplicationState.UU_RUNNING)
+        policy = self.model.updates.updates
+        await self.run_unattended_upgrades(context=context, policy=policy)
 
     @with_context(description="configuring cloud-init")
     async def configure_cloud_init(self, context):
@@ -414,13 +505,58 @@ class InstallController(SubiquityController):
     async def get_target_packages(self, context):
         return await self.app.base_model.target_packages()
 
+    @with_context(description="installing extra packages")
+    async def install_packages(self, *, context, packages):
+        """Install packages in the target with a single curtin command.
+
+        Each package still gets a context of its own for progress
+        reporting. If the command fails, the packages are installed one at
+        a time, each in the context it already has, so that the failure is
+        reported against the package that caused it.
+        """
+        if len(packages) < 2:
+            for package in packages:
+                await self.install_package(context=context, package=package)
+            return
+        children = [
+            context.child("install_" + package, "installing " + package)
+            for package in packages
+            ]
+        for child in children:
+            child.enter()
+        try:
+            await self._system_install(context, *packages)
+        except subprocess.CalledProcessError:
+            log.warning(
+                "installing %s failed, installing one at a time", packages)
+        except BaseException as exc:
+            for child in children:
+                child.exit(str(exc), Status.FAIL)
+            raise
+        else:
+            for child in children:
+                child.exit()
+            return
+        for i, (child, package) in enumerate(zip(children, packages)):
+            try:
+                await self._system_install(child, package)
+            except BaseException as exc:
+                child.exit(str(exc), Status.FAIL)
+                for later in children[i + 1:]:
+                    later.exit("not installed", Status.FAIL)
+                raise
+            child.exit()
+
     @with_context(
         name="install_{package}",
         description="installing {package}")
     async def install_package(self, *, context, package):
+        await self._system_install(context, package)
+
+    async def _system_install(self, context, *packages):
         await run_curtin_command(
             self.app, context, 'system-install', '-t', self.tpath(),
-            '--', package,
+            '--', *packages,
             private_mounts=False)
 
     @with_context(description="restoring apt configuration")
@@ -218,6 +218,10 @@ class KeyboardController(SubiquityController):
             setting=for_ui(self.model.setting_for_lang(lang)),
             layouts=self.keyboard_list.layouts)
 
+    def GET_version(self):
+        lang = self.app.base_model.locale.selected_language
+        return (lang, self.model.setting_for_lang(lang))
+
     async def POST(self, data: KeyboardSetting):
         log.debug(data)
         new = latinizable(data.layout, data.variant)
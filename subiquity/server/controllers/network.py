@@ -14,6 +14,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import asyncio
+import collections
 import logging
 import os
 from typing import List, Optional
@@ -40,6 +41,8 @@ from subiquity.common.apidef import (
     )
 from subiquity.common.errorreport import ErrorReportKind
 from subiquity.common.types import (
+    LinkUpdate,
+    NetEventSubscriberStats,
     NetworkStatus,
     WLANSupportInstallState,
     )
@@ -87,6 +90,111 @@ NETPLAN_SCHEMA = {
     }
 
 
+class NetEventSubscriber:
+    """Send events to a client that subscribed to network updates.
+
+    Events are sent one request at a time, in the order they happened,
+    and at most one request is sent every min_interval seconds. Link
+    updates that are waiting to be sent together are coalesced, keeping
+    the latest state of each device, and sent in one update_links request.
+    """
+
+    min_interval = 0.1
+
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+        self.conn = aiohttp.UnixConnector(socket_path)
+        self.client = make_client_for_conn(NetEventAPI, self.conn)
+        # Each item is either a (meth_name, args) pair or a dict of
+        # device name to LinkUpdate.
+        self._queue = collections.deque()
+        self._wakeup = asyncio.Event()
+        self.queued = self.coalesced = self.sent = self.dropped = 0
+        self.requests = 0
+        self._task = asyncio.create_task(self._run())
+
+    @property
+    def depth(self):
+        return sum(
+            len(item) if isinstance(item, dict) else 1
+            for item in self._queue)
+
+    def stats(self) -> NetEventSubscriberStats:
+        return NetEventSubscriberStats(
+            socket_path=self.socket_path,
+            depth=self.depth,
+            queued=self.queued,
+            coalesced=self.coalesced,
+            sent=self.sent,
+            requests=self.requests,
+            dropped=self.dropped)
+
+    def call(self, meth_name, *args):
+        self.queued += 1
+        self._queue.append((meth_name, args))
+        self._wakeup.set()
+
+    def update_link(self, act, info):
+        self.queued += 1
+        if self._queue and isinstance(self._queue[-1], dict):
+            updates = self._queue[-1]
+        else:
+            updates = {}
+            self._queue.append(updates)
+        prev = updates.pop(info.name, None)
+        if prev is not None:
+            self.coalesced += 1
+            if prev.act == LinkAction.NEW and act == LinkAction.CHANGE:
+                # The client has not been told about the device yet.
+                act = LinkAction.NEW
+        updates[info.name] = LinkUpdate(act=act, info=info)
+        self._wakeup.set()
+
+    async def _send(self, item):
+        if isinstance(item, dict):
+            meth_name, args = "update_links", (list(item.values()),)
+        else:
+            meth_name, args = item
+        log.debug("sending %s to %s", meth_name, self.socket_path)
+        try:
+            await getattr(self.client, meth_name).POST(*args)
+        except Exception:
+            # Whatever went wrong, carry on with the rest of the events.
+            log.exception(
+                "call to %s on %s failed", meth_name, self.socket_path)
+            return False
+        return True
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._queue:
+                item = self._queue.popleft()
+                count = len(item) if isinstance(item, dict) else 1
+                try:
+                    ok = await self._send(item)
+                except asyncio.CancelledError:
+                    self.dropped += count
+                    raise
+                self.requests += 1
+                if ok:
+                    self.sent += count
+                else:
+                    self.dropped += count
+                await asyncio.sleep(self.min_interval)
+
+    async def close(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self.dropped += self.depth
+        self._queue.clear()
+        await self.conn.close()
+
+
 class NetworkController(BaseNetworkController, SubiquityController):
 
     endpoint = API.network
@@ -110,7 +218,7 @@ class NetworkController(BaseNetworkController, SubiquityController):
         super().__init__(app)
         app.note_file_for_apport("NetplanConfig", self.netplan_path)
         self.view_shown = False
-        self.clients = {}
+        self.subscribers = {}
         self.install_wpasupplicant_task = None
         self.pending_wlan_devices = set()
 
@@ -140,7 +248,7 @@ class NetworkController(BaseNetworkController, SubiquityController):
         else:
             r = await self._really_install_wpasupplicant()
         log.debug("wlan_support_install_finished %s", r)
-        self._call_clients("wlan_support_install_finished", r)
+        self._call_subscribers("wlan_support_install_finished", r)
         if r == WLANSupportInstallState.DONE:
             for dev in self.pending_wlan_devices:
                 self._send_update(LinkAction.NEW, dev)
@@ -296,64 +404,52 @@ class NetworkController(BaseNetworkController, SubiquityController):
             ips.extend(map(str, dev.actual_global_ip_addresses))
         return ips
 
+    async def subscription_GET(self) -> List[NetEventSubscriberStats]:
+        return [sub.stats() for sub in self.subscribers.values()]
+
     async def subscription_PUT(self, socket_path: str) -> None:
         log.debug('added subscription %s', socket_path)
-        conn = aiohttp.UnixConnector(socket_path)
-        client = make_client_for_conn(NetEventAPI, conn)
-        lock = asyncio.Lock()
-        self.clients[socket_path] = (client, conn, lock)
-        asyncio.create_task(
-            self._call_client(
-                client, conn, lock, "route_watch",
-                self.network_event_receiver.default_routes))
+        sub = NetEventSubscriber(socket_path)
+        self.subscribers[socket_path] = sub
+        sub.call("route_watch", self.network_event_receiver.default_routes)
 
     async def subscription_DELETE(self, socket_path: str) -> None:
-        if socket_path not in self.clients:
+        if socket_path not in self.subscribers:
             return
         log.debug('removed subscription %s', socket_path)
-        client, conn, lock = self.clients.pop(socket_path)
-        async with lock:
-            await conn.close()
-
-    async def _call_client(self, client, conn, lock, meth_name, *args):
-        async with lock:
-            log.debug("_call_client %s %s", meth_name, conn.path)
-            if conn.closed:
-                log.debug('closed')
-                return
-            try:
-                await getattr(client, meth_name).POST(*args)
-            except aiohttp.ClientError:
-                log.exception("call to %s on %s failed", meth_name, conn.path)
+        sub = self.subscribers.pop(socket_path)
+        await sub.close()
+        log.debug("subscription %s closed: %s", socket_path, sub.stats())
 
-    def _call_clients(self, meth_name, *args):
-        for client, conn, lock in self.clients.values():
-            log.debug('creating _call_client task %s %s', conn.path, meth_name)
-            asyncio.create_task(
-                self._call_client(client, conn, lock, meth_name, *args))
+    def _call_subscribers(self, meth_name, *args):
+        for sub in self.subscribers.values():
+            sub.call(meth_name, *args)
 
     def apply_starting(self):
         super().apply_starting()
-        self._call_clients("apply_starting")
+        self._call_subscribers("apply_starting")
 
     def apply_stopping(self):
         super().apply_stopping()
-        self._call_clients("apply_stopping")
+        self._call_subscribers("apply_stopping")
 
     def apply_error(self, stage):
         super().apply_error(stage)
-        self._call_clients("apply_error", stage)
+        self._call_subscribers("apply_error", stage)
 
     def update_default_routes(self, routes):
         super().update_default_routes(routes)
-        self._call_clients("route_watch", routes)
+        self._call_subscribers("route_watch", routes)
 
     def _send_update(self, act, dev):
+        if not self.subscribers:
+            return
         with self.context.child(
                 "_send_update", "{} {}".format(act.name, dev.name)):
             log.debug("dev_info {} {}".format(dev.name, dev.config))
             dev_info = dev.netdev_info()
-            self._call_clients("update_link", act, dev_info)
+            for sub in self.subscribers.values():
+                sub.update_link(act, dev_info)
 
     def new_link(self, dev):
         super().new_link(dev)
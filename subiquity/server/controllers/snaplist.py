@@ -48,10 +48,15 @@ class SnapListFetchError(Exception):
 
 class SnapdSnapInfoLoader:
 
-    def __init__(self, model, snapd, store_section, context):
+    # How many snaps to fetch the details of at once.
+    DEFAULT_MAX_CONCURRENT_FETCHES = 4
+
+    def __init__(self, model, snapd, store_section, context,
+                 max_concurrent_fetches=DEFAULT_MAX_CONCURRENT_FETCHES):
         self.model = model
         self.store_section = store_section
         self.context = context
+        self.max_concurrent_fetches = max_concurrent_fetches
 
         self.main_task = None
 
@@ -99,11 +104,20 @@ class SnapdSnapInfoLoader:
                 return
             self.pending_snaps = self.model.get_snap_list()
             log.debug("fetched list of %s snaps", len(self.pending_snaps))
-            while self.pending_snaps:
-                snap = self.pending_snaps.pop(0)
-                task = self.tasks[snap] = schedule_task(
-                    self._fetch_info_for_snap(snap=snap))
-                await task
+            await asyncio.gather(*[
+                self._fetch_pending_snaps()
+                for _ in range(self.max_concurrent_fetches)
+                ])
+
+    async def _fetch_pending_snaps(self):
+        # One of the workers started by _start. Snaps asked for by
+        # get_snap_info_task are removed from pending_snaps, so a worker
+        # never fetches a snap twice.
+        while self.pending_snaps:
+            snap = self.pending_snaps.pop(0)
+            task = self.tasks[snap] = schedule_task(
+                self._fetch_info_for_snap(snap=snap))
+            await task
 
     @with_context(name="list")
     async def _load_list(self, context=None):
@@ -117,6 +131,10 @@ class SnapdSnapInfoLoader:
     def stop(self):
         if self.main_task is not None:
             self.main_task.cancel()
+        self.pending_snaps = []
+        for snap, task in self.tasks.items():
+            if snap is not None and not task.done():
+                task.cancel()
 
     @with_context(name="fetch/{snap.name}")
     async def _fetch_info_for_snap(self, snap, context=None):
@@ -132,6 +150,8 @@ class SnapdSnapInfoLoader:
         return self.tasks[None]
 
     def get_snap_info_task(self, snap):
+        # A snap the client is waiting for jumps the queue: its fetch starts
+        # straight away rather than waiting for a worker to be free.
         if snap not in self.tasks:
             if snap in self.pending_snaps:
                 self.pending_snaps.remove(snap)
@@ -233,6 +253,16 @@ class SnapListController(SubiquityController):
             snaps=self.model.get_snap_list(),
             selections=self.model.selections)
 
+    def GET_version(self):
+        # Only the complete list is worth caching: the FAILED and LOADING
+        # responses are small and may change without the model changing.
+        if self.loader.fetch_list_failed() \
+                or not self.app.base_model.network.has_network:
+            return None
+        if not self.loader.fetch_list_completed():
+            return None
+        return (id(self.loader), self.model.generation)
+
     async def POST(self, data: List[SnapSelection]):
         log.debug(data)
         self.model.set_installed_list(data)
@@ -240,5 +270,16 @@ class SnapListController(SubiquityController):
 
     async def snap_info_GET(self, snap_name: str) -> SnapInfo:
         snap = self.model._snap_for_name(snap_name)
-        await self.loader.get_snap_info_task(snap)
+        # If the loader gets restarted while we wait, ask the new one.
+        while True:
+            loader = self.loader
+            task = loader.get_snap_info_task(snap)
+            try:
+                await asyncio.shield(task)
+            except asyncio.CancelledError:
+                if not task.cancelled() or self.loader is loader:
+                    raise
+                log.warn("snap info task was cancelled, retrying...")
+            else:
+                break
         return snap
@@ -13,7 +13,13 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import asyncio
 import copy
+import functools
+import os
+import shutil
+import tempfile
+import time
 from unittest import mock, TestCase, IsolatedAsyncioTestCase
 import uuid
 
@@ -31,6 +37,7 @@ from subiquity.common.types import (
     GuidedStorageTargetResize,
     GuidedStorageTargetUseGap,
     ProbeStatus,
+    StoragePatch,
     )
 from subiquity.models.tests.test_filesystem import (
     make_disk,
@@ -38,7 +45,11 @@ from subiquity.models.tests.test_filesystem import (
     make_partition,
     )
 from subiquity.server import snapdapi
-from subiquity.server.controllers.filesystem import FilesystemController
+from subiquity.server.controllers.filesystem import (
+    can_merge_probe_data,
+    FilesystemController,
+    merge_probe_data,
+    )
 from subiquity.server.dryrun import DRConfig
 
 bootloaders = [(bl, ) for bl in list(Bootloader)]
@@ -74,6 +85,290 @@ class TestSubiquityControllerFilesystem(IsolatedAsyncioTestCase):
         actual = self.app.prober.get_storage.call_args.args[0]
         self.assertTrue({'defaults', 'os'} <= actual)
 
+    async def test_patch(self):
+        model = self.fsc.model = make_model()
+        model._probe_data = {'blockdev': {}}
+        disk = make_disk(model, preserve=True, ptable='gpt', serial='s')
+        path = disk.path
+        revision = model.revision
+        resp = await self.fsc.patch_POST(StoragePatch(
+            revision=revision,
+            edit=[{'id': disk.id, 'type': 'disk', 'wipe': 'superblock'}]))
+        self.assertTrue(resp.applied)
+        self.assertEqual(resp.revision, model.revision)
+        self.assertNotEqual(resp.revision, revision)
+        self.assertEqual(disk.wipe, 'superblock')
+        # The fields not in the edit are left alone.
+        self.assertTrue(disk.preserve)
+        self.assertEqual(disk.ptable, 'gpt')
+        self.assertEqual(disk.serial, 's')
+        self.assertEqual(disk.path, path)
+
+    async def test_patch_invalid(self):
+        model = self.fsc.model = make_model()
+        model._probe_data = {'blockdev': {}}
+        revision = model.revision
+        resp = await self.fsc.patch_POST(StoragePatch(
+            revision=revision,
+            add=[{'id': 'disk-x', 'type': 'disk', 'path': '/dev/x'}]))
+        self.assertFalse(resp.applied)
+        self.assertEqual(resp.revision, revision)
+        self.assertEqual(model._all(type='disk'), [])
+
+    async def test_patch_stale(self):
+        model = self.fsc.model = make_model()
+        disk = make_disk(model, preserve=True)
+        revision = model.revision
+        disk.wipe = 'superblock'
+        resp = await self.fsc.patch_POST(StoragePatch(
+            revision=revision,
+            edit=[{'id': disk.id, 'type': 'disk', 'wipe': None}]))
+        self.assertFalse(resp.applied)
+        self.assertEqual(resp.revision, model.revision)
+        self.assertEqual(disk.wipe, 'superblock')
+
+
+class TestMergeProbeData(TestCase):
+
+    def blockdev(self, devtype='disk', **props):
+        return dict(DEVTYPE=devtype, attrs={'size': '1000'}, **props)
+
+    def test_merge(self):
+        probe_data = {
+            'blockdev': {
+                '/dev/sda': self.blockdev(),
+                '/dev/sdb': self.blockdev(),
+                '/dev/sdb1': self.blockdev('partition'),
+                },
+            'filesystem': {'/dev/sdb1': {'TYPE': 'ext4'}},
+            'raid': {},
+            }
+        update = {
+            'blockdev': {'/dev/sdc': self.blockdev()},
+            'filesystem': {},
+            }
+        devnames = {'/dev/sdb', '/dev/sdb1', '/dev/sdc'}
+        self.assertTrue(can_merge_probe_data(probe_data, update, devnames))
+        merged = merge_probe_data(probe_data, update, devnames)
+        self.assertEqual(
+            merged['blockdev'].keys(), {'/dev/sda', '/dev/sdc'})
+        self.assertEqual(merged['filesystem'], {})
+        self.assertEqual(merged['raid'], {})
+        self.assertEqual(len(probe_data['blockdev']), 3)
+
+    def test_cannot_merge_stacked(self):
+        probe_data = {
+            'blockdev': {'/dev/sda': self.blockdev()},
+            'raid': {'/dev/md0': {'devices': ['/dev/sda']}},
+            }
+        update = {'blockdev': {'/dev/sda': self.blockdev()}}
+        self.assertFalse(
+            can_merge_probe_data(probe_data, update, {'/dev/sda'}))
+
+    def test_cannot_merge_member(self):
+        probe_data = {'blockdev': {}}
+        update = {
+            'blockdev': {
+                '/dev/sda': self.blockdev(ID_FS_TYPE='LVM2_member'),
+                },
+            }
+        self.assertFalse(
+            can_merge_probe_data(probe_data, update, {'/dev/sda'}))
+
+    def test_cannot_merge_dm(self):
+        probe_data = {'blockdev': {}}
+        update = {'blockdev': {'/dev/dm-0': self.blockdev(DM_NAME='x')}}
+        self.assertFalse(
+            can_merge_probe_data(probe_data, update, {'/dev/dm-0'}))
+
+
+class TestProbeDevices(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.app = make_app()
+        self.app.opts.bootloader = 'UEFI'
+        self.app.report_start_event = mock.Mock()
+        self.app.report_finish_event = mock.Mock()
+        self.app.opts.use_os_prober = False
+        self.app.prober = mock.Mock()
+        self.app.block_log_dir = '/inexistent'
+        self.fsc = FilesystemController(app=self.app)
+        self.fsc._probe_task.task = mock.Mock()
+        self.fsc._probe_task.task.done.return_value = True
+        self.fsc.model._probe_data = {
+            'blockdev': {'/dev/sda': {'DEVTYPE': 'disk'}},
+            'filesystem': {},
+            }
+        self.fsc._load_probe_data = mock.Mock()
+
+    async def test_probe_devices(self):
+        update = {
+            'blockdev': {'/dev/sdb': {'DEVTYPE': 'disk'}},
+            'filesystem': {},
+            }
+        self.app.prober.get_storage_for_devices.return_value = update
+        self.assertTrue(await self.fsc._probe_devices({'/dev/sdb'}))
+        self.app.prober.get_storage_for_devices.assert_called_with(
+            {'/dev/sdb'}, {'blockdev', 'filesystem', 'filesystem_sizing'})
+        self.app.prober.get_storage.assert_not_called()
+        storage = self.fsc._load_probe_data.call_args.args[0]
+        self.assertEqual(storage['blockdev'].keys(), {'/dev/sda', '/dev/sdb'})
+
+    async def test_probe_devices_os(self):
+        self.app.opts.use_os_prober = True
+        self.fsc.model._probe_data['os'] = {'/dev/sda1': {'long': 'old'}}
+        self.app.prober.get_storage_for_devices.return_value = {
+            'blockdev': {'/dev/sdb': {'DEVTYPE': 'disk'}},
+            'filesystem': {},
+            }
+        os_data = {'/dev/sdb1': {'long': 'new'}}
+        self.app.prober.get_storage.return_value = {'os': os_data}
+        self.assertTrue(await self.fsc._probe_devices({'/dev/sdb'}))
+        self.app.prober.get_storage_for_devices.assert_called_with(
+            {'/dev/sdb'}, {'blockdev', 'filesystem', 'filesystem_sizing'})
+        self.app.prober.get_storage.assert_called_with({'os'})
+        storage = self.fsc._load_probe_data.call_args.args[0]
+        self.assertEqual(storage['os'], os_data)
+
+    async def test_probe_devices_unsupported_type(self):
+        self.app.prober.get_storage_for_devices.side_effect = ValueError
+        self.assertFalse(await self.fsc._probe_devices({'/dev/sdb'}))
+        self.fsc._load_probe_data.assert_not_called()
+
+    async def test_probe_devices_unknown_device(self):
+        self.assertFalse(await self.fsc._probe_devices({None}))
+        self.app.prober.get_storage_for_devices.assert_not_called()
+
+    async def test_probe_devices_after_error(self):
+        self.fsc._errors[False] = (Exception(), mock.Mock())
+        self.assertFalse(await self.fsc._probe_devices({'/dev/sdb'}))
+        self.app.prober.get_storage_for_devices.assert_not_called()
+
+    def start_udev_processing(self, devnames):
+        self.fsc._udev_changes = set(devnames)
+        self.fsc._last_udev_event = asyncio.get_running_loop().time() - 1
+        p = mock.patch(
+            'subiquity.server.controllers.filesystem.arun_command',
+            mock.AsyncMock(return_value=mock.Mock(returncode=0)))
+        p.start()
+        self.addCleanup(p.stop)
+        return self.fsc._process_udev_events()
+
+    async def test_changes_while_probing_are_probed(self):
+        probed = []
+
+        async def probe_devices(devnames):
+            probed.append(devnames)
+            if len(probed) == 1:
+                self.fsc._udev_changes.add('/dev/sdc')
+            return True
+
+        self.fsc._probe_devices = probe_devices
+        await self.start_udev_processing({'/dev/sdb'})
+        self.assertEqual(probed, [{'/dev/sdb'}, {'/dev/sdc'}])
+        self.assertEqual(self.fsc._udev_changes, set())
+
+    async def test_probe_devices_timeout(self):
+        self.app.prober.get_storage_for_devices.side_effect = \
+            lambda *args: time.sleep(0.2)
+        self.fsc._probe_task.start_sync = mock.Mock()
+        with mock.patch(
+                'subiquity.server.controllers.filesystem.probe_timeout',
+                return_value=0.01):
+            await self.start_udev_processing({'/dev/sdb'})
+        self.fsc._load_probe_data.assert_not_called()
+        self.fsc._probe_task.start_sync.assert_called_once_with()
+
+
+class TestProbeCache(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.app = make_app()
+        self.app.opts.bootloader = 'UEFI'
+        self.app.opts.use_os_prober = False
+        self.app.report_start_event = mock.Mock()
+        self.app.report_finish_event = mock.Mock()
+        self.app.prober = mock.Mock()
+        self.app.prober.storage_fingerprint.return_value = 'fingerprint'
+        tdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tdir)
+        self.app.state_path = functools.partial(os.path.join, tdir)
+        self.fsc = FilesystemController(app=self.app)
+        self.fsc._load_probe_data = mock.Mock()
+
+    async def test_probe_writes_cache(self):
+        storage = {'blockdev': {}}
+        self.app.prober.get_storage.return_value = storage
+        await self.fsc._probe_once(context=None, restricted=False)
+        self.assertEqual(self.fsc._read_probe_cache('fingerprint'), storage)
+        self.assertIsNone(self.fsc._read_probe_cache('other'))
+
+    async def test_restricted_probe_not_cached(self):
+        self.app.prober.get_storage.return_value = {'blockdev': {}}
+        await self.fsc._probe_once(context=None, restricted=True)
+        self.assertIsNone(self.fsc._read_probe_cache('fingerprint'))
+
+    async def test_probe_types_in_key(self):
+        self.fsc._write_probe_cache('fingerprint', {'blockdev': {}})
+        self.app.opts.use_os_prober = True
+        self.assertIsNone(self.fsc._read_probe_cache('fingerprint'))
+
+    async def test_probe_from_cache(self):
+        cached = {'blockdev': {'/dev/sda': {}}}
+        fresh = {'blockdev': {'/dev/sdb': {}}}
+        self.fsc._write_probe_cache('fingerprint', cached)
+        self.app.prober.get_storage.return_value = fresh
+        self.assertTrue(await self.fsc._probe_from_cache())
+        self.fsc._load_probe_data.assert_called_once_with(
+            cached, 'probe-data.json', "ProbeData")
+        await self.fsc._revalidate_task
+        self.fsc._load_probe_data.assert_called_with(
+            fresh, 'probe-data.json', "ProbeData")
+        self.assertEqual(self.fsc._read_probe_cache('fingerprint'), fresh)
+
+    async def test_probe_from_cache_miss(self):
+        self.assertFalse(await self.fsc._probe_from_cache())
+        self.fsc._load_probe_data.assert_not_called()
+
+    async def test_revalidate_failure_removes_cache(self):
+        self.fsc._write_probe_cache('fingerprint', {'blockdev': {}})
+        self.app.prober.get_storage.side_effect = Exception('boom')
+        self.assertTrue(await self.fsc._probe_from_cache())
+        await self.fsc._revalidate_task
+        self.assertIsNone(self.fsc._read_probe_cache('fingerprint'))
+
+    async def test_revalidate_timeout_removes_cache(self):
+        self.fsc._write_probe_cache('fingerprint', {'blockdev': {}})
+        self.app.prober.get_storage.side_effect = \
+            lambda *args: time.sleep(0.2)
+        with mock.patch(
+                'subiquity.server.controllers.filesystem.probe_timeout',
+                return_value=0.01):
+            self.assertTrue(await self.fsc._probe_from_cache())
+            await self.fsc._revalidate_task
+        self.assertIsNone(self.fsc._read_probe_cache('fingerprint'))
+
+    async def test_stale_cache_not_reloaded_over_changes(self):
+        cached = {'blockdev': {'/dev/sda': {}}}
+        fresh = {'blockdev': {'/dev/sdb': {}}}
+        self.fsc._write_probe_cache('fingerprint', cached)
+        self.app.prober.get_storage.return_value = fresh
+        self.fsc._probe_task.start_sync = mock.Mock()
+        self.fsc.model.generation = 1
+        self.assertTrue(await self.fsc._probe_from_cache())
+        self.fsc.model.generation = 2
+        await self.fsc._revalidate_task
+        self.fsc._load_probe_data.assert_called_once_with(
+            cached, 'probe-data.json', "ProbeData")
+        self.assertTrue(self.fsc.probe_cache_stale)
+        self.assertEqual(self.fsc._read_probe_cache('fingerprint'), fresh)
+        # Storage is probed again and cannot be configured until it has
+        # been.
+        self.fsc._probe_task.start_sync.assert_called_once_with()
+        with self.assertRaises(Exception):
+            await self.fsc.configured()
+        self.assertFalse(self.fsc._configured)
+
 
 class TestGuided(TestCase):
     boot_expectations = [
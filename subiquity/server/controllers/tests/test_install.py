@@ -13,15 +13,20 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import asyncio
 from pathlib import Path
+import subprocess
 import unittest
-from unittest.mock import ANY, Mock, mock_open, patch
+from unittest.mock import ANY, call, Mock, mock_open, patch
 
 from subiquity.server.controllers.install import (
     InstallController,
     CurtinInstallStep,
+    GraphStep,
+    run_step_graph,
     )
 
+from subiquitycore.context import Context, Status
 from subiquitycore.tests.mocks import make_app
 
 
@@ -112,3 +117,150 @@ class TestWriteConfig(unittest.IsolatedAsyncioTestCase):
                          "/error-partitioning.tar")
         self.assertEqual(config["install"]["resume_data"],
                          "/resume-data.json")
+
+
+class TestInstallPackages(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.controller = InstallController(make_app())
+        self.controller.model.target = "/target"
+        self.app = self.controller.app
+        self.app.report_start_event = Mock()
+        self.app.report_finish_event = Mock()
+
+    def finished(self, name):
+        return [
+            c.args[2] for c in self.app.report_finish_event.call_args_list
+            if c.args[0].name == name
+            ]
+
+    @patch("subiquity.server.controllers.install.run_curtin_command")
+    async def test_one_command(self, run_cmd):
+        await self.controller.install_packages(packages=["a", "b", "c"])
+        run_cmd.assert_called_once_with(
+            self.app, ANY, "system-install", "-t", "/target",
+            "--", "a", "b", "c", private_mounts=False)
+        for package in "a", "b", "c":
+            self.assertEqual(
+                self.finished("install_" + package), [Status.SUCCESS])
+
+    @patch("subiquity.server.controllers.install.run_curtin_command")
+    async def test_no_packages(self, run_cmd):
+        await self.controller.install_packages(packages=[])
+        run_cmd.assert_not_called()
+
+    @patch("subiquity.server.controllers.install.run_curtin_command")
+    async def test_failure_falls_back_to_one_at_a_time(self, run_cmd):
+        def run(app, context, *args, private_mounts):
+            if "b" in args:
+                raise subprocess.CalledProcessError(1, args)
+        run_cmd.side_effect = run
+
+        with self.assertRaises(subprocess.CalledProcessError):
+            await self.controller.install_packages(packages=["a", "b", "c"])
+
+        self.assertEqual(run_cmd.call_args_list, [
+            call(self.app, ANY, "system-install", "-t", "/target",
+                 "--", "a", "b", "c", private_mounts=False),
+            call(self.app, ANY, "system-install", "-t", "/target",
+                 "--", "a", private_mounts=False),
+            call(self.app, ANY, "system-install", "-t", "/target",
+                 "--", "b", private_mounts=False),
+            ])
+        # Each package is only reported once, by the context it was given
+        # for the batch.
+        self.assertEqual(self.finished("install_a"), [Status.SUCCESS])
+        self.assertEqual(self.finished("install_b"), [Status.FAIL])
+        self.assertEqual(self.finished("install_c"), [Status.FAIL])
+        started = [
+            c.args[0].name for c in self.app.report_start_event.call_args_list
+            ]
+        self.assertEqual(
+            started, ["install_packages", "install_a", "install_b",
+                      "install_c"])
+
+
+class TestRunStepGraph(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.log = []
+        self.events = {}
+        self.app = Mock()
+        self.context = Context.new(self.app)
+
+    def step(self, name, wait_for=None, fail=False, **kw):
+        self.events[name] = asyncio.Event()
+
+        async def run(*, context):
+            self.assertEqual(context.name, name)
+            self.log.append(('start', name))
+            if wait_for is not None:
+                await self.events[wait_for].wait()
+            await asyncio.sleep(0)
+            if fail:
+                raise Exception(name)
+            self.log.append(('finish', name))
+            self.events[name].set()
+
+        return GraphStep(name, run, **kw)
+
+    async def test_independent_steps_overlap(self):
+        # b would wait for ever for c if the steps ran in order.
+        await run_step_graph([
+            self.step('a'),
+            self.step('b', wait_for='c'),
+            self.step('c'),
+            ], context=self.context)
+        self.assertEqual(
+            [name for what, name in self.log if what == 'start'],
+            ['a', 'b', 'c'])
+        self.assertEqual(len(self.log), 6)
+
+    async def test_step_contexts(self):
+        await run_step_graph([
+            self.step('a'),
+            self.step('b'),
+            ], context=self.context)
+        finished = [
+            c.args[0] for c in self.app.report_finish_event.call_args_list]
+        self.assertEqual([c.name for c in finished], ['a', 'b'])
+        for c in finished:
+            self.assertIs(c.parent, self.context)
+            self.assertIsNotNone(c.duration)
+
+    async def test_needs_waits_for_all_producers(self):
+        await run_step_graph([
+            self.step('a', produces=['x']),
+            self.step('b', needs=['x'], produces=['x']),
+            self.step('c', produces=['y']),
+            self.step('d', needs=['x', 'y']),
+            ], context=self.context)
+        self.assertLess(
+            self.log.index(('finish', 'a')), self.log.index(('start', 'b')))
+        self.assertLess(
+            self.log.index(('finish', 'b')), self.log.index(('start', 'd')))
+        self.assertLess(
+            self.log.index(('finish', 'c')), self.log.index(('start', 'd')))
+
+    async def test_failure_lets_running_steps_finish(self):
+        with self.assertRaisesRegex(Exception, 'a'):
+            await run_step_graph([
+                self.step('a', fail=True, produces=['x']),
+                self.step('b', needs=['x']),
+                self.step('c', wait_for='d'),
+                self.step('d', produces=['y']),
+                self.step('e', needs=['y']),
+                ], context=self.context)
+        self.assertIn(('finish', 'c'), self.log)
+        self.assertIn(('finish', 'd'), self.log)
+        # No step is started after one has failed.
+        self.assertNotIn(('start', 'b'), self.log)
+        self.assertNotIn(('start', 'e'), self.log)
+
+    async def test_unproduced_need(self):
+        with self.assertRaises(ValueError):
+            await run_step_graph([
+                self.step('a'),
+                self.step('b', needs=['x']),
+                self.step('c', produces=['x']),
+                ], context=self.context)
+        self.assertEqual(self.log, [])
@@ -0,0 +1,135 @@
+# Copyright 2023 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import types
+import unittest
+from unittest import mock
+
+import aiohttp
+
+from subiquity.common.types import LinkAction, LinkUpdate
+from subiquity.server.controllers.network import NetEventSubscriber
+
+
+class FakeClient:
+
+    def __init__(self):
+        self.calls = []
+        # An exception for each call to raise, if not None.
+        self.fail = None
+        self.release = asyncio.Event()
+        self.release.set()
+
+    def __getattr__(self, meth_name):
+        async def POST(*args):
+            self.calls.append((meth_name,) + args)
+            await self.release.wait()
+            if self.fail is not None:
+                raise self.fail
+        return types.SimpleNamespace(POST=POST)
+
+
+def dev(name, state='up'):
+    return types.SimpleNamespace(name=name, state=state)
+
+
+class TestNetEventSubscriber(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.client = FakeClient()
+        p = mock.patch(
+            'subiquity.server.controllers.network.make_client_for_conn',
+            return_value=self.client)
+        p.start()
+        self.addCleanup(p.stop)
+        self.sub = NetEventSubscriber('/tmp/does-not-exist')
+        self.sub.min_interval = 0
+
+    async def asyncTearDown(self):
+        await self.sub.close()
+
+    async def settle(self):
+        for _ in range(5):
+            await asyncio.sleep(0)
+
+    async def test_coalesce_link_updates(self):
+        # Hold up the first request so that the rest queue up behind it.
+        self.client.release.clear()
+        self.sub.call("apply_starting")
+        await self.settle()
+        a1, a2, b1, b2, b3 = dev('a', 1), dev('a', 2), dev('b', 1), \
+            dev('b', 2), dev('b', 3)
+        self.sub.update_link(LinkAction.NEW, a1)
+        self.sub.update_link(LinkAction.CHANGE, b1)
+        self.sub.update_link(LinkAction.CHANGE, a2)
+        self.sub.update_link(LinkAction.CHANGE, b2)
+        self.sub.call("apply_stopping")
+        self.sub.update_link(LinkAction.DEL, b3)
+        self.assertEqual(self.sub.depth, 4)
+        self.client.release.set()
+        await self.settle()
+        self.assertEqual(self.client.calls, [
+            ("apply_starting",),
+            ("update_links", [
+                LinkUpdate(act=LinkAction.NEW, info=a2),
+                LinkUpdate(act=LinkAction.CHANGE, info=b2),
+                ]),
+            ("apply_stopping",),
+            ("update_links", [LinkUpdate(act=LinkAction.DEL, info=b3)]),
+            ])
+        stats = self.sub.stats()
+        self.assertEqual(
+            (stats.depth, stats.queued, stats.coalesced, stats.sent,
+             stats.requests, stats.dropped),
+            (0, 7, 2, 5, 4, 0))
+
+    async def test_failures_and_close_count_as_dropped(self):
+        self.client.fail = aiohttp.ClientError()
+        self.sub.update_link(LinkAction.NEW, dev('a'))
+        self.sub.update_link(LinkAction.NEW, dev('b'))
+        await self.settle()
+        self.assertEqual(self.sub.stats().dropped, 2)
+        self.client.fail = None
+        self.client.release.clear()
+        self.sub.call("apply_starting")
+        await self.settle()
+        self.sub.call("apply_stopping")
+        await self.sub.close()
+        stats = self.sub.stats()
+        self.assertEqual((stats.depth, stats.dropped), (0, 4))
+
+    async def test_unexpected_error_does_not_stop_sending(self):
+        self.client.fail = ValueError()
+        self.sub.call("apply_starting")
+        await self.settle()
+        self.client.fail = None
+        self.sub.call("apply_stopping")
+        await self.settle()
+        self.assertEqual(
+            self.client.calls, [("apply_starting",), ("apply_stopping",)])
+        stats = self.sub.stats()
+        self.assertEqual((stats.sent, stats.dropped), (1, 1))
+
+    async def test_rate_limited(self):
+        self.sub.min_interval = 10
+        self.sub.call("apply_starting")
+        await self.settle()
+        for i in range(10):
+            self.sub.update_link(LinkAction.CHANGE, dev('a', i))
+            await self.settle()
+        self.assertEqual(self.client.calls, [("apply_starting",)])
+        self.assertEqual(self.sub.depth, 1)
+        self.assertEqual(self.sub.stats().coalesced, 9)
@@ -13,6 +13,7 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import asyncio
 import requests
 import unittest
 from unittest.mock import AsyncMock, Mock
@@ -56,3 +57,82 @@ class TestSnapdSnapInfoLoader(unittest.IsolatedAsyncioTestCase):
         await self.loader.get_snap_list_task()
         self.assertTrue(self.loader.fetch_list_completed())
         self.assertFalse(self.loader.fetch_list_failed())
+
+
+class TestSnapInfoPrefetch(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.model = SnapListModel()
+        self.app = make_app()
+        self.app.report_start_event = Mock()
+        self.app.report_finish_event = Mock()
+        self.names = ['snap{}'.format(i) for i in range(6)]
+        self.requested = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.release = asyncio.Event()
+        self.app.snapd = Mock()
+        self.app.snapd.get = self.get
+
+        self.loader = SnapdSnapInfoLoader(
+                self.model, self.app.snapd, "server", self.app.context,
+                max_concurrent_fetches=2)
+
+    async def get(self, path, section=None, name=None):
+        if section is not None:
+            return {'result': [{
+                'name': name,
+                'summary': '',
+                'developer': '',
+                'publisher': {'validation': 'unproven'},
+                'description': '',
+                'confinement': 'strict',
+                'license': '',
+                } for name in self.names]}
+        self.requested.append(name)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await self.release.wait()
+        finally:
+            self.in_flight -= 1
+        return {'result': [{'name': name, 'channels': {}, 'tracks': []}]}
+
+    async def wait_for_requests(self, count):
+        while len(self.requested) < count:
+            await asyncio.sleep(0)
+
+    async def test_fetches_are_bounded(self):
+        self.loader.start()
+        await self.wait_for_requests(2)
+        for _ in range(10):
+            await asyncio.sleep(0)
+        self.assertEqual(self.requested, self.names[:2])
+        self.release.set()
+        await self.loader.main_task
+        self.assertEqual(self.requested, self.names)
+        self.assertEqual(self.max_in_flight, 2)
+
+    async def test_requested_snap_jumps_queue(self):
+        self.loader.start()
+        await self.wait_for_requests(2)
+        snap = self.model._snap_for_name(self.names[-1])
+        task = self.loader.get_snap_info_task(snap)
+        await self.wait_for_requests(3)
+        self.assertEqual(self.requested[2], self.names[-1])
+        self.release.set()
+        await task
+        await self.loader.main_task
+        self.assertEqual(sorted(self.requested), self.names)
+
+    async def test_stop_cancels_fetches(self):
+        self.loader.start()
+        await self.wait_for_requests(2)
+        tasks = [self.loader.tasks[snap]
+                 for snap in self.model.get_snap_list()[:2]]
+        self.loader.stop()
+        with self.assertRaises(asyncio.CancelledError):
+            await self.loader.main_task
+        for task in tasks:
+            self.assertTrue(task.cancelled())
+        self.assertEqual(self.loader.pending_snaps, [])
+        self.assertEqual(self.in_flight, 0)
@@ -27,11 +27,20 @@ import yaml
 from subiquitycore.context import Context, Status
 
 from subiquity.journald import (
-    journald_listen,
+    journald_subscribe,
+    journald_unsubscribe,
     )
 
 log = logging.getLogger('subiquity.server.curtin')
 
+# The fields of curtin's journald events that _CurtinCommand._event uses.
+CURTIN_EVENT_FIELDS = [
+    'CURTIN_EVENT_TYPE',
+    'CURTIN_MESSAGE',
+    'CURTIN_NAME',
+    'CURTIN_RESULT',
+    ]
+
 
 class _CurtinCommand:
 
@@ -45,7 +54,7 @@ class _CurtinCommand:
         _CurtinCommand._count += 1
         self._event_syslog_id = 'curtin_event.%s.%s' % (
             os.getpid(), _CurtinCommand._count)
-        self._fd = None
+        self._subscription = None
         self.proc = None
         self._cmd = self.make_command(command, *args, config=config)
         self.private_mounts = private_mounts
@@ -103,7 +112,8 @@ class _CurtinCommand:
         return cmd
 
     async def start(self, context, **opts):
-        self._fd = journald_listen([self._event_syslog_id], self._event)
+        self._subscription = journald_subscribe(
+            self._event_syslog_id, CURTIN_EVENT_FIELDS, self._event)
         # Yield to the event loop before starting curtin to avoid missing the
         # first couple of events.
         await asyncio.sleep(0)
@@ -119,7 +129,7 @@ class _CurtinCommand:
             waited += 0.1
             log.debug("waited %s seconds for events to drain", waited)
         self._event_contexts.pop('', None)
-        asyncio.get_running_loop().remove_reader(self._fd)
+        journald_unsubscribe(self._subscription)
         return result
 
     async def run(self, context):
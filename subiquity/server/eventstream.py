@@ -0,0 +1,135 @@
+# Copyright 2023 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import collections
+import itertools
+import json
+import logging
+import uuid
+
+from aiohttp import web
+
+log = logging.getLogger('subiquity.server.eventstream')
+
+
+class EventStream:
+    """Events for clients to follow over HTTP.
+
+    Each event is a dict with a "seq" key, which counts up from 0, and a
+    "type" key. The other keys depend on the type:
+
+     * "state": "state", the name of the new ApplicationState.
+     * "event": the same fields that are sent to the journal for context
+       start and finish events (MESSAGE, SUBIQUITY_EVENT_TYPE, ...).
+     * "log", "echo": MESSAGE, a line of output from a command.
+
+    The most recent events are kept so that a client that reconnects can
+    pick up where it left off. Each EventStream has a random id so that a
+    client can tell when it is talking to a restarted server.
+    """
+
+    keepalive_interval = 30
+
+    def __init__(self, maxlen=10000):
+        self.id = uuid.uuid4().hex
+        self._events = collections.deque(maxlen=maxlen)
+        self._next_seq = 0
+        self._new_event = asyncio.Event()
+        self._closed = False
+
+    @property
+    def last_seq(self):
+        return self._next_seq - 1
+
+    def push(self, type, **fields):
+        event = dict(fields, seq=self._next_seq, type=type)
+        self._next_seq += 1
+        self._events.append(event)
+        self._new_event.set()
+        self._new_event.clear()
+
+    def close(self):
+        """End the responses to all clients following the stream, once
+        they have been sent the events pushed so far."""
+        self._closed = True
+        self._new_event.set()
+
+    def since(self, after):
+        """Return the events with a seq greater than after, and how many such
+        events have already been discarded."""
+        if not self._events:
+            return [], 0
+        first = self._events[0]['seq']
+        dropped = max(first - after - 1, 0)
+        start = max(after + 1 - first, 0)
+        return list(itertools.islice(self._events, start, None)), dropped
+
+    async def GET(self, request):
+        """Send events as JSON, one per line, as they happen.
+
+        The "after" query parameter is the seq of the last event the client
+        has seen ("latest" means send only new events). It is ignored if the
+        "stream" parameter is not the id of this stream, i.e. the client
+        last saw events from a server that has since restarted. The "types"
+        query parameter is a comma separated list of the types of event to
+        send. If events the client has not seen have already been
+        discarded, a "dropped" event with a "count" is sent first.
+        """
+        after = request.query.get('after', '-1')
+        if request.query.get('stream', self.id) != self.id:
+            after = '-1'
+        if after == 'latest':
+            after = self.last_seq
+        else:
+            after = int(after)
+        types = request.query.get('types')
+        if types is not None:
+            types = set(types.split(','))
+        resp = web.StreamResponse(headers={
+            'Content-Type': 'application/x-ndjson',
+            'x-status': 'ok',
+            'x-event-stream': self.id,
+            })
+        resp.enable_chunked_encoding()
+        await resp.prepare(request)
+        try:
+            while True:
+                events, dropped = self.since(after)
+                if not events:
+                    if self._closed:
+                        break
+                    try:
+                        await asyncio.wait_for(
+                            self._new_event.wait(), self.keepalive_interval)
+                    except asyncio.TimeoutError:
+                        # Writing something now and then is how we find
+                        # out that the client has gone away.
+                        await resp.write(b'\n')
+                    continue
+                lines = []
+                if dropped:
+                    lines.append({'type': 'dropped', 'count': dropped})
+                for event in events:
+                    if types is None or event['type'] in types:
+                        lines.append(event)
+                after = events[-1]['seq']
+                if lines:
+                    await resp.write(b''.join(
+                        json.dumps(line).encode('utf-8') + b'\n'
+                        for line in lines))
+        except ConnectionResetError:
+            log.debug("event stream client went away")
+        return resp
@@ -14,6 +14,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import asyncio
+import functools
 import logging
 import os
 import sys
@@ -28,8 +29,6 @@ from cloudinit.distros import ug_util
 
 import jsonschema
 
-from systemd import journal
-
 import yaml
 
 from subiquitycore.async_helpers import run_in_thread
@@ -39,6 +38,7 @@ from subiquitycore.file_util import (
     copy_file_if_exists,
     write_file,
     )
+from subiquitycore.log import stop_log_queue
 from subiquitycore.prober import Prober
 from subiquitycore.ssh import (
     host_key_fingerprints,
@@ -60,10 +60,16 @@ from subiquity.common.types import (
     ApplicationState,
     ApplicationStatus,
     ErrorReportRef,
+    InstallTimings,
+    JournalSenderStats,
     KeyFingerprint,
     LiveSessionSSHInfo,
     PasswordKind,
     )
+from subiquity.journald import (
+    journald_subscribe,
+    JournalSender,
+    )
 from subiquity.models.subiquity import (
     ModelNames,
     SubiquityModel,
@@ -76,8 +82,10 @@ from subiquity.server.geoip import (
     HTTPGeoIPStrategy,
     )
 from subiquity.server.errors import ErrorController
+from subiquity.server.eventstream import EventStream
 from subiquity.server.runner import get_command_runner
 from subiquity.server.snapdapi import make_api_client
+from subiquity.server.timings import TimingRecorder
 from subiquity.server.types import InstallerChannels
 from subiquitycore.snapd import (
     AsyncSnapd,
@@ -166,6 +174,12 @@ class MetaController:
             ips=ips,
             host_key_fingerprints=host_fingerprints)
 
+    async def journal_GET(self) -> JournalSenderStats:
+        return self.app.journal_sender.stats()
+
+    async def timings_GET(self) -> Optional[InstallTimings]:
+        return self.app.timings.report()
+
     async def free_only_GET(self) -> bool:
         return self.free_only
 
@@ -282,6 +296,8 @@ class SubiquityServer(Application):
         self.cloud = None
         self.cloud_init_ok = None
         self.state_event = asyncio.Event()
+        self.event_stream = EventStream()
+        self.journal_sender = JournalSender()
         self.update_state(ApplicationState.STARTING_UP)
         self.interactive = None
         self.confirming_tty = ''
@@ -316,7 +332,9 @@ class SubiquityServer(Application):
             log.info("no snapd socket found. Snap support is disabled")
             self.snapd = None
         self.note_data_for_apport("SnapUpdated", str(self.updated))
-        self.event_listeners = []
+        self.timings = TimingRecorder(
+            os.path.join(self.root, 'var/log/installer/timings.json'))
+        self.event_listeners = [self.timings]
         self.autoinstall_config = None
         self.hub.subscribe(InstallerChannels.NETWORK_UP, self._network_change)
         self.hub.subscribe(InstallerChannels.NETWORK_PROXY_SET,
@@ -346,12 +364,13 @@ class SubiquityServer(Application):
                 return
         if context.get('request'):
             return
-        indent = context.full_name().count('/') - 2
+        full_name = context.full_name()
+        indent = full_name.count('/') - 2
         if context.get('is-install-context') and self.interactive:
             indent -= 1
             msg = context.description
         else:
-            msg = context.full_name()
+            msg = full_name
             if description:
                 msg += ': ' + description
         msg = '  ' * indent + msg
@@ -359,14 +378,18 @@ class SubiquityServer(Application):
             parent_id = str(context.parent.id)
         else:
             parent_id = ''
-        journal.send(
-            msg,
+        fields = dict(
             PRIORITY=context.level,
-            SYSLOG_IDENTIFIER=self.event_syslog_id,
-            SUBIQUITY_CONTEXT_NAME=context.full_name(),
+            SUBIQUITY_CONTEXT_NAME=full_name,
             SUBIQUITY_EVENT_TYPE=event_type,
             SUBIQUITY_CONTEXT_ID=str(context.id),
             SUBIQUITY_CONTEXT_PARENT_ID=parent_id)
+        if event_type == 'finish' and context.duration is not None:
+            fields['SUBIQUITY_CONTEXT_DURATION'] = '{:.6f}'.format(
+                context.duration)
+        self.journal_sender.send(
+            msg, SYSLOG_IDENTIFIER=self.event_syslog_id, **fields)
+        self.event_stream.push('event', MESSAGE=msg, **fields)
 
     def report_start_event(self, context, description):
         for listener in self.event_listeners:
@@ -385,6 +408,7 @@ class SubiquityServer(Application):
     def update_state(self, state):
         self._state = state
         write_file(self.state_path("server-state"), state.name)
+        self.event_stream.push('state', state=state.name)
         self.state_event.set()
         self.state_event.clear()
 
@@ -442,6 +466,9 @@ class SubiquityServer(Application):
             resp = web.Response(headers={'x-status': override_status})
         else:
             resp = await handler(request)
+        if resp.prepared:
+            # A streamed response, whose headers have already been sent.
+            return resp
         if self.updated:
             resp.headers['x-updated'] = 'yes'
         else:
@@ -496,10 +523,22 @@ class SubiquityServer(Application):
             bind(app.router, API.dry_run, DryRunController(self))
         for controller in self.controllers.instances:
             controller.add_routes(app)
+        app.router.add_get('/meta/events', self.event_stream.GET)
+        # Forward the output of commands that is logged to the journal to
+        # the event stream, so clients do not need to read the journal.
+        for type, syslog_id in ('echo', self.echo_syslog_id), \
+                ('log', self.log_syslog_id):
+            if syslog_id:
+                journald_subscribe(
+                    syslog_id, ['MESSAGE'], functools.partial(
+                        self._forward_journal_event, type))
         runner = web.AppRunner(app, keepalive_timeout=0xffffffff)
         await runner.setup()
         await self.start_site(runner)
 
+    def _forward_journal_event(self, type, event):
+        self.event_stream.push(type, MESSAGE=event['MESSAGE'])
+
     async def start_site(self, runner: web.AppRunner):
         site = web.UnixSite(runner, self.opts.socket)
         await site.start()
@@ -661,6 +700,9 @@ class SubiquityServer(Application):
 
     def exit(self):
         self.update_state(ApplicationState.EXITED)
+        self.event_stream.close()
+        log.debug("journal sender stats: %s", self.journal_sender.stats())
+        self.journal_sender.close()
         super().exit()
 
     def _network_change(self):
@@ -683,6 +725,8 @@ class SubiquityServer(Application):
             cmdline = [
                 sys.executable, '-m', 'subiquity.cmd.server',
                 ] + sys.argv[1:]
+        self.journal_sender.close()
+        stop_log_queue()
         os.execvp(cmdline[0], cmdline)
 
     def make_autoinstall(self):
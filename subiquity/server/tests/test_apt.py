@@ -13,13 +13,17 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from unittest.mock import Mock, patch, AsyncMock
+import os
+from unittest.mock import ANY, Mock, patch, AsyncMock
 
 from subiquitycore.tests import SubiTestCase
 from subiquitycore.tests.mocks import make_app
 from subiquity.server.apt import (
     AptConfigurer,
+    AptListsCache,
+    Mountpoint,
     OverlayMountpoint,
+    overlay_changes,
 )
 from subiquity.models.mirror import MirrorModel, DEFAULT
 from subiquity.models.proxy import ProxyModel
@@ -65,3 +69,178 @@ class TestAptConfigurer(SubiTestCase):
                           create=True, new_callable=AsyncMock):
             async with self.configurer.overlay():
                 pass
+
+
+class TestDeconfigure(SubiTestCase):
+
+    def setUp(self):
+        self.configured = self.tmp_dir()
+        self.upper = self.tmp_dir()
+        self.target = self.tmp_dir()
+        self.model = Mock()
+        self.model.network.has_network = False
+        self.app = make_app(self.model)
+        self.app.command_runner = AsyncMock()
+        self.configurer = AptConfigurer(self.app, AsyncMock(), '')
+        self.configurer.configured_tree = Mountpoint(
+            mountpoint=self.configured)
+        self.configurer.install_tree = OverlayMountpoint(
+            upperdir=self.upper, lowers=[self.configured],
+            mountpoint='install-tree')
+
+    def write(self, root, path, content):
+        os.makedirs(os.path.dirname(os.path.join(root, path)), exist_ok=True)
+        with open(os.path.join(root, path), 'w') as fp:
+            fp.write(content)
+
+    def read(self, root, path):
+        with open(os.path.join(root, path)) as fp:
+            return fp.read()
+
+    def install(self, path, content):
+        # What the install overlay changes ends up in the upperdir and in
+        # the target.
+        self.write(self.upper, path, content)
+        self.write(self.target, path, content)
+
+    def test_overlay_changes(self):
+        self.write(self.configured, 'etc/apt/sources.list', 'orig')
+        self.write(self.configured, 'etc/apt/trusted.gpg.d/k', 'key')
+        os.mkdir(os.path.join(self.configured, 'etc/apt/sources.list.d'))
+        self.install('etc/apt/sources.list', 'cdrom')
+        self.install('etc/apt/sources.list.d/original.list', 'orig')
+        self.install('etc/apt/new/file', 'x')
+        self.assertEqual(
+            list(overlay_changes(self.upper, self.configured, 'etc/apt')), [
+                'etc/apt/new',
+                'etc/apt/sources.list',
+                'etc/apt/sources.list.d/original.list',
+                ])
+        self.assertEqual(
+            list(overlay_changes(self.upper, self.configured, 'var/lib')),
+            [])
+
+    async def test_deconfigure(self):
+        self.write(self.configured, 'etc/apt/sources.list', 'orig')
+        self.write(self.configured, 'etc/apt/sources.list.d/.keep', '')
+        self.write(self.target, 'etc/apt/sources.list.d/.keep', '')
+        self.write(self.configured, 'var/lib/apt/lists/archive', 'a')
+        self.write(self.target, 'var/lib/apt/lists/archive', 'a')
+        self.install('etc/apt/sources.list', 'cdrom')
+        self.install('etc/apt/sources.list.d/original.list', 'orig')
+        self.install('var/lib/apt/lists/cdrom', 'c')
+        # Installed in the target by a package, after the overlay.
+        self.write(self.target, 'etc/apt/apt.conf.d/50pkg', 'pkg')
+        os.mkdir(os.path.join(self.target, 'cdrom'))
+
+        await self.configurer.deconfigure(Mock(), self.target)
+
+        self.assertEqual(
+            self.read(self.target, 'etc/apt/sources.list'), 'orig')
+        self.assertEqual(
+            os.listdir(os.path.join(self.target, 'etc/apt/sources.list.d')),
+            ['.keep'])
+        self.assertEqual(
+            self.read(self.target, 'etc/apt/apt.conf.d/50pkg'), 'pkg')
+        self.assertEqual(
+            os.listdir(os.path.join(self.target, 'var/lib/apt/lists')),
+            ['archive'])
+        self.assertFalse(os.path.exists(os.path.join(self.target, 'cdrom')))
+        self.app.command_runner.run.assert_not_called()
+
+
+class TestAptListsCache(SubiTestCase):
+
+    def setUp(self):
+        self.cdrom = self.tmp_dir()
+        self.cache_dir = self.tmp_dir()
+        self.lists = self.tmp_dir()
+        self.cache = AptListsCache(self.cache_dir, self.cdrom)
+        self.write(self.cdrom, '.disk/info', 'Ubuntu-Server 23.04')
+        self.write(self.cdrom, 'dists/lunar/Release', 'release')
+        self.write(self.lists, '_cdrom_dists_lunar_Release', 'r')
+        self.write(self.lists, '_cdrom_dists_lunar_main_Packages', 'p')
+        self.write(self.lists, 'archive.ubuntu.com_Release', 'a')
+        os.mkdir(os.path.join(self.lists, 'partial'))
+
+    def write(self, root, path, content):
+        os.makedirs(os.path.dirname(os.path.join(root, path)), exist_ok=True)
+        with open(os.path.join(root, path), 'w') as fp:
+            fp.write(content)
+
+    def test_key(self):
+        key = self.cache.key('deb file:///cdrom lunar main\n')
+        self.assertEqual(key, self.cache.key('deb file:///cdrom lunar main\n'))
+        self.assertNotEqual(key, self.cache.key('deb file:///cdrom other\n'))
+        self.write(self.cdrom, 'dists/lunar/Release', 'new release')
+        self.assertNotEqual(
+            key, self.cache.key('deb file:///cdrom lunar main\n'))
+
+    def test_no_key_without_disk_info(self):
+        os.unlink(os.path.join(self.cdrom, '.disk/info'))
+        self.assertIsNone(self.cache.key('deb file:///cdrom lunar main\n'))
+
+    def test_store_restore(self):
+        self.assertFalse(self.cache.restore('k', self.tmp_dir()))
+        self.cache.store('k', self.lists)
+        new_lists = self.tmp_dir()
+        self.assertTrue(self.cache.restore('k', new_lists))
+        self.assertEqual(
+            sorted(os.listdir(new_lists)),
+            ['_cdrom_dists_lunar_Release', '_cdrom_dists_lunar_main_Packages'])
+
+    def test_corrupt_entry_discarded(self):
+        self.cache.store('k', self.lists)
+        self.write(
+            self.cache_dir, 'k/_cdrom_dists_lunar_main_Packages', 'changed')
+        new_lists = self.tmp_dir()
+        with self.assertLogs('subiquity.server.apt', 'WARNING'):
+            self.assertFalse(self.cache.restore('k', new_lists))
+        self.assertEqual(os.listdir(new_lists), [])
+        self.assertFalse(os.path.exists(os.path.join(self.cache_dir, 'k')))
+
+
+class TestUpdateInstallTree(SubiTestCase):
+
+    def setUp(self):
+        self.model = Mock()
+        self.app = make_app(self.model)
+        self.app.opts.apt_lists_cache = self.tmp_dir()
+        self.configurer = AptConfigurer(self.app, AsyncMock(), '')
+        self.assertIsInstance(self.configurer.lists_cache, AptListsCache)
+        self.configurer.lists_cache = Mock()
+        self.configurer.lists_cache.key.return_value = 'key'
+        self.configurer.install_tree = OverlayMountpoint(
+            upperdir='upper', lowers=[], mountpoint=self.tmp_dir())
+
+    @patch('subiquity.server.apt.run_curtin_command')
+    async def test_miss(self, run_cmd):
+        self.configurer.lists_cache.restore.return_value = False
+        self.model.network.has_network = False
+        await self.configurer._update_install_tree(Mock(), 'line')
+        run_cmd.assert_called_once_with(
+            self.app, ANY, 'in-target', '-t', self.configurer.install_tree.p(),
+            '--', 'apt-get', 'update', private_mounts=True)
+        self.configurer.lists_cache.store.assert_called_once_with(
+            'key', self.configurer.install_tree.p('var/lib/apt/lists'))
+
+    @patch('subiquity.server.apt.run_curtin_command')
+    async def test_hit_offline(self, run_cmd):
+        self.configurer.lists_cache.restore.return_value = True
+        self.model.network.has_network = False
+        await self.configurer._update_install_tree(Mock(), 'line')
+        run_cmd.assert_not_called()
+        self.configurer.lists_cache.store.assert_not_called()
+
+    @patch('subiquity.server.apt.run_curtin_command')
+    async def test_hit_online(self, run_cmd):
+        self.configurer.lists_cache.restore.return_value = True
+        self.model.network.has_network = True
+        await self.configurer._update_install_tree(Mock(), 'line')
+        run_cmd.assert_called_once_with(
+            self.app, ANY, 'in-target', '-t', self.configurer.install_tree.p(),
+            '--', 'apt-get', 'update',
+            '-o', 'Dir::Etc::SourceList=/dev/null',
+            '-o', 'APT::Get::List-Cleanup=false',
+            private_mounts=True)
+        self.configurer.lists_cache.store.assert_not_called()
@@ -0,0 +1,103 @@
+# Copyright 2023 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import contextlib
+import os
+import tempfile
+import unittest
+
+import aiohttp
+from aiohttp import web
+
+from subiquity.client.eventstream import event_stream_listen
+from subiquity.server.eventstream import EventStream
+
+
+class TestEventStream(unittest.TestCase):
+
+    def test_since(self):
+        stream = EventStream(maxlen=3)
+        self.assertEqual(stream.since(-1), ([], 0))
+        for i in range(5):
+            stream.push('log', MESSAGE=str(i))
+        events, dropped = stream.since(-1)
+        self.assertEqual([e['seq'] for e in events], [2, 3, 4])
+        self.assertEqual(dropped, 2)
+        events, dropped = stream.since(2)
+        self.assertEqual([e['MESSAGE'] for e in events], ['3', '4'])
+        self.assertEqual(dropped, 0)
+        self.assertEqual(stream.since(4), ([], 0))
+
+
+class TestEventStreamEndToEnd(unittest.IsolatedAsyncioTestCase):
+
+    @contextlib.asynccontextmanager
+    async def serve(self, stream):
+        app = web.Application()
+        app.router.add_get('/meta/events', stream.GET)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            socket_path = os.path.join(tmpdir, 'socket')
+            site = web.UnixSite(runner, socket_path)
+            await site.start()
+            conn = aiohttp.UnixConnector(socket_path)
+            session = aiohttp.ClientSession(connector=conn)
+            try:
+                yield session
+            finally:
+                await session.close()
+                stream.close()
+                await runner.cleanup()
+
+    async def collect(self, session, types, count, seek=False):
+        received = []
+        done = asyncio.Event()
+
+        def cb(event):
+            received.append(event)
+            if len(received) == count:
+                done.set()
+
+        task = event_stream_listen(session, types, cb, seek=seek)
+        return task, received, done
+
+    async def test_follow(self):
+        stream = EventStream()
+        stream.push('log', MESSAGE='old')
+        stream.push('state', state='RUNNING')
+        async with self.serve(stream) as session:
+            task, received, done = await self.collect(session, ['log'], 2)
+            await asyncio.sleep(0.1)
+            stream.push('event', MESSAGE='ignored')
+            stream.push('log', MESSAGE='new')
+            await asyncio.wait_for(done.wait(), 5)
+            task.cancel()
+        self.assertEqual(
+            [(e['seq'], e['MESSAGE']) for e in received],
+            [(0, 'old'), (3, 'new')])
+
+    async def test_seek(self):
+        stream = EventStream()
+        stream.push('log', MESSAGE='old')
+        async with self.serve(stream) as session:
+            task, received, done = await self.collect(
+                session, ['log'], 1, seek=True)
+            await asyncio.sleep(0.1)
+            stream.push('log', MESSAGE='new')
+            await asyncio.wait_for(done.wait(), 5)
+            task.cancel()
+        self.assertEqual([e['MESSAGE'] for e in received], ['new'])
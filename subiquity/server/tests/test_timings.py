@@ -0,0 +1,145 @@
+# Copyright 2023 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import os
+from unittest import mock
+
+from subiquitycore.context import Context, Status
+from subiquitycore.tests import SubiTestCase
+
+from subiquity.server.timings import _covered, TimingRecorder
+
+
+class TestCovered(SubiTestCase):
+
+    def test_covered(self):
+        self.assertEqual(_covered([]), 0)
+        self.assertEqual(_covered([(0, 2), (1, 3), (5, 6)]), 4)
+        self.assertEqual(_covered([(5, 6), (0, 4), (1, 2)]), 5)
+        self.assertEqual(_covered([(3, 3)]), 0)
+
+
+class TestTimingRecorder(SubiTestCase):
+
+    def setUp(self):
+        self.recorder = TimingRecorder()
+        self.app = mock.Mock()
+        self.app.project = 'subiquity'
+        self.app.report_start_event = self.recorder.report_start_event
+        self.app.report_finish_event = self.recorder.report_finish_event
+        self.clock = 100.0
+        p = mock.patch(
+            'subiquitycore.context.time.monotonic', lambda: self.clock)
+        p.start()
+        self.addCleanup(p.stop)
+
+    def make_install_context(self):
+        root = Context.new(self.app)
+        install = root.child('install')
+        install.enter()
+        install.set('is-install-context', True)
+        return install
+
+    def timings_by_name(self, report):
+        return {t.name.split('/')[-1]: t for t in report.contexts}
+
+    def test_no_install(self):
+        with Context.new(self.app).child('other'):
+            pass
+        self.assertIsNone(self.recorder.report())
+
+    def test_report(self):
+        install = self.make_install_context()
+        with install.child('apt'):
+            self.clock += 10
+        # Two overlapping children, b finishes last.
+        post = install.child('post')
+        post.enter()
+        a = post.child('a')
+        b = post.child('b')
+        a.enter()
+        self.clock += 1
+        b.enter()
+        self.clock += 2
+        a.exit(result=Status.FAIL)
+        self.clock += 3
+        b.exit()
+        self.clock += 1
+        post.exit()
+
+        report = self.recorder.report(now=self.clock + 5)
+        timings = self.timings_by_name(report)
+        self.assertEqual(
+            list(timings), ['install', 'apt', 'post', 'a', 'b'])
+        self.assertEqual(report.total, 22)
+        self.assertEqual(timings['install'].wall, 22)
+        self.assertFalse(timings['install'].finished)
+        self.assertEqual(timings['install'].self_time, 5)
+        self.assertEqual(timings['post'].start, 10)
+        self.assertEqual(timings['post'].wall, 7)
+        self.assertEqual(timings['post'].self_time, 1)
+        self.assertEqual(timings['a'].result, 'FAIL')
+        self.assertEqual(timings['b'].result, 'SUCCESS')
+        self.assertEqual(timings['b'].parent_id, post.id)
+        apt = [c for c in report.contexts if c.name.endswith('/apt')][0]
+        self.assertEqual(
+            report.critical_path, [install.id, apt.id, post.id, b.id])
+
+    def test_critical_path_sequential_siblings(self):
+        install = self.make_install_context()
+        steps = {}
+        # a, then b and c overlapping, then d. c finishes after b, and
+        # runs c1 then c2.
+        for name in 'a', 'b', 'c', 'd':
+            steps[name] = install.child(name)
+        steps['a'].enter()
+        self.clock += 2
+        steps['a'].exit()
+        steps['b'].enter()
+        self.clock += 1
+        steps['c'].enter()
+        c1 = steps['c'].child('c1')
+        with c1:
+            self.clock += 1
+        c2 = steps['c'].child('c2')
+        with c2:
+            self.clock += 2
+        steps['b'].exit()
+        self.clock += 1
+        steps['c'].exit()
+        steps['d'].enter()
+        self.clock += 1
+        steps['d'].exit()
+        install.exit()
+        report = self.recorder.report()
+        self.assertEqual(report.critical_path, [
+            install.id, steps['a'].id, steps['c'].id, c1.id, c2.id,
+            steps['d'].id])
+
+    def test_written_when_install_finishes(self):
+        path = os.path.join(self.tmp_dir(), 'timings.json')
+        self.recorder.path = path
+        install = self.make_install_context()
+        with install.child('step'):
+            self.clock += 1
+        self.assertFalse(os.path.exists(path))
+        install.exit()
+        with open(path) as fp:
+            data = json.load(fp)
+        self.assertEqual(data['total'], 1)
+        self.assertEqual(
+            [c['name'] for c in data['contexts']],
+            ['subiquity/install', 'subiquity/install/step'])
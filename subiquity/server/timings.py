@@ -0,0 +1,140 @@
+# Copyright 2023 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import collections
+import time
+from typing import Dict, Optional
+
+from subiquitycore.context import Context, Status
+from subiquitycore.file_util import write_file
+
+from subiquity.common.serialize import to_json
+from subiquity.common.types import (
+    ContextTiming,
+    InstallTimings,
+    )
+
+
+def _covered(intervals):
+    """Return the total length covered by a list of (start, end) pairs."""
+    total = 0.0
+    cur_start = cur_end = None
+    for start, end in sorted(intervals):
+        if end <= start:
+            continue
+        if cur_end is None or start > cur_end:
+            if cur_end is not None:
+                total += cur_end - cur_start
+            cur_start, cur_end = start, end
+        else:
+            cur_end = max(cur_end, end)
+    if cur_end is not None:
+        total += cur_end - cur_start
+    return total
+
+
+class TimingRecorder:
+    """Record the contexts of the install, to report how long they take.
+
+    This is an event listener for the server. The install is the context
+    with 'is-install-context' set on it, and when it finishes the report is
+    written to path (if not None).
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._root: Optional[Context] = None
+        self._contexts: Dict[int, Context] = {}
+        self._results: Dict[int, Status] = {}
+
+    def _add(self, context):
+        if not context.get('is-install-context'):
+            return
+        while context.id not in self._contexts:
+            self._contexts[context.id] = context
+            if 'is-install-context' in context.data:
+                self._root = context
+                break
+            context = context.parent
+
+    def report_start_event(self, context, description):
+        self._add(context)
+
+    def report_finish_event(self, context, description, result):
+        self._add(context)
+        if context.id in self._contexts:
+            self._results[context.id] = result
+        if context is self._root and self.path is not None:
+            write_file(self.path, to_json(InstallTimings, self.report()))
+
+    def report(self, now=None) -> Optional[InstallTimings]:
+        if self._root is None:
+            return None
+        if now is None:
+            now = time.monotonic()
+
+        def end(c):
+            return c.end_time if c.end_time is not None else now
+
+        contexts = [
+            c for c in self._contexts.values() if c.start_time is not None]
+        contexts.sort(key=lambda c: (c.start_time, c.id))
+        children = collections.defaultdict(list)
+        for c in contexts:
+            if c is not self._root:
+                children[c.parent.id].append(c)
+
+        origin = self._root.start_time
+        timings = []
+        for c in contexts:
+            wall = end(c) - c.start_time
+            busy = _covered([
+                (max(k.start_time, c.start_time), min(end(k), end(c)))
+                for k in children[c.id]
+                ])
+            result = self._results.get(c.id)
+            timings.append(ContextTiming(
+                id=c.id,
+                parent_id=None if c is self._root else c.parent.id,
+                name=c.full_name(),
+                description=c.description,
+                start=c.start_time - origin,
+                wall=wall,
+                self_time=wall - busy,
+                finished=c.end_time is not None,
+                result=None if result is None else result.name))
+
+        def critical_path(c):
+            # The child that ended last held up c. Before it, whichever
+            # sibling ended closest to (but not after) its start held it
+            # up, and so on back. Each of those is followed down in turn.
+            kids = sorted(children[c.id], key=end)
+            chain = []
+            i = len(kids) - 1
+            while i >= 0:
+                chain.append(kids[i])
+                start = kids[i].start_time
+                i -= 1
+                while i >= 0 and end(kids[i]) > start:
+                    i -= 1
+            path = [c.id]
+            for k in reversed(chain):
+                path.extend(critical_path(k))
+            return path
+
+        return InstallTimings(
+            total=end(self._root) - origin,
+            contexts=timings,
+            critical_path=critical_path(self._root))
@@ -0,0 +1,185 @@
+# Copyright 2023 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import collections
+import unittest
+from unittest import mock
+
+from subiquity import journald
+from subiquity.journald import (
+    JournalMultiplexer,
+    JournalSender,
+    )
+
+
+class FakeReader:
+    """Enough of systemd.journal.Reader for JournalMultiplexer."""
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.matches = set()
+        self.pos = -1
+
+    def fileno(self):
+        return 3
+
+    def process(self):
+        return 1
+
+    def add_match(self, **kw):
+        self.matches.update(kw.items())
+
+    def flush_matches(self):
+        self.matches = set()
+
+    def _matches(self, i):
+        return ('SYSLOG_IDENTIFIER',
+                self.entries[i].get('SYSLOG_IDENTIFIER')) in self.matches
+
+    def _next(self):
+        for i in range(self.pos + 1, len(self.entries)):
+            if self._matches(i):
+                self.pos = i
+                return True
+        return False
+
+    def _previous(self):
+        for i in range(self.pos - 1, -1, -1):
+            if self._matches(i):
+                self.pos = i
+                return True
+        self.pos = -1
+        return False
+
+    def _get_cursor(self):
+        return str(self.pos)
+
+    def test_cursor(self, cursor):
+        return cursor == str(self.pos)
+
+    def seek_cursor(self, cursor):
+        self.pos = int(cursor) - 1
+
+    def _get(self, field):
+        return self.entries[self.pos][field].encode('utf-8')
+
+    def close(self):
+        pass
+
+
+class TestJournalMultiplexer(unittest.TestCase):
+
+    def setUp(self):
+        self.entries = []
+        self.reader = FakeReader(self.entries)
+        p = mock.patch.object(journald, 'journal')
+        m_journal = p.start()
+        self.addCleanup(p.stop)
+        m_journal.Reader.return_value = self.reader
+        m_journal.NOP = 0
+        self.loop = mock.Mock()
+        self.mux = JournalMultiplexer(self.loop)
+
+    def log(self, identifier, **fields):
+        self.entries.append(dict(fields, SYSLOG_IDENTIFIER=identifier))
+
+    def test_dispatch_by_identifier(self):
+        a, b = [], []
+        self.mux.subscribe('a', ['MESSAGE'], a.append)
+        self.mux.subscribe('b', ['MESSAGE', 'EXTRA'], b.append)
+        self.loop.add_reader.assert_called_once_with(3, self.mux._process)
+        self.log('a', MESSAGE='1', OTHER='x')
+        self.log('c', MESSAGE='2')
+        self.log('b', MESSAGE='3', EXTRA='y')
+        self.log('b', MESSAGE='4')
+        self.mux._process()
+        self.assertEqual(a, [{'MESSAGE': '1'}])
+        self.assertEqual(
+            b, [{'MESSAGE': '3', 'EXTRA': 'y'}, {'MESSAGE': '4'}])
+
+    def test_subscribe_carries_on_from_last_entry(self):
+        a, b = [], []
+        self.mux.subscribe('a', ['MESSAGE'], a.append)
+        self.log('a', MESSAGE='1')
+        self.mux._process()
+        self.log('b', MESSAGE='2')
+        self.log('a', MESSAGE='3')
+        self.mux.subscribe('b', ['MESSAGE'], b.append)
+        self.log('b', MESSAGE='4')
+        self.mux._process()
+        self.assertEqual(a, [{'MESSAGE': '1'}, {'MESSAGE': '3'}])
+        self.assertEqual(b, [{'MESSAGE': '4'}])
+
+    def test_unsubscribe(self):
+        a, b = [], []
+        self.mux.subscribe('a', ['MESSAGE'], a.append)
+        sub = self.mux.subscribe('b', ['MESSAGE'], b.append)
+        self.log('b', MESSAGE='1')
+        self.mux.unsubscribe(sub)
+        self.log('b', MESSAGE='2')
+        self.log('a', MESSAGE='3')
+        self.mux._process()
+        self.assertEqual(a, [{'MESSAGE': '3'}])
+        self.assertEqual(b, [{'MESSAGE': '1'}])
+
+    def test_last_unsubscribe_closes_reader(self):
+        sub = self.mux.subscribe('a', ['MESSAGE'], print)
+        self.mux.unsubscribe(sub)
+        self.loop.remove_reader.assert_called_once_with(3)
+        self.assertIsNone(self.mux._reader)
+
+
+class TestJournalSender(unittest.TestCase):
+
+    def setUp(self):
+        p = mock.patch.object(journald, 'journal')
+        self.m_journal = p.start()
+        self.addCleanup(p.stop)
+        self.sender = JournalSender()
+
+    def test_send(self):
+        for i in range(5):
+            self.sender.send(str(i), SYSLOG_IDENTIFIER='x')
+        self.sender.close()
+        self.assertEqual(
+            [c.args[0] for c in self.m_journal.send.call_args_list],
+            ['0', '1', '2', '3', '4'])
+        stats = self.sender.stats()
+        self.assertEqual(stats.sent, 5)
+        self.assertEqual(stats.queued, 0)
+
+    def test_send_failure(self):
+        self.m_journal.send.side_effect = [None, OSError(), None]
+        for i in range(3):
+            self.sender.send(str(i), SYSLOG_IDENTIFIER='x')
+        self.sender.close()
+        self.assertEqual(self.m_journal.send.call_count, 3)
+        stats = self.sender.stats()
+        self.assertEqual(stats.sent, 2)
+        self.assertEqual(stats.failed, 1)
+        self.assertEqual(stats.queued, 0)
+
+    def test_stats_rate(self):
+        self.sender._samples = collections.deque([(0.0, 0)])
+        self.sender._add_sample(1.0, 10)
+        self.sender._add_sample(5.0, 30)
+        self.sender._add_sample(12.0, 50)
+        self.sender.sent = 50
+        stats = self.sender.stats(now=12.0)
+        self.assertEqual(stats.per_second, 40 / 11)
+        # Reading the stats does not change them.
+        self.assertEqual(self.sender.stats(now=12.0), stats)
+        # Nothing has been sent in the last rate_window seconds.
+        self.assertEqual(self.sender.stats(now=30.0).per_second, 0)
@@ -28,7 +28,12 @@ from subiquitycore.ui.buttons import (
     ok_btn,
     other_btn,
     )
-from subiquitycore.ui.container import Columns, ListBox, Pile
+from subiquitycore.ui.container import (
+    BoundedTextWalker,
+    Columns,
+    ListBox,
+    Pile,
+    )
 from subiquitycore.ui.form import Toggleable
 from subiquitycore.ui.spinner import Spinner
 from subiquitycore.ui.utils import button_pile, Padding, rewrap
@@ -40,6 +45,9 @@ from subiquity.common.types import ApplicationState
 
 log = logging.getLogger("subiquity.ui.views.installprogress")
 
+# The full installer output can be very long, only show the end of it.
+LOG_LINES_MAX = 10000
+
 
 class MyLineBox(LineBox):
     def format_title(self, title):
@@ -77,7 +85,7 @@ class ProgressView(BaseView):
         ]
         self.event_pile = Pile(event_body)
 
-        self.log_listbox = ListBox()
+        self.log_listbox = ListBox(BoundedTextWalker(LOG_LINES_MAX))
         log_linebox = MyLineBox(self.log_listbox, _("Full installer output"))
         log_body = [
             ('weight', 1, log_linebox),
@@ -123,7 +131,13 @@ class ProgressView(BaseView):
             self.event_finish(context_id)
 
     def add_log_line(self, text):
-        self._add_line(self.log_listbox, Text(text))
+        lb = self.log_listbox.base_widget
+        walker = lb.body
+        at_end = walker.focus is None or walker.focus == walker.last_position
+        walker.append(text)
+        if at_end:
+            lb.set_focus(walker.last_position)
+            lb.set_focus_valign('bottom')
 
     def set_status(self, text):
         self.event_linebox.set_title(text)
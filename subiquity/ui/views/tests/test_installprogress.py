@@ -32,3 +32,15 @@ class IdentityViewTests(unittest.TestCase):
         self.assertIsNot(btn, None)
         view_helpers.click(btn)
         view.controller.click_reboot.assert_called_once_with()
+
+    def test_tab_in_long_log(self):
+        view = self.make_view()
+        for i in range(30000):
+            view.add_log_line("line {}".format(i))
+        view.view_log(None)
+        size = (80, 24)
+        view.render(size, focus=True)
+        view.keypress(size, 'tab')
+        view.render(size, focus=True)
+        view.keypress(size, 'shift tab')
+        view.render(size, focus=True)
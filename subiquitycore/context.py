@@ -17,6 +17,7 @@ import asyncio
 import enum
 import functools
 import inspect
+import time
 
 
 class Status(enum.Enum):
@@ -48,6 +49,9 @@ class Context:
     with somecontext.child("operation") as context:
         result = await long_running_operation()
         context.description = "result was {}".format(result)
+
+    start_time and end_time are the time.monotonic() values when the
+    context was entered and exited.
     """
 
     def __init__(self, app, name, description, parent, level, childlevel=None):
@@ -63,6 +67,9 @@ class Context:
             childlevel = level
         self.childlevel = childlevel
         self.data = {}
+        self._full_name = None
+        self.start_time = None
+        self.end_time = None
 
     @classmethod
     def new(cls, app):
@@ -74,21 +81,25 @@ class Context:
         return type(self)(self.app, name, description, self, level, childlevel)
 
     def full_name(self):
-        c = self
-        names = []
-        while c is not None:
-            names.append(c.name)
-            c = c.parent
-        return '/'.join(reversed(names))
+        # This is called for every event reported, so it is computed once
+        # (the names of a context and its parents never change).
+        if self._full_name is None:
+            if self.parent is None:
+                self._full_name = self.name
+            else:
+                self._full_name = self.parent.full_name() + '/' + self.name
+        return self._full_name
 
     def enter(self, description=None):
         if description is None:
             description = self.description
+        self.start_time = time.monotonic()
         self.app.report_start_event(self, description)
 
     def exit(self, description=None, result=Status.SUCCESS):
         if description is None:
             description = self.description
+        self.end_time = time.monotonic()
         self.app.report_finish_event(self, description, result)
 
     def __enter__(self):
@@ -107,6 +118,12 @@ class Context:
             description = None
         self.exit(description, result)
 
+    @property
+    def duration(self):
+        if self.start_time is None or self.end_time is None:
+            return None
+        return self.end_time - self.start_time
+
     def set(self, key, value):
         self.data[key] = value
 
@@ -272,7 +272,8 @@ class BaseNetworkController(BaseController):
                     dhcp_events.add(e)
             if dev.info is None:
                 continue
-            if dev.config != self.model.config.config_for_device(dev.info):
+            if not self.model.config.device_config_matches(
+                    dev.info, dev.config):
                 if dev.is_virtual:
                     devs_to_delete.append(dev)
                 else:
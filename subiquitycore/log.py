@@ -13,13 +13,106 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import atexit
+import copy
 import logging
+import logging.handlers
 import os
+import queue
 
 from subiquitycore.file_util import set_log_perms
 
+# Limits for the log files of long running processes, so that they cannot
+# fill up the memory of the live session. With both the info and debug logs
+# that is at most 6 * LOG_MAX_BYTES.
+LOG_MAX_BYTES = 16 << 20
+LOG_BACKUP_COUNT = 2
 
-def setup_logger(dir, base='subiquity'):
+
+class deferred:
+    """Wrap a log message argument to format it on the logging thread.
+
+    When logging is queued (see setup_logger), a record with a deferred
+    argument is formatted by the thread that writes the logs rather than
+    the thread that logged it, so formatting a large object does not hold
+    up the event loop. Only use this for objects that will not be changed
+    after they are logged:
+
+        log.debug("loaded %s", deferred(probe_data))
+    """
+
+    __slots__ = ('obj',)
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __str__(self):
+        return str(self.obj)
+
+    def __repr__(self):
+        return repr(self.obj)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+
+    def prepare(self, record):
+        args = record.args
+        if isinstance(args, dict):
+            args = args.values()
+        if args and any(isinstance(arg, deferred) for arg in args):
+            # Leave formatting the message to the QueueListener's handlers,
+            # but format any exception now as the traceback will not be
+            # around later.
+            record = copy.copy(record)
+            if record.exc_info:
+                record.exc_text = logging.Formatter().formatException(
+                    record.exc_info)
+                record.exc_info = None
+            return record
+        return super().prepare(record)
+
+
+class _RotatingFileHandler(logging.handlers.RotatingFileHandler):
+
+    def doRollover(self):
+        super().doRollover()
+        # The old file keeps its permissions when it is renamed, the new
+        # one needs the ones setup_logger gave the first file. Check for
+        # root here as set_log_perms would otherwise log a warning from
+        # inside a handler.
+        if os.getuid() == 0:
+            set_log_perms(self.baseFilename, isdir=False, group_write=False)
+
+
+def rotated_log_files(logfile, backup_count=LOG_BACKUP_COUNT):
+    """Return the paths logfile is rotated to, newest first. Any of them
+    may not exist (yet)."""
+    return ['{}.{}'.format(logfile, i) for i in range(1, backup_count + 1)]
+
+
+_listener = None
+
+
+def stop_log_queue():
+    """Write out any queued log records and stop the logging thread.
+
+    This happens at exit anyway, but needs to be called before exec()."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def setup_logger(dir, base='subiquity', *, queued=False, max_bytes=0,
+                 backup_count=0):
+    """Log to {base}-info.log and {base}-debug.log in dir.
+
+    If queued is true, records are written to the files by a separate
+    thread so that logging does not block on disk I/O. If max_bytes is
+    not 0, the files are rotated when they would grow larger than that,
+    keeping backup_count old files.
+    """
+    global _listener
     os.makedirs(dir, exist_ok=True)
     # Create the log directory in such a way that users in the group may
     # write to this directory in the installation environment.
@@ -29,11 +122,16 @@ def setup_logger(dir, base='subiquity'):
     logger.setLevel(logging.DEBUG)
 
     r = {}
+    handlers = []
 
     for level in 'info', 'debug':
         nopid_file = os.path.join(dir, "{}-{}.log".format(base, level))
         logfile = "{}.{}".format(nopid_file, os.getpid())
-        handler = logging.FileHandler(logfile)
+        if max_bytes:
+            handler = _RotatingFileHandler(
+                logfile, maxBytes=max_bytes, backupCount=backup_count)
+        else:
+            handler = logging.FileHandler(logfile)
         set_log_perms(logfile, isdir=False, group_write=False)
         # os.symlink cannot replace an existing file or symlink so create
         # it and then rename it over.
@@ -46,7 +144,19 @@ def setup_logger(dir, base='subiquity'):
             logging.Formatter(
                 "%(asctime)s %(levelname)s %(name)s:%(lineno)d %(message)s"))
 
-        logger.addHandler(handler)
+        handlers.append(handler)
         r[level] = logfile
 
+    if queued:
+        q = queue.SimpleQueue()
+        logger.addHandler(_QueueHandler(q))
+        stop_log_queue()
+        _listener = logging.handlers.QueueListener(
+            q, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_log_queue)
+    else:
+        for handler in handlers:
+            logger.addHandler(handler)
+
     return r
@@ -3,6 +3,7 @@ import glob
 import fnmatch
 import os
 import logging
+import re
 import yaml
 
 log = logging.getLogger("subiquitycore.netplan")
@@ -35,14 +36,39 @@ class Config:
     Call parse_netplan_config() with each piece of yaml config, and then
     call config_for_device to get the config that matches a particular
     network device, if any.
+
+    The devices are indexed as they are parsed: virtual devices by name
+    and physical devices by the name or MAC address they match, if that
+    does not need a glob, so that looking up a device only has to check
+    the few configs that might match it. The result of a lookup is cached
+    until more config is parsed.
     """
 
     def __init__(self):
         self.physical_devices = []
         self.virtual_devices = []
         self.config = {}
+        self._virtual_by_name = {}
+        self._physical_by_name = {}
+        self._physical_by_mac = {}
+        self._physical_other = []
+        self._lookup_cache = {}
+
+    def _add_physical_device(self, dev):
+        self.physical_devices.append(dev)
+        if dev.match_mac is not None:
+            self._physical_by_mac.setdefault(dev.match_mac, []).append(dev)
+        elif dev.match_name is not None and dev.match_name_is_literal:
+            self._physical_by_name.setdefault(dev.match_name, []).append(dev)
+        else:
+            self._physical_other.append(dev)
+
+    def _add_virtual_device(self, dev):
+        self.virtual_devices.append(dev)
+        self._virtual_by_name.setdefault(dev.name, dev)
 
     def parse_netplan_config(self, config):
+        self._lookup_cache = {}
         try:
             self.config = config = yaml.safe_load(config)
         except yaml.ReaderError as e:
@@ -58,32 +84,53 @@ class Config:
             return
         for phys_key in 'ethernets', 'wifis':
             for dev, dev_config in network.get(phys_key, {}).items():
-                self.physical_devices.append(_PhysicalDevice(dev, dev_config))
+                self._add_physical_device(_PhysicalDevice(
+                    dev, dev_config, len(self.physical_devices)))
         for virt_key in 'bonds', 'vlans':
             for dev, dev_config in network.get(virt_key, {}).items():
-                self.virtual_devices.append(_VirtualDevice(dev, dev_config))
+                self._add_virtual_device(_VirtualDevice(dev, dev_config))
 
-    def config_for_device(self, link):
+    def _lookup(self, link):
+        key = (link.is_virtual, link.name, link.hwaddr, link.driver)
+        try:
+            return self._lookup_cache[key]
+        except KeyError:
+            pass
+        config = self._lookup_cache[key] = self._lookup_uncached(link)
+        return config
+
+    def _lookup_uncached(self, link):
         if link.is_virtual:
-            for dev in self.virtual_devices:
-                if dev.name == link.name:
-                    return copy.deepcopy(dev.config)
+            dev = self._virtual_by_name.get(link.name)
+            if dev is not None:
+                return dev.config
         else:
-            allowed_matches = ('macaddress',)
-            match_key = 'match'
-            for dev in self.physical_devices:
-                if dev.matches_link(link):
-                    config = copy.deepcopy(dev.config)
-                    if match_key in config:
-                        match = {k: v for k, v in config[match_key].items()
-                                 if k in allowed_matches}
-                        if match:
-                            config[match_key] = match
-                        else:
-                            del config[match_key]
-                    return config
+            candidates = [
+                dev
+                for devs in (
+                    self._physical_by_name.get(link.name, ()),
+                    self._physical_by_mac.get(link.hwaddr, ()),
+                    self._physical_other,
+                    )
+                for dev in devs
+                if dev.matches_link(link)
+                ]
+            if candidates:
+                # The first config that matches wins.
+                dev = min(candidates, key=lambda dev: dev.index)
+                return dev.device_config
         return {}
 
+    def config_for_device(self, link):
+        """Return a copy of the config for link, which the caller owns."""
+        return copy.deepcopy(self._lookup(link))
+
+    def device_config_matches(self, link, config):
+        """Return whether config is the config for link.
+
+        This is config_for_device(link) == config without the copy."""
+        return self._lookup(link) == config
+
     def load_from_root(self, root):
         for path in configs_in_root(root):
             try:
@@ -95,7 +142,11 @@ class Config:
 
 
 class _PhysicalDevice:
-    def __init__(self, name, config):
+    # The only match key that is kept in the config for a device, see
+    # device_config.
+    allowed_matches = ('macaddress',)
+
+    def __init__(self, name, config, index=0):
         match = config.get('match')
         if match is None:
             self.match_name = name
@@ -105,14 +156,35 @@ class _PhysicalDevice:
             self.match_name = match.get('name')
             self.match_mac = match.get('macaddress')
             self.match_driver = match.get('driver')
+        self.match_name_is_literal = True
+        self._match_name_re = None
+        if self.match_name is not None and \
+           any(c in self.match_name for c in '*?['):
+            self.match_name_is_literal = False
+            self._match_name_re = re.compile(
+                fnmatch.translate(self.match_name))
+        self.index = index
         self.config = config
+        # The config to give the device that matches, with match keys
+        # that only matter for finding the device removed.
+        self.device_config = config
+        if match is not None:
+            allowed = {
+                k: v for k, v in match.items() if k in self.allowed_matches}
+            self.device_config = dict(config)
+            if allowed:
+                self.device_config['match'] = allowed
+            else:
+                del self.device_config['match']
         log.debug(
             "config for %s = %s" % (
                 name, sanitize_interface_config(self.config)))
 
     def matches_link(self, link):
-        if self.match_name is not None:
-            matches_name = fnmatch.fnmatch(link.name, self.match_name)
+        if self._match_name_re is not None:
+            matches_name = self._match_name_re.match(link.name) is not None
+        elif self.match_name is not None:
+            matches_name = link.name == self.match_name
         else:
             matches_name = True
         if self.match_mac is not None:
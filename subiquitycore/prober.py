@@ -13,17 +13,64 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import glob
+import hashlib
+import json
 import logging
+import os
 import time
 import yaml
 
+import pyudev
+
 from probert.network import (
     StoredDataObserver,
     UdevObserver,
     )
 
+from subiquitycore.log import deferred
+
 log = logging.getLogger('subiquitycore.prober')
 
+# Files under /sys/class/block/$dev that identify a block device and its
+# size or place on its parent.
+_FINGERPRINT_ATTRS = (
+    'dev',
+    'size',
+    'ro',
+    'partition',
+    'start',
+    'device/serial',
+    'device/wwid',
+    'wwid',
+    'dm/uuid',
+    'md/uuid',
+    )
+
+# Ram disks and loop devices are not probed, so changes to them (e.g. a
+# snap being mounted) do not change the fingerprint.
+_FINGERPRINT_SKIP = ('loop', 'ram')
+
+
+class _DevicesContext:
+    """A pyudev.Context that only lists the named block devices.
+
+    probert's blockdev and filesystem probes enumerate devices from the
+    context they are given, so this makes them probe just those devices.
+    """
+
+    def __init__(self, devnames):
+        self._context = pyudev.Context()
+        self._devnames = set(devnames)
+
+    def list_devices(self, **kw):
+        for device in self._context.list_devices(**kw):
+            if device.get('DEVNAME') in self._devnames:
+                yield device
+
+    def __getattr__(self, name):
+        return getattr(self._context, name)
+
 
 class Prober():
     def __init__(self, machine_config, debug_flags):
@@ -31,7 +78,8 @@ class Prober():
         if machine_config:
             self.saved_config = yaml.safe_load(machine_config)
         self.debug_flags = debug_flags
-        log.debug('Prober() init finished, data:{}'.format(self.saved_config))
+        log.debug(
+            'Prober() init finished, data:%s', deferred(self.saved_config))
 
     def probe_network(self, receiver):
         if self.saved_config is not None:
@@ -57,3 +105,63 @@ class Prober():
             return r
         from probert.storage import Storage
         return Storage().probe(probe_types=probe_types)
+
+    def get_storage_for_devices(self, devnames, probe_types):
+        """Probe only the named block devices.
+
+        Only probe types that report data per block device ('blockdev' and
+        'filesystem', which 'filesystem_sizing' adds sizes to) can be used.
+        """
+        probe_types = set(probe_types)
+        per_device = {'blockdev', 'filesystem', 'filesystem_sizing'}
+        if not probe_types <= per_device:
+            raise ValueError(
+                "cannot probe {} per device".format(
+                    probe_types - per_device))
+        if self.saved_config is not None:
+            storage = self.saved_config['storage']
+            return {
+                ptype: {
+                    devname: data
+                    for devname, data in storage.get(ptype, {}).items()
+                    if devname in devnames
+                    }
+                for ptype in probe_types - {'filesystem_sizing'}
+                }
+        from probert.storage import Storage
+        storage = Storage(results={})
+        storage.context = _DevicesContext(devnames)
+        return storage.probe(probe_types=probe_types)
+
+    def storage_fingerprint(self):
+        """Return a digest that changes when the block devices change.
+
+        This is cheap to compute compared to probing storage, so it can be
+        used to tell whether storage probe data from earlier is still
+        likely to be valid. It covers the devices, their sizes, serials and
+        partition layout and the UUIDs and labels udev found on them, but
+        not what is inside filesystems.
+        """
+        h = hashlib.sha256()
+        if self.saved_config is not None:
+            h.update(json.dumps(
+                self.saved_config['storage'], sort_keys=True).encode())
+            return h.hexdigest()
+        for path in sorted(glob.glob('/sys/class/block/*')):
+            name = os.path.basename(path)
+            if name.startswith(_FINGERPRINT_SKIP):
+                continue
+            h.update(name.encode() + b'\0')
+            for attr in _FINGERPRINT_ATTRS:
+                try:
+                    with open(os.path.join(path, attr), 'rb') as fp:
+                        value = fp.read()
+                except OSError:
+                    continue
+                h.update(attr.encode() + b'=' + value + b'\0')
+        for path in sorted(glob.glob('/dev/disk/by-*/*')):
+            target = os.path.basename(os.path.realpath(path))
+            if target.startswith(_FINGERPRINT_SKIP):
+                continue
+            h.update(path.encode() + b'->' + target.encode() + b'\0')
+        return h.hexdigest()
@@ -19,6 +19,7 @@ import glob
 import json
 import logging
 import os
+import threading
 import time
 from urllib.parse import (
     quote_plus,
@@ -40,20 +41,40 @@ class SnapdConnection:
     def __init__(self, root, sock):
         self.root = root
         self.url_base = "http+unix://{}/".format(quote_plus(sock))
+        self._local = threading.local()
+        self._sessions = []
+        self._sessions_lock = threading.Lock()
+
+    def session(self):
+        # Sessions are kept so that connections to snapd are kept alive
+        # and reused rather than set up again for each request. A requests
+        # session is not safe to share between threads though, so each
+        # thread calling get and post gets its own.
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests_unixsocket.Session()
+            with self._sessions_lock:
+                self._sessions.append(session)
+        return session
+
+    def close(self):
+        with self._sessions_lock:
+            sessions, self._sessions = self._sessions, []
+            self._local = threading.local()
+        for session in sessions:
+            session.close()
 
     def get(self, path, **args):
         if args:
             path += '?' + urlencode(args)
-        with requests_unixsocket.Session() as session:
-            return session.get(self.url_base + path, timeout=60)
+        return self.session().get(self.url_base + path, timeout=60)
 
     def post(self, path, body, **args):
         if args:
             path += '?' + urlencode(args)
-        with requests_unixsocket.Session() as session:
-            return session.post(
-                self.url_base + path, data=json.dumps(body),
-                timeout=60)
+        return self.session().post(
+            self.url_base + path, data=json.dumps(body),
+            timeout=60)
 
     def configure_proxy(self, proxy):
         log.debug("restarting snapd to pick up proxy config")
@@ -71,6 +92,8 @@ class SnapdConnection:
             cmds = [['sleep', '2']]
         for cmd in cmds:
             run_command(cmd)
+        # The restart closed any connections we had open.
+        self.close()
 
 
 class _FakeFileResponse:
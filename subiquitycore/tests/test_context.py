@@ -0,0 +1,39 @@
+# Copyright 2023 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import mock
+
+from subiquitycore.context import Context
+from subiquitycore.tests import SubiTestCase
+
+
+class TestContext(SubiTestCase):
+
+    def test_full_name(self):
+        app = mock.Mock()
+        app.project = 'subiquity'
+        root = Context.new(app)
+        child = root.child('child')
+        grandchild = child.child('grandchild')
+        self.assertEqual(root.full_name(), 'subiquity')
+        self.assertEqual(grandchild.full_name(), 'subiquity/child/grandchild')
+        self.assertEqual(child.full_name(), 'subiquity/child')
+
+    def test_full_name_cached(self):
+        app = mock.Mock()
+        app.project = 'subiquity'
+        child = Context.new(app).child('child')
+        name = child.full_name()
+        self.assertIs(child.full_name(), name)
@@ -0,0 +1,100 @@
+# Copyright 2023 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import os
+import threading
+from unittest import mock
+
+from subiquitycore.log import (
+    deferred,
+    rotated_log_files,
+    setup_logger,
+    stop_log_queue,
+    )
+from subiquitycore.tests import SubiTestCase
+
+
+class Payload:
+
+    def __init__(self):
+        self.formatted_in = None
+
+    def __str__(self):
+        self.formatted_in = threading.current_thread()
+        return 'payload'
+
+
+@mock.patch('subiquitycore.log.set_log_perms')
+class TestSetupLogger(SubiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        root = logging.getLogger()
+        handlers = root.handlers[:]
+        level = root.level
+
+        def restore():
+            stop_log_queue()
+            for handler in root.handlers[:]:
+                if handler not in handlers:
+                    root.removeHandler(handler)
+                    handler.close()
+            root.setLevel(level)
+
+        self.addCleanup(restore)
+        self.log = logging.getLogger('subiquitycore.tests.test_log')
+
+    def read(self, path):
+        with open(path) as fp:
+            return fp.read()
+
+    def test_queued(self, set_log_perms):
+        logfiles = setup_logger(self.tmp_dir(), queued=True)
+        payload = Payload()
+        self.log.debug('debug %s', deferred(payload))
+        self.log.info('info %s', 1)
+        try:
+            1/0
+        except ZeroDivisionError:
+            self.log.exception('failed %s', deferred('x'))
+        stop_log_queue()
+        debug = self.read(logfiles['debug'])
+        self.assertIn('debug payload', debug)
+        self.assertIn('info 1', debug)
+        self.assertIn('failed x', debug)
+        self.assertIn('ZeroDivisionError', debug)
+        self.assertNotIn('debug payload', self.read(logfiles['info']))
+        self.assertIsNot(payload.formatted_in, threading.current_thread())
+
+    @mock.patch('subiquitycore.log.os.getuid', return_value=0)
+    def test_rotation(self, getuid, set_log_perms):
+        logfiles = setup_logger(
+            self.tmp_dir(), queued=True, max_bytes=1000, backup_count=2)
+        for i in range(100):
+            self.log.debug('line %s', i)
+        stop_log_queue()
+        debug = logfiles['debug']
+        self.assertEqual(
+            rotated_log_files(debug, 2), [debug + '.1', debug + '.2'])
+        self.assertTrue(os.path.exists(debug + '.1'))
+        self.assertTrue(os.path.exists(debug + '.2'))
+        self.assertFalse(os.path.exists(debug + '.3'))
+        # The files created on rollover get the same permissions as the
+        # first one.
+        set_log_perms.assert_any_call(debug, isdir=False, group_write=False)
+        self.assertGreater(set_log_perms.call_count, 3)
+        self.assertLessEqual(os.path.getsize(debug), 1000)
+        self.assertIn('line 99', self.read(debug))
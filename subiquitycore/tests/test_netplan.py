@@ -1,7 +1,15 @@
 import os
+import types
+
+import yaml
 
 from subiquitycore.tests import SubiTestCase, populate_dir
-from subiquitycore.netplan import configs_in_root
+from subiquitycore.netplan import Config, configs_in_root
+
+
+def link(name, hwaddr=None, driver=None, is_virtual=False):
+    return types.SimpleNamespace(
+        name=name, hwaddr=hwaddr, driver=driver, is_virtual=is_virtual)
 
 
 class TestConfigsInRoot(SubiTestCase):
@@ -38,3 +46,116 @@ class TestConfigsInRoot(SubiTestCase):
         self.assertEqual(
             [os.path.join(my_dir, p) for p in yamls],
             configs_in_root(my_dir))
+
+
+class TestConfig(SubiTestCase):
+
+    def make_config(self, *networks):
+        config = Config()
+        for network in networks:
+            config.parse_netplan_config(
+                yaml.dump({'network': dict(network, version=2)}))
+        return config
+
+    def test_physical(self):
+        config = self.make_config({
+            'ethernets': {
+                'eth0': {'dhcp4': True},
+                'bymac': {
+                    'match': {'macaddress': '00:11', 'name': 'en*'},
+                    'dhcp6': True,
+                    },
+                'byglob': {
+                    'match': {'name': 'en*', 'driver': 'e1000'},
+                    'addresses': ['10.0.0.1/24'],
+                    },
+                },
+            'wifis': {
+                'wlan0': {'access-points': {}},
+                },
+            })
+        self.assertEqual(
+            config.config_for_device(link('eth0')), {'dhcp4': True})
+        self.assertEqual(
+            config.config_for_device(link('enp1s0', hwaddr='00:11')),
+            {'match': {'macaddress': '00:11'}, 'dhcp6': True})
+        self.assertEqual(
+            config.config_for_device(link('eth1', hwaddr='00:11')), {})
+        self.assertEqual(
+            config.config_for_device(link('enp2s0', driver='e1000')),
+            {'addresses': ['10.0.0.1/24']})
+        self.assertEqual(
+            config.config_for_device(link('enp2s0', driver='virtio')), {})
+        self.assertEqual(
+            config.config_for_device(link('wlan0')), {'access-points': {}})
+
+    def test_first_match_wins(self):
+        config = self.make_config(
+            {'ethernets': {'all': {'match': {'name': '*'}, 'dhcp4': True}}},
+            {'ethernets': {'eth0': {'dhcp6': True}}},
+            )
+        self.assertEqual(
+            config.config_for_device(link('eth0')), {'dhcp4': True})
+
+    def test_parse_after_lookup(self):
+        config = self.make_config({'ethernets': {'eth1': {'dhcp4': True}}})
+        self.assertEqual(config.config_for_device(link('eth0')), {})
+        config.parse_netplan_config(yaml.dump(
+            {'network': {'version': 2, 'ethernets': {'eth0': {'mtu': 9}}}}))
+        self.assertEqual(config.config_for_device(link('eth0')), {'mtu': 9})
+
+    def test_virtual(self):
+        config = self.make_config({
+            'bonds': {'bond0': {'interfaces': ['eth0']}},
+            'vlans': {'eth0.10': {'id': 10, 'link': 'eth0'}},
+            })
+        self.assertEqual(
+            config.config_for_device(link('eth0.10', is_virtual=True)),
+            {'id': 10, 'link': 'eth0'})
+        self.assertEqual(
+            config.config_for_device(link('bond0', is_virtual=True)),
+            {'interfaces': ['eth0']})
+        # Only physical configs match physical devices.
+        self.assertEqual(config.config_for_device(link('bond0')), {})
+
+    def test_config_for_device_copies(self):
+        config = self.make_config({
+            'ethernets': {
+                'eth0': {
+                    'match': {'macaddress': '00:11'},
+                    'addresses': ['10.0.0.1/24'],
+                    },
+                },
+            })
+        eth0 = link('eth0', hwaddr='00:11')
+        dev_config = config.config_for_device(eth0)
+        self.assertTrue(config.device_config_matches(eth0, dev_config))
+        dev_config['addresses'].append('10.0.0.2/24')
+        dev_config['match']['name'] = 'eth0'
+        self.assertFalse(config.device_config_matches(eth0, dev_config))
+        self.assertEqual(
+            config.config_for_device(eth0),
+            {'match': {'macaddress': '00:11'},
+             'addresses': ['10.0.0.1/24']})
+        self.assertFalse(config.device_config_matches(eth0, None))
+
+    def test_many_devices(self):
+        ethernets = {}
+        for i in range(200):
+            if i % 3 == 0:
+                ethernets['eth{}'.format(i)] = {'mtu': i}
+            elif i % 3 == 1:
+                ethernets['mac{}'.format(i)] = {
+                    'match': {'macaddress': 'mac-{}'.format(i)}, 'mtu': i}
+            else:
+                ethernets['glob{}'.format(i)] = {
+                    'match': {'name': 'en{}s*'.format(i)}, 'mtu': i}
+        config = self.make_config({'ethernets': ethernets})
+        for i in range(200):
+            lnk = link(
+                ['eth{}', 'eth-other', 'en{}s0'][i % 3].format(i),
+                hwaddr='mac-{}'.format(i))
+            self.assertEqual(
+                config.config_for_device(lnk).get('mtu'), i)
+        self.assertEqual(
+            config.config_for_device(link('eth1', hwaddr='mac-0')), {})
@@ -25,3 +25,32 @@ class TestProber(SubiTestCase):
         none_storage = prober.get_storage(probe_types=None)
         defaults_storage = prober.get_storage(probe_types={'defaults'})
         self.assertEqual(defaults_storage, none_storage)
+
+    def test_storage_for_devices(self):
+        with open('examples/simple.json', 'r') as fp:
+            prober = Prober(machine_config=fp, debug_flags=())
+        storage = prober.get_storage(probe_types=None)
+        devname = next(iter(storage['blockdev']))
+        partial = prober.get_storage_for_devices(
+            {devname}, {'blockdev', 'filesystem', 'filesystem_sizing'})
+        self.assertEqual(partial['blockdev'], {
+            devname: storage['blockdev'][devname],
+            })
+        self.assertEqual(partial.keys(), {'blockdev', 'filesystem'})
+
+    def test_storage_for_devices_bad_type(self):
+        with open('examples/simple.json', 'r') as fp:
+            prober = Prober(machine_config=fp, debug_flags=())
+        with self.assertRaises(ValueError):
+            prober.get_storage_for_devices({'/dev/sda'}, {'raid'})
+
+    def test_storage_fingerprint(self):
+        with open('examples/simple.json', 'r') as fp:
+            prober1 = Prober(machine_config=fp, debug_flags=())
+        with open('examples/simple.json', 'r') as fp:
+            prober2 = Prober(machine_config=fp, debug_flags=())
+        self.assertEqual(
+            prober1.storage_fingerprint(), prober2.storage_fingerprint())
+        prober2.saved_config['storage']['blockdev'].popitem()
+        self.assertNotEqual(
+            prober1.storage_fingerprint(), prober2.storage_fingerprint())
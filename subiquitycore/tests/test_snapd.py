@@ -0,0 +1,65 @@
+# Copyright 2023 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+from unittest import mock
+
+from subiquitycore.snapd import SnapdConnection
+from subiquitycore.tests import SubiTestCase
+
+
+@mock.patch('subiquitycore.snapd.requests_unixsocket.Session')
+class TestSnapdConnection(SubiTestCase):
+
+    def test_session_reused(self, Session):
+        conn = SnapdConnection('/', '/run/snapd.socket')
+        conn.get('v2/find', name='hello')
+        conn.post('v2/snaps/hello', {'action': 'install'})
+        Session.assert_called_once_with()
+        session = Session.return_value
+        session.get.assert_called_once_with(
+            'http+unix://%2Frun%2Fsnapd.socket/v2/find?name=hello',
+            timeout=60)
+        session.post.assert_called_once_with(
+            'http+unix://%2Frun%2Fsnapd.socket/v2/snaps/hello',
+            data='{"action": "install"}', timeout=60)
+
+    def test_close(self, Session):
+        conn = SnapdConnection('/', '/run/snapd.socket')
+        conn.get('v2/system-info')
+        conn.close()
+        Session.return_value.close.assert_called_once_with()
+        conn.get('v2/system-info')
+        self.assertEqual(Session.call_count, 2)
+
+    def test_session_per_thread(self, Session):
+        Session.side_effect = lambda: mock.Mock()
+        conn = SnapdConnection('/', '/run/snapd.socket')
+        sessions = []
+
+        def get():
+            sessions.append(conn.session())
+            sessions.append(conn.session())
+
+        t = threading.Thread(target=get)
+        t.start()
+        t.join()
+        get()
+        self.assertIs(sessions[0], sessions[1])
+        self.assertIs(sessions[2], sessions[3])
+        self.assertIsNot(sessions[0], sessions[2])
+        conn.close()
+        sessions[0].close.assert_called_once_with()
+        sessions[2].close.assert_called_once_with()
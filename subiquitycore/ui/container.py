@@ -58,9 +58,16 @@ called when the widget gains or loses focus.
 
 All ListBoxes in subiquity gain a scrollbar when their contents don't
 entirely fit on screen. The implementation assumes that there are not
-too many elements in the ListBox.
+too many elements in the ListBox, unless its body can report its row
+counts itself, as BoundedTextWalker does.
+
+ 4. BoundedTextWalker
+
+A list walker for an ever growing log of text: it only keeps the most
+recent lines and only creates widgets for the lines that are displayed.
 """
 
+import itertools
 import logging
 import operator
 
@@ -295,29 +302,40 @@ class TabCyclingListBox(urwid.ListBox):
         # I don't really understand why this is required but it seems it is.
         self._invalidate()
 
+    def _selectables(self, reverse=False):
+        # Iterate over positions rather than indexing the body like a
+        # list, as a body such as BoundedTextWalker does not start its
+        # positions at 0.
+        if not getattr(self.body, 'has_selectable', True):
+            return
+        for i in self.body.positions(reverse):
+            w = self.body[i]
+            if w.selectable():
+                yield i, w
+
     def _select_first_selectable(self):
         """Select first selectable child (possibily recursively)."""
-        for i, w in enumerate(self.body):
-            if w.selectable():
-                self._set_focus_no_move(i)
-                _maybe_call(w, "_select_first_selectable")
-                return
+        for i, w in self._selectables():
+            self._set_focus_no_move(i)
+            _maybe_call(w, "_select_first_selectable")
+            return
 
     def _select_last_selectable(self):
         """Select last selectable child (possibily recursively)."""
-        for i, w in reversed(list(enumerate(self.body))):
-            if w.selectable():
-                self._set_focus_no_move(i)
-                _maybe_call(w, "_select_last_selectable")
-                return
+        for i, w in self._selectables(reverse=True):
+            self._set_focus_no_move(i)
+            _maybe_call(w, "_select_last_selectable")
+            return
 
     def keypress(self, size, key):
         downkey = key
         if not key.endswith(' no wrap') and (self._command_map[key] in
                                              ('next selectable',
                                               'prev selectable')):
-            if _has_other_selectable(self.body, self.focus_position):
-                downkey += ' no wrap'
+            for i, w in self._selectables():
+                if i != self.focus_position:
+                    downkey += ' no wrap'
+                    break
         upkey = super().keypress(size, downkey)
         if upkey != downkey:
             key = upkey
@@ -326,9 +344,8 @@ class TabCyclingListBox(urwid.ListBox):
             return key
 
         if self._command_map[key] == 'next selectable':
-            next_fp = self.focus_position + 1
-            for i, w in enumerate(self.body[next_fp:], next_fp):
-                if w.selectable():
+            for i, w in self._selectables():
+                if i > self.focus_position:
                     self.set_focus(i)
                     _maybe_call(w, "_select_first_selectable")
                     return None
@@ -336,9 +353,8 @@ class TabCyclingListBox(urwid.ListBox):
                 self._select_first_selectable()
             return key
         elif self._command_map[key] == 'prev selectable':
-            positions = self.body[:self.focus_position]
-            for i, w in reversed(list(enumerate(positions))):
-                if w.selectable():
+            for i, w in self._selectables(reverse=True):
+                if i < self.focus_position:
                     self.set_focus(i)
                     _maybe_call(w, "_select_last_selectable")
                     return None
@@ -459,18 +475,22 @@ class ScrollBarListBox(urwid.WidgetDecoration):
             offset, inset = lb.get_focus_offset_inset((maxcol - 1, maxrow))
             visible = lb.ends_visible((maxcol - 1, maxrow), focus)
 
-            seen_focus = False
-            height = height_before_focus = 0
-            focus_widget, focus_pos = lb.body.get_focus()
-            # Scan through the rows calculating total height and the
-            # height of the rows before the focus widget.
-            for widget in lb.body:
-                rows = widget.rows((maxcol - 1,))
-                if widget is focus_widget:
-                    seen_focus = True
-                elif not seen_focus:
-                    height_before_focus += rows
-                height += rows
+            row_counts = getattr(lb.body, 'row_counts', None)
+            if row_counts is not None:
+                height_before_focus, height = row_counts(maxcol - 1)
+            else:
+                seen_focus = False
+                height = height_before_focus = 0
+                focus_widget, focus_pos = lb.body.get_focus()
+                # Scan through the rows calculating total height and the
+                # height of the rows before the focus widget.
+                for widget in lb.body:
+                    rows = widget.rows((maxcol - 1,))
+                    if widget is focus_widget:
+                        seen_focus = True
+                    elif not seen_focus:
+                        height_before_focus += rows
+                    height += rows
 
             # Calculate the number of rows off the top and bottom of
             # the listbox.
@@ -520,6 +540,153 @@ class ScrollBarListBox(urwid.WidgetDecoration):
             ])
 
 
+class BoundedTextWalker(urwid.ListWalker):
+    """A list walker over lines of text that keeps about the last maxlen.
+
+    Positions are counted from the first line ever appended, so they stay
+    valid as old lines are dropped. Lines are dropped a batch at a time,
+    so up to a quarter more than maxlen lines can be kept. Text widgets
+    are only created for the lines that are asked for (in practice, the
+    ones on screen) and only a few are kept. The number of rows each line
+    takes up, and the totals before the focus and overall, are cached for
+    row_counts().
+    """
+
+    widget_cache_size = 256
+    # Every line is a Text, so TabCyclingListBox need not look at them all
+    # to find a selectable one.
+    has_selectable = False
+
+    def __init__(self, maxlen):
+        self.maxlen = maxlen
+        self._lines = []
+        self._first = 0
+        self.focus = None
+        self._widgets = {}
+        self._heights = None
+        self._heights_maxcol = None
+        self._total_rows = 0
+        # The rows taken up by the lines before the focus, kept up to date
+        # along with _total_rows once _heights has been computed.
+        self._before_rows = 0
+        self._focus_changed = None
+
+    def __len__(self):
+        return len(self._lines)
+
+    @property
+    def last_position(self):
+        if not self._lines:
+            return None
+        return self._first + len(self._lines) - 1
+
+    def _rows(self, line, maxcol):
+        return urwid.Text(line).rows((maxcol,))
+
+    def append(self, line):
+        self._lines.append(line)
+        if self._heights is not None:
+            rows = self._rows(line, self._heights_maxcol)
+            self._heights.append(rows)
+            self._total_rows += rows
+        excess = len(self._lines) - self.maxlen
+        if excess > self.maxlen // 4:
+            if self.focus is not None and self.focus < self._first + excess:
+                self._move_focus(self._first + excess)
+            del self._lines[:excess]
+            if self._heights is not None:
+                # All the dropped lines were before the focus.
+                dropped = sum(self._heights[:excess])
+                self._total_rows -= dropped
+                self._before_rows -= dropped
+                del self._heights[:excess]
+            self._first += excess
+            for pos in [p for p in self._widgets if p < self._first]:
+                del self._widgets[pos]
+        if self.focus is None:
+            self._move_focus(self._first)
+        self._modified()
+
+    def _check(self, position):
+        if position is None or \
+           not self._first <= position < self._first + len(self._lines):
+            raise IndexError(position)
+
+    def __getitem__(self, position):
+        self._check(position)
+        widget = self._widgets.get(position)
+        if widget is None:
+            if len(self._widgets) >= self.widget_cache_size:
+                del self._widgets[next(iter(self._widgets))]
+            widget = urwid.Text(self._lines[position - self._first])
+            self._widgets[position] = widget
+        return widget
+
+    def set_focus_changed_callback(self, callback):
+        self._focus_changed = callback
+
+    def get_focus(self):
+        if self.focus is None:
+            return None, None
+        return self[self.focus], self.focus
+
+    def _move_focus(self, position):
+        if self._heights is not None:
+            if self.focus is None:
+                old = 0
+                self._before_rows = 0
+            else:
+                old = self.focus - self._first
+            new = position - self._first
+            if new > old:
+                self._before_rows += sum(
+                    itertools.islice(self._heights, old, new))
+            else:
+                self._before_rows -= sum(
+                    itertools.islice(self._heights, new, old))
+        self.focus = position
+
+    def set_focus(self, position):
+        self._check(position)
+        if self._focus_changed is not None:
+            self._focus_changed(position)
+        self._move_focus(position)
+        self._modified()
+
+    def _get(self, position):
+        try:
+            return self[position], position
+        except IndexError:
+            return None, None
+
+    def get_next(self, position):
+        return self._get(position + 1)
+
+    def get_prev(self, position):
+        return self._get(position - 1)
+
+    def positions(self, reverse=False):
+        r = range(self._first, self._first + len(self._lines))
+        if reverse:
+            return reversed(r)
+        return r
+
+    def row_counts(self, maxcol):
+        """Return the number of rows before the focus and in total, when
+        the lines are rendered maxcol columns wide."""
+        if self._heights_maxcol != maxcol:
+            self._heights = [self._rows(line, maxcol) for line in self._lines]
+            self._heights_maxcol = maxcol
+            self._total_rows = sum(self._heights)
+            self._before_rows = 0
+            if self.focus is not None:
+                self._before_rows = sum(
+                    itertools.islice(self._heights, self.focus - self._first))
+        if self.focus is None:
+            return 0, 0
+        return self._before_rows, self._total_rows
+
+
 def ListBox(body=None, *, always_scroll=False):
     # urwid.ListBox converts an arbitrary sequence argument to a
     # PollingListWalker, which doesn't work with our code.
@@ -0,0 +1,107 @@
+# Copyright 2023 Canonical, Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+
+from subiquitycore.ui.container import BoundedTextWalker, ListBox
+
+
+class TestBoundedTextWalker(TestCase):
+
+    def test_empty(self):
+        walker = BoundedTextWalker(10)
+        self.assertEqual(walker.get_focus(), (None, None))
+        self.assertIsNone(walker.last_position)
+        self.assertEqual(walker.row_counts(20), (0, 0))
+
+    def test_bounded(self):
+        walker = BoundedTextWalker(8)
+        for i in range(100):
+            walker.append(str(i))
+            self.assertLessEqual(len(walker), 10)
+        self.assertEqual(walker.last_position, 99)
+        positions = list(walker.positions())
+        self.assertEqual(positions[-1], 99)
+        self.assertEqual(
+            [walker[p].text for p in positions],
+            [str(p) for p in positions])
+        self.assertEqual(
+            list(walker.positions(reverse=True)), positions[::-1])
+        with self.assertRaises(IndexError):
+            walker[positions[0] - 1]
+        self.assertEqual(walker.get_prev(positions[0]), (None, None))
+        self.assertEqual(walker.get_next(99), (None, None))
+        w, pos = walker.get_next(positions[0])
+        self.assertEqual((w.text, pos), (str(positions[1]), positions[1]))
+
+    def test_focus_moves_with_evicted_lines(self):
+        walker = BoundedTextWalker(4)
+        for i in range(5):
+            walker.append(str(i))
+        self.assertEqual(walker.focus, 0)
+        walker.append('5')
+        self.assertEqual(list(walker.positions()), [2, 3, 4, 5])
+        self.assertEqual(walker.focus, 2)
+        walker.set_focus(5)
+        self.assertEqual(walker.get_focus()[0].text, '5')
+
+    def test_row_counts(self):
+        walker = BoundedTextWalker(4)
+        walker.append('a')
+        walker.append('b' * 25)
+        self.assertEqual(walker.row_counts(10), (0, 4))
+        walker.append('c')
+        walker.set_focus(2)
+        self.assertEqual(walker.row_counts(10), (4, 5))
+        self.assertEqual(walker.row_counts(30), (2, 3))
+        for i in range(3):
+            walker.append('d' * 15)
+        # The first two lines have been dropped.
+        self.assertEqual(walker.focus, 2)
+        self.assertEqual(walker.row_counts(30), (0, 4))
+        self.assertEqual(walker.row_counts(10), (0, 7))
+
+    def test_row_counts_kept_up_to_date(self):
+        walker = BoundedTextWalker(8)
+        walker.row_counts(10)
+        for i in range(40):
+            walker.append('x' * i)
+            if i % 3 == 0:
+                walker.set_focus(walker.last_position)
+            elif i % 5 == 0:
+                walker.set_focus(next(iter(walker.positions())))
+            positions = list(walker.positions())
+            rows = [walker[p].rows((10,)) for p in positions]
+            before = sum(rows[:positions.index(walker.focus)])
+            self.assertEqual(walker.row_counts(10), (before, sum(rows)))
+
+
+class TestScrollBarListBox(TestCase):
+
+    def test_render_bounded_walker(self):
+        walker = BoundedTextWalker(100)
+        lb = ListBox(walker)
+        for i in range(200):
+            walker.append(str(i))
+        lb.base_widget.set_focus(walker.last_position)
+        lb.base_widget.set_focus_valign('bottom')
+        canvas = lb.render((10, 5), focus=True)
+        lines = [line.decode() for line in canvas.text]
+        self.assertEqual(
+            [line[:-1].rstrip() for line in lines],
+            ['195', '196', '197', '198', '199'])
+        # The scrollbar is drawn in the last column, at the bottom.
+        self.assertEqual(
+            ''.join(line[-1] for line in lines), '\u25b4  \u2588\u25be')
@@ -19,7 +19,12 @@ import logging
 import os
 import sys
 
-from subiquitycore.log import setup_logger
+from subiquitycore.log import (
+    LOG_BACKUP_COUNT,
+    LOG_MAX_BYTES,
+    rotated_log_files,
+    setup_logger,
+    )
 
 from subiquity.cmd.common import (
     LOGDIR,
@@ -83,7 +88,9 @@ def main():
     handler.setFormatter(
         logging.Formatter("%(asctime)s %(name)s:%(lineno)d %(message)s"))
 
-    logfiles = setup_logger(dir=logdir, base='systemsetup-server')
+    logfiles = setup_logger(
+        dir=logdir, base='systemsetup-server', queued=True,
+        max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT)
 
     logger = logging.getLogger('systemsetup-server')
     version = "unknown"
@@ -103,6 +110,8 @@ def main():
             "InstallerServerLog", logfiles['debug'])
         server.note_file_for_apport(
             "InstallerServerLogInfo", logfiles['info'])
+        for i, path in enumerate(rotated_log_files(logfiles['debug']), 1):
+            server.note_file_for_apport(f"InstallerServerLog{i}", path)
         await server.run()
 
     asyncio.run(run_with_loop())